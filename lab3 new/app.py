@@ -1,39 +1,67 @@
 from flask import Flask, jsonify
+import config
+from metrics import install_metrics, install_profiling
+from models.database.hospital_db import sql_tracer
 from routes import auth_bp, profile_bp, patient_bp, prescription_bp
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key'  # TODO: Move to config
-
-# Register blueprints
-app.register_blueprint(auth_bp, url_prefix='/auth')
-app.register_blueprint(profile_bp, url_prefix='/profile')
-app.register_blueprint(patient_bp, url_prefix='/patient')
-app.register_blueprint(prescription_bp, url_prefix='/prescription')
-
-@app.route('/')
 def index():
     return jsonify({
         'message': 'Hospital Management System API',
         'endpoints': {
             'auth': {
                 'register': '/auth/register',
-                'login': '/auth/login'
+                'login': '/auth/login',
+                'import': '/auth/import',
+                'stats': '/auth/stats'
             },
             'profile': {
                 'get_profile': '/profile/profile',
-                'get_all_users': '/profile/users'
+                'get_all_users': '/profile/users',
+                'stats': '/profile/stats'
             },
             'patient': {
+                'get_patient': '/patient/patients/<id>',
                 'update_diagnosis': '/patient/patients/<id>/diagnosis',
-                'discharge': '/patient/patients/<id>/discharge'
+                'discharge': '/patient/patients/<id>/discharge',
+                'census': '/patient/census'
             },
             'prescription': {
                 'create': '/prescription/prescriptions',
+                'create_batch': '/prescription/prescriptions/batch',
                 'complete': '/prescription/prescriptions/<id>/complete',
-                'get_patient_prescriptions': '/prescription/patients/<id>/prescriptions'
+                'get_patient_prescriptions': '/prescription/patients/<id>/prescriptions',
+                'patient_workload': '/prescription/patients/<id>/workload',
+                'doctor_workload': '/prescription/doctors/<id>/workload'
             }
-        }
+        },
+        'metrics': '/metrics'
     })
 
+def create_app():
+    """Build the app. Nothing here touches the database, which is opened
+    on first use."""
+    app = Flask(__name__)
+    app.secret_key = 'your-secret-key'  # TODO: Move to config
+
+    # Register blueprints
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(profile_bp, url_prefix='/profile')
+    app.register_blueprint(patient_bp, url_prefix='/patient')
+    app.register_blueprint(prescription_bp, url_prefix='/prescription')
+
+    # Prometheus metrics at /metrics
+    if config.METRICS_ENABLED:
+        install_metrics(app, sql_tracer=sql_tracer, n_plus_one=config.METRICS_N_PLUS_ONE_STATEMENTS)
+
+    # Profiles of signed or sampled requests, and logs of slow ones
+    install_profiling(app, secret=config.PROFILE_SECRET, sample_rate=config.PROFILE_SAMPLE_RATE,
+                      directory=config.PROFILE_DIR, keep=config.PROFILE_KEEP,
+                      slow_ms=config.SLOW_REQUEST_MS)
+
+    app.add_url_rule('/', view_func=index)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=config.DEBUG, port=int(config.PORT or 5000))
\ No newline at end of file
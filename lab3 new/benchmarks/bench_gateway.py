@@ -0,0 +1,165 @@
+"""Threaded (Flask) gateway vs asyncio gateway against local stub services.
+
+    python benchmarks/bench_gateway.py --requests 5000 --concurrency 500 --delay 0.05
+
+Stub upstreams answer every route after ``--delay`` seconds, standing in
+for a slow service. Both gateways are started as subprocesses pointed at
+the stubs, then driven by the same asyncio client.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ['auth', 'profile', 'patient', 'prescription']
+
+THREADED_GATEWAY = '''
+import sys
+sys.path.insert(0, {root!r})
+sys.path.insert(0, {root!r} + '/microservices')
+from werkzeug.serving import make_server
+from gateway import app
+make_server('127.0.0.1', {port}, app, threaded=True).serve_forever()
+'''
+
+
+async def run_stubs(base_port, delay, body_size):
+    body = json.dumps([{'id': i, 'name': 'x' * 32} for i in range(body_size)]).encode()
+
+    async def handler(request):
+        await asyncio.sleep(delay)
+        return web.Response(body=body, content_type='application/json')
+
+    runners = []
+    for offset in range(len(SERVICES)):
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', base_port + offset, backlog=4096).start()
+        runners.append(runner)
+    return runners
+
+
+async def wait_ready(url, timeout=20):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+
+async def drive(url, total, concurrency):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(f'{url}/{SERVICES[i % len(SERVICES)]}/bench/{i}')
+
+    async def worker(session):
+        nonlocal errors
+        while True:
+            try:
+                target = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                async with session.get(target) as response:
+                    await response.read()
+                    if response.status >= 500:
+                        errors += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pick = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000
+    return {
+        'requests': total,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(pick(0.50), 2),
+        'p95_ms': round(pick(0.95), 2),
+        'p99_ms': round(pick(0.99), 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2)
+    }
+
+
+async def bench(args):
+    runners = await run_stubs(args.stub_port, args.delay, args.body_rows)
+    env = dict(os.environ)
+    for offset, name in enumerate(SERVICES):
+        env[f'{name.upper()}_SERVICE_URL'] = f'http://127.0.0.1:{args.stub_port + offset}'
+    env['GATEWAY_POOL_SIZE'] = str(args.concurrency)
+
+    gateways = {
+        'threaded': [sys.executable, '-c', THREADED_GATEWAY.format(root=ROOT, port=args.port)],
+        'asyncio': [sys.executable, os.path.join(ROOT, 'microservices', 'async_gateway.py'),
+                    '--port', str(args.port)]
+    }
+    results = {}
+    try:
+        for name, command in gateways.items():
+            process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL)
+            try:
+                await wait_ready(f'http://127.0.0.1:{args.port}/')
+                await drive(f'http://127.0.0.1:{args.port}', min(200, args.requests), 20)
+                results[name] = await drive(f'http://127.0.0.1:{args.port}', args.requests,
+                                            args.concurrency)
+            finally:
+                process.terminate()
+                process.wait()
+            print(name, results[name], file=sys.stderr)
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--delay', type=float, default=0.05, help='stub latency in seconds')
+    parser.add_argument('--body-rows', type=int, default=50)
+    parser.add_argument('--port', type=int, default=5600)
+    parser.add_argument('--stub-port', type=int, default=5601)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = asyncio.run(bench(args))
+    print(f'{"gateway":<10} {"rps":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"errors":>7}')
+    for name, result in results.items():
+        print(f'{name:<10} {result["rps"]:>9} {result["p50_ms"]:>9} {result["p95_ms"]:>9} '
+              f'{result["p99_ms"]:>9} {result["errors"]:>7}')
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'args': vars(args), 'results': results}, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
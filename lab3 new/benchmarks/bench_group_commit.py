@@ -0,0 +1,126 @@
+"""Compare per-call commits with the group-commit write queue.
+
+    python benchmarks/bench_group_commit.py --threads 16 --writes 200
+
+Each run starts from a fresh scratch database (``--db``) and has every
+thread issue a mix of add_prescription, complete_prescription and
+update_diagnosis calls. Writes are durable per call with
+``--synchronous FULL``, which is where batching several commits into one
+fsync pays off most.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database.hospital_db import HospitalDatabase
+from models.enums.user_enums import UserRole, PrescriptionType
+
+
+def remove_db(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def seed(database, patients):
+    records = [{'username': 'bench_doctor', 'password': 'x', 'role': UserRole.DOCTOR,
+                'name': 'Bench Doctor', 'specialization': 'general'}]
+    database.users.add_users_bulk(records)
+    doctor_id = database.users.get_doctor_by_user_id(1)['id']
+    records = [{'username': f'bench_patient_{i}', 'password': 'x', 'role': UserRole.PATIENT,
+                'name': f'Patient {i}', 'doctor_id': doctor_id} for i in range(patients)]
+    database.users.add_users_bulk(records)
+    with database.db.connection() as conn:
+        patient_ids = [row['id'] for row in conn.execute('SELECT id FROM patients')]
+        user_ids = [row['user_id'] for row in conn.execute('SELECT user_id FROM patients')]
+    return doctor_id, patient_ids, user_ids
+
+
+def worker(database, doctor_id, patient_ids, user_ids, writes, seed_value, latencies, errors):
+    rng = random.Random(seed_value)
+    created = []
+    for _ in range(writes):
+        roll = rng.random()
+        started = time.perf_counter()
+        try:
+            if roll < 0.5 or not created:
+                prescription = database.prescriptions.add_prescription(
+                    rng.choice(patient_ids), doctor_id, rng.choice(list(PrescriptionType)), 'bench'
+                )
+                if prescription is None:
+                    raise RuntimeError('add_prescription failed')
+                created.append(prescription['id'])
+            elif roll < 0.8:
+                if database.prescriptions.complete_prescription(created.pop(), 1) is None:
+                    raise RuntimeError('complete_prescription failed')
+            else:
+                if not database.patients.update_diagnosis(rng.choice(user_ids), 'observation'):
+                    raise RuntimeError('update_diagnosis failed')
+        except Exception as e:
+            errors.append(repr(e))
+        latencies.append(time.perf_counter() - started)
+
+
+def run(path, group_commit, threads, writes, patients, synchronous, max_delay):
+    remove_db(path)
+    database = HospitalDatabase(path, group_commit=group_commit, pool_size=threads + 1,
+                                write_queue_options={'max_delay': max_delay},
+                                pragmas={'synchronous': synchronous})
+    doctor_id, patient_ids, user_ids = seed(database, patients)
+
+    latencies = []
+    errors = []
+    pool = [threading.Thread(target=worker, args=(database, doctor_id, patient_ids, user_ids,
+                                                  writes, i, latencies, errors))
+            for i in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = database.writes.stats() if database.writes is not None else None
+    database.close()
+    remove_db(path)
+
+    latencies.sort()
+    return {
+        'writes_per_sec': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000,
+        'errors': len(errors),
+        'sample_error': errors[0] if errors else None,
+        'avg_batch': stats['avg_batch'] if stats else 1.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=200, help='writes per thread')
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--db', default='bench_group_commit.db')
+    parser.add_argument('--synchronous', default='FULL', choices=['OFF', 'NORMAL', 'FULL'])
+    parser.add_argument('--max-delay', type=float, default=0.0,
+                        help='seconds the writer waits for a batch to fill')
+    args = parser.parse_args()
+
+    print(f'{args.threads} threads x {args.writes} writes, synchronous={args.synchronous}\n')
+    print(f'{"path":<14} {"writes/s":>10} {"p50 ms":>8} {"p99 ms":>8} {"batch":>6} {"errors":>7}')
+    for label, group_commit in (('per-call', False), ('group commit', True)):
+        result = run(args.db, group_commit, args.threads, args.writes, args.patients, args.synchronous,
+                     args.max_delay)
+        print(f'{label:<14} {result["writes_per_sec"]:>10.0f} {result["p50_ms"]:>8.2f} '
+              f'{result["p99_ms"]:>8.2f} {result["avg_batch"]:>6.1f} {result["errors"]:>7}')
+        if result['sample_error']:
+            print(f'  e.g. {result["sample_error"]}')
+
+
+if __name__ == '__main__':
+    main()
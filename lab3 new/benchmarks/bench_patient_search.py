@@ -0,0 +1,119 @@
+"""Compare FTS5 and LIKE patient search on a synthetic dataset.
+
+    python benchmarks/bench_patient_search.py --patients 1000000
+
+The dataset is written to a scratch file (``--db``) and reused on later runs
+when it already holds enough patients. Selective terms are where FTS wins;
+a term that matches a large share of rows pays for bm25 ranking of every
+match, while LIKE can stop at the first page.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database.hospital_db import HospitalDatabase
+
+FIRST_NAMES = ['Olena', 'Andrii', 'Maria', 'Taras', 'Iryna', 'Dmytro', 'Sofia', 'Mykola',
+               'Anna', 'Petro', 'Kateryna', 'Ivan', 'Yulia', 'Oleh', 'Natalia', 'Serhii']
+# 20^3 syllable combinations give 8000 surnames, so name lookups are selective
+SYLLABLES = ['ko', 'val', 'shev', 'bon', 'dar', 'tka', 'mel', 'ny', 'boy', 'lys',
+             'ru', 'sav', 'pet', 'hor', 'zin', 'mar', 'chuk', 'vyn', 'sto', 'lan']
+LAST_NAMES = [f'{a}{b}{c}enko'.capitalize() for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+DIAGNOSES = ['acute bronchitis', 'community acquired pneumonia', 'type 2 diabetes',
+             'essential hypertension', 'migraine without aura', 'appendicitis',
+             'fractured radius', 'influenza', 'gastritis', 'atrial fibrillation',
+             'chronic kidney disease', 'asthma exacerbation']
+
+QUERIES = [
+    {'name': 'Shevkovalenko'},
+    {'name': 'Maria Bondarchuk'},
+    {'name': 'Olena Tkamel'},
+    {'name': 'Nobody'},
+    {'diagnosis': 'pneumonia'},
+    {'name': 'Petro Ruzin', 'diagnosis': 'influenza'},
+]
+
+
+def populate(database, patients, batch_size=50000):
+    with database.db.connection() as conn:
+        existing = conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0]
+        if existing >= patients:
+            return existing
+
+        rng = random.Random(42)
+        next_user = (conn.execute('SELECT MAX(id) FROM users').fetchone()[0] or 0) + 1
+        remaining = patients - existing
+        while remaining > 0:
+            count = min(batch_size, remaining)
+            users = []
+            rows = []
+            for offset in range(count):
+                user_id = next_user + offset
+                users.append((
+                    f'bench_patient_{user_id}', 'x', 'patient',
+                    f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+                ))
+                rows.append((user_id, rng.choice(DIAGNOSES)))
+            conn.executemany(
+                'INSERT INTO users (username, password, role, name) VALUES (?, ?, ?, ?)', users
+            )
+            conn.executemany(
+                'INSERT INTO patients (user_id, current_diagnosis) VALUES (?, ?)', rows
+            )
+            conn.commit()
+            next_user += count
+            remaining -= count
+            print(f'  {patients - remaining}/{patients} patients', file=sys.stderr)
+        return patients
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=1000000)
+    parser.add_argument('--db', default='bench_search.db')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--per-page', type=int, default=50)
+    args = parser.parse_args()
+
+    database = HospitalDatabase(args.db)
+    if not database.db.has_fts:
+        print('SQLite was built without FTS5; only the LIKE path is available')
+        return 1
+
+    total = populate(database, args.patients)
+    print(f'{total} patients in {args.db}\n')
+    print(f'{"query":<40} {"LIKE ms":>10} {"rows":>8} {"FTS ms":>10} {"rows":>8} {"speedup":>8}')
+
+    manager = database.patients
+    for query in QUERIES:
+        name = query.get('name', '')
+        diagnosis = query.get('diagnosis', '')
+        like_time, like_rows = timed(lambda: manager._search_patients_like(
+            name, diagnosis, '', '', 1, args.per_page), args.repeat)
+        fts_time, fts_rows = timed(lambda: manager.search_patients(
+            name=name, diagnosis=diagnosis, page=1, per_page=args.per_page), args.repeat)
+        label = ', '.join(f'{key}={value!r}' for key, value in query.items())
+        print(f'{label:<40} {like_time * 1000:>10.2f} {like_rows:>8} '
+              f'{fts_time * 1000:>10.2f} {fts_rows:>8} {like_time / fts_time:>7.1f}x')
+
+    database.db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
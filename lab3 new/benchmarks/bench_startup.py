@@ -0,0 +1,191 @@
+"""Import time and time to first response of the monolith and each service.
+
+    python benchmarks/bench_startup.py --runs 5 --max-import-ms 400 --max-ready-ms 3000
+
+For every entry point the module is imported ``--runs`` times in a fresh
+interpreter, pointed at a database file that does not exist, and the
+import must leave it that way: importing must not open SQLite. The script
+is then started as a server and timed until ``GET /`` answers, and (for
+the services that own a database-backed route without auth) until the
+first request that has to open the database does.
+
+Opening an up-to-date database, which skips all DDL, is timed separately.
+Exits non-zero when a median exceeds its budget or an import has side
+effects, so it can guard CI against startup regressions.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'monolith': ('app.py', '/auth/login'),
+    'auth': ('microservices/auth_service.py', '/auth/login'),
+    'profile': ('microservices/profile_service.py', None),
+    'patient': ('microservices/patient_service.py', None),
+    'prescription': ('microservices/prescription_service.py', None),
+    'gateway': ('microservices/gateway.py', None)
+}
+
+IMPORT_PROBE = '''
+import importlib.util, json, os, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('bench_target', {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'ms': elapsed * 1000,
+    'db_created': os.path.exists({db!r}),
+    'heavy_modules': sorted(name for name in ('bcrypt', 'jwt') if name in sys.modules)
+}}))
+'''
+
+OPEN_PROBE = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+from models.database.base import Database
+started = time.perf_counter()
+Database({db!r}).close()
+print(json.dumps({{'ms': (time.perf_counter() - started) * 1000}}))
+'''
+
+
+def probe(code, env):
+    output = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def wait_for(url, process, timeout, data=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            request = urllib.request.Request(url, data=data,
+                                             headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=1) as response:
+                response.read()
+            return
+        except urllib.error.HTTPError:
+            # Any HTTP answer means the server is serving
+            return
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            time.sleep(0.005)
+    raise RuntimeError(f'{url} did not answer within {timeout}s')
+
+
+def time_to_first_response(path, db_route, port, env, timeout):
+    env = dict(env, PORT=str(port), DEBUG='0')
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, path)], env=env, cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(f'http://127.0.0.1:{port}/', process, timeout)
+        ready = time.perf_counter() - started
+        first_query = None
+        if db_route:
+            body = json.dumps({'username': 'bench-startup', 'password': 'x'}).encode()
+            wait_for(f'http://127.0.0.1:{port}{db_route}', process, timeout, data=body)
+            first_query = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+    return ready, first_query
+
+
+def median_ms(values):
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), 1) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        help='comma-separated subset of ' + ', '.join(TARGETS))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=5800)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--max-import-ms', type=float, default=400)
+    parser.add_argument('--max-ready-ms', type=float, default=3000)
+    parser.add_argument('--max-open-ms', type=float, default=50,
+                        help='budget for opening an up-to-date database')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    missing_db = os.path.join(workdir, 'never_created.db')
+    ready_db = os.path.join(workdir, 'hospital.db')
+    base_env = dict(os.environ, METRICS_ENABLED='1')
+    results = {}
+    failures = []
+    try:
+        # Build the schema once; every later open should skip the DDL
+        probe(OPEN_PROBE.format(root=ROOT, db=ready_db), base_env)
+        opens = [probe(OPEN_PROBE.format(root=ROOT, db=ready_db), base_env)['ms']
+                 for _ in range(args.runs)]
+        results['open_current_schema_ms'] = median_ms(opens)
+        if results['open_current_schema_ms'] > args.max_open_ms:
+            failures.append(f'opening a current database took {results["open_current_schema_ms"]} ms')
+
+        for offset, name in enumerate(args.targets.split(',')):
+            path, db_route = TARGETS[name]
+            imports = [
+                probe(IMPORT_PROBE.format(root=ROOT, path=os.path.join(ROOT, path), db=missing_db),
+                      dict(base_env, DB_PATH=missing_db))
+                for _ in range(args.runs)
+            ]
+            timings = [
+                time_to_first_response(path, db_route, args.port + offset,
+                                       dict(base_env, DB_PATH=ready_db), args.timeout)
+                for _ in range(args.runs)
+            ]
+            result = {
+                'import_ms': median_ms([run['ms'] for run in imports]),
+                'import_opened_db': any(run['db_created'] for run in imports),
+                'import_heavy_modules': sorted({module for run in imports
+                                                for module in run['heavy_modules']}),
+                'ready_ms': median_ms([ready * 1000 for ready, _ in timings]),
+                'first_query_ms': median_ms([first * 1000 if first is not None else None
+                                             for _, first in timings])
+            }
+            results[name] = result
+            print(name, result, file=sys.stderr)
+
+            if result['import_opened_db']:
+                failures.append(f'{name}: importing {path} created the database')
+            if result['import_ms'] > args.max_import_ms:
+                failures.append(f'{name}: import took {result["import_ms"]} ms')
+            if result['ready_ms'] > args.max_ready_ms:
+                failures.append(f'{name}: first response after {result["ready_ms"]} ms')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f'{"target":<14} {"import ms":>10} {"ready ms":>10} {"1st query ms":>13}')
+    for name, result in results.items():
+        if isinstance(result, dict):
+            print(f'{name:<14} {result["import_ms"]:>10} {result["ready_ms"]:>10} '
+                  f'{str(result["first_query_ms"] or "-"):>13}')
+    print(f'open current schema: {results["open_current_schema_ms"]} ms')
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'args': vars(args), 'results': results, 'failures': failures},
+                      handle, indent=2, sort_keys=True)
+    for failure in failures:
+        print(f'FAIL {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""Fill a database with a large, skewed synthetic hospital dataset.
+
+    python benchmarks/generate_dataset.py --db bench_hospital.db \
+        --patients 1000000 --prescriptions 10000000
+
+Doctor caseloads and prescriptions per patient follow Zipf-like
+distributions (``--doctor-skew``, ``--patient-skew``), so a few doctors and
+long-stay patients carry a large share of the rows, as in a real ward. Every account shares the
+password ``--password``, hashed once, so the load driver can log in as any
+user: ``admin``, ``doctor<n>``, ``nurse<n>`` or ``patient<n>``.
+
+Triggers are dropped while loading and re-created afterwards, followed by a
+single rebuild of the search index and rollups. Point the app at the file
+with ``DB_PATH``.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import bcrypt
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_patient_search import FIRST_NAMES, LAST_NAMES, DIAGNOSES
+from models.database.base import Database
+from models.database.migrations import rebuild_patient_search, table_exists
+from models.database.rollups import rebuild_rollups
+
+SPECIALIZATIONS = ['cardiology', 'neurology', 'surgery', 'pediatrics', 'oncology',
+                   'orthopedics', 'internal medicine', 'pulmonology']
+DEPARTMENTS = ['ER', 'ICU', 'surgery', 'pediatrics', 'cardiology', 'general ward']
+PRESCRIPTION_TYPES = ['medication'] * 6 + ['procedure'] * 3 + ['surgery']
+DESCRIPTIONS = ['Paracetamol 500 mg twice daily', 'Chest X-ray', 'Blood panel',
+                'Amoxicillin 250 mg three times daily', 'ECG', 'Physiotherapy session',
+                'Insulin 10 units before meals', 'Appendectomy', 'MRI of the head']
+DAY = 86400
+
+
+def zipf_weights(count, skew, rng):
+    """Cumulative weights over ``count`` items in shuffled rank order."""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    total = 0.0
+    cumulative = []
+    for rank in ranks:
+        total += 1.0 / rank ** skew
+        cumulative.append(total)
+    return cumulative
+
+
+def timestamp(seconds):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds))
+
+
+def chunked(total, size):
+    start = 0
+    while start < total:
+        yield start, min(size, total - start)
+        start += size
+
+
+def drop_triggers(conn):
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    return [sql for _, sql in triggers]
+
+
+def generate(conn, args, log):
+    rng = random.Random(args.seed)
+    now = int(time.time())
+    password = bcrypt.hashpw(args.password.encode('utf-8'), bcrypt.gensalt(args.rounds)).decode('utf-8')
+
+    users = [(1, 'admin', password, 'admin', 'Admin')]
+    doctors = []
+    nurses = []
+    user_id = 2
+    for n in range(args.doctors):
+        users.append((user_id, f'doctor{n}', password, 'doctor',
+                      f'Dr {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'))
+        doctors.append((n + 1, user_id, rng.choice(SPECIALIZATIONS)))
+        user_id += 1
+    for n in range(args.nurses):
+        users.append((user_id, f'nurse{n}', password, 'nurse',
+                      f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'))
+        nurses.append((n + 1, user_id, rng.choice(DEPARTMENTS)))
+        user_id += 1
+    conn.executemany('INSERT INTO users (id, username, password, role, name) VALUES (?, ?, ?, ?, ?)', users)
+    conn.executemany('INSERT INTO doctors (id, user_id, specialization) VALUES (?, ?, ?)', doctors)
+    conn.executemany('INSERT INTO nurses (id, user_id, department) VALUES (?, ?, ?)', nurses)
+    conn.commit()
+    log(f'{len(doctors)} doctors, {len(nurses)} nurses')
+
+    doctor_ids = list(range(1, args.doctors + 1))
+    doctor_weights = zipf_weights(args.doctors, args.doctor_skew, rng)
+    doctor_of = [0] * (args.patients + 1)
+    admitted = [0] * (args.patients + 1)
+    discharged = [None] * (args.patients + 1)
+    first_patient_user = user_id
+    for start, count in chunked(args.patients, args.batch):
+        assigned = rng.choices(doctor_ids, cum_weights=doctor_weights, k=count)
+        users = []
+        patients = []
+        for offset in range(count):
+            patient_id = start + offset + 1
+            admission = now - rng.randint(0, args.days * DAY)
+            # Most patients have gone home; stays are short with a long tail
+            discharge = None
+            if rng.random() < args.discharged:
+                discharge = min(now, admission + int(rng.expovariate(1 / 5.0) * DAY) + 3600)
+            doctor_of[patient_id] = assigned[offset]
+            admitted[patient_id] = admission
+            discharged[patient_id] = discharge
+            diagnosis = rng.choice(DIAGNOSES)
+            users.append((first_patient_user + patient_id - 1, f'patient{patient_id - 1}', password,
+                          'patient', f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'))
+            patients.append((patient_id, first_patient_user + patient_id - 1, assigned[offset],
+                             timestamp(admission), timestamp(discharge) if discharge else None,
+                             diagnosis, diagnosis if discharge else None))
+        conn.executemany('INSERT INTO users (id, username, password, role, name) VALUES (?, ?, ?, ?, ?)', users)
+        conn.executemany(
+            'INSERT INTO patients (id, user_id, doctor_id, admission_date, discharge_date, '
+            'current_diagnosis, final_diagnosis) VALUES (?, ?, ?, ?, ?, ?, ?)', patients
+        )
+        conn.commit()
+        log(f'  {start + count}/{args.patients} patients')
+
+    patient_ids = list(range(1, args.patients + 1))
+    patient_weights = zipf_weights(args.patients, args.patient_skew, rng)
+    nurse_user_ids = [nurse[1] for nurse in nurses] or [1]
+    for start, count in chunked(args.prescriptions, args.batch):
+        chosen = rng.choices(patient_ids, cum_weights=patient_weights, k=count)
+        rows = []
+        for patient_id in chosen:
+            end = discharged[patient_id] or now
+            created = rng.randint(admitted[patient_id], max(admitted[patient_id], end))
+            done = discharged[patient_id] is not None or rng.random() < 0.7
+            rows.append((
+                patient_id,
+                doctor_of[patient_id] if rng.random() < 0.9 else rng.choice(doctor_ids),
+                rng.choice(PRESCRIPTION_TYPES),
+                rng.choice(DESCRIPTIONS),
+                'completed' if done else 'pending',
+                timestamp(created),
+                timestamp(min(end, created + rng.randint(600, 2 * DAY))) if done else None,
+                rng.choice(nurse_user_ids) if done else None
+            ))
+        conn.executemany(
+            'INSERT INTO prescriptions (patient_id, doctor_id, prescription_type, description, status, '
+            'created_at, completed_at, completed_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+        )
+        conn.commit()
+        log(f'  {start + count}/{args.prescriptions} prescriptions')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='bench_hospital.db')
+    parser.add_argument('--patients', type=int, default=1000000)
+    parser.add_argument('--prescriptions', type=int, default=10000000)
+    parser.add_argument('--doctors', type=int, default=2000)
+    parser.add_argument('--nurses', type=int, default=1000)
+    parser.add_argument('--doctor-skew', type=float, default=0.7, help='Zipf exponent of caseloads')
+    parser.add_argument('--patient-skew', type=float, default=0.6,
+                        help='Zipf exponent of prescriptions per patient')
+    parser.add_argument('--days', type=int, default=730, help='admissions spread over this many days')
+    parser.add_argument('--discharged', type=float, default=0.85, help='share of discharged patients')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt cost of the shared password')
+    parser.add_argument('--batch', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    log = lambda message: print(message, file=sys.stderr)
+    database = Database(args.db, pragmas={'synchronous': 'OFF'})
+    started = time.perf_counter()
+    with database.connection() as conn:
+        if conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]:
+            print(f'{args.db} already has users; generate into an empty database', file=sys.stderr)
+            return 1
+
+        triggers = drop_triggers(conn)
+        conn.commit()
+        generate(conn, args, log)
+
+        log('re-creating triggers, search index and rollups')
+        conn.execute('BEGIN IMMEDIATE')
+        for sql in triggers:
+            conn.execute(sql)
+        if table_exists(conn, 'patient_search'):
+            rebuild_patient_search(conn)
+        rebuild_rollups(conn)
+        conn.commit()
+        conn.execute('ANALYZE')
+    database.close()
+
+    print(f'{args.patients} patients and {args.prescriptions} prescriptions written to '
+          f'{args.db} in {time.perf_counter() - started:.0f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
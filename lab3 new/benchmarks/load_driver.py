@@ -0,0 +1,395 @@
+"""Mixed-workload load test of the monolith against the gateway and services.
+
+    python benchmarks/generate_dataset.py --db bench_hospital.db
+    python benchmarks/load_driver.py --db bench_hospital.db --requests 20000 \
+        --concurrency 64 --output results.json
+
+Each topology is started as subprocesses on localhost with ``DB_PATH``
+pointing at the dataset: ``app.py`` alone, or ``gateway.py`` in front of
+the four services. The same seeded sequence of operations is then replayed
+against each one:
+
+    login       POST /auth/login as a random user (bcrypt verify)
+    search      GET /patient/patients/search by name or diagnosis, one page
+    chart       profile, patient record and prescription history of one
+                patient; a single /gateway/patients/<id>/chart call with
+                --aggregate on the microservices topology
+    prescribe   POST /prescription/prescriptions as a doctor
+    complete    POST /prescription/prescriptions/<id>/complete as a nurse
+
+Patients are sampled by picking random prescription rows, so hot patients
+come up as often as they do in the data. Throughput, p50/p95/p99 latency
+and error rates are reported per operation; ``--output`` writes them as
+JSON with sorted keys so two runs can be diffed. Writes are applied to the
+dataset, so copy the file first to replay a run from the same state.
+
+With ``--shards N`` the servers run with ``DB_SHARDS=N`` and patients are
+sampled from the shard files next to ``--db`` (see
+models/database/sharding.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_gateway import wait_ready
+from models.database.sharding import shard_paths
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ['auth', 'profile', 'patient', 'prescription']
+OPERATIONS = ['login', 'search', 'chart', 'prescribe', 'complete']
+DEFAULT_MIX = 'login=2,search=25,chart=48,prescribe=15,complete=10'
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'unknown operation {name!r}')
+        mix[name] = float(weight)
+    return mix
+
+
+def sample_random_rows(conn, table, columns, count, rng):
+    """``count`` rows of ``table`` picked by random rowid, in chunks."""
+    max_id = conn.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] or 0
+    rows = []
+    ids = [rng.randint(1, max_id) for _ in range(count)] if max_id else []
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        found = dict(conn.execute(
+            f'SELECT id, {columns} FROM {table} WHERE id IN ({placeholders})', chunk
+        ).fetchall())
+        rows.extend(found[row_id] for row_id in chunk if row_id in found)
+    return rows
+
+
+def sample_scanned_rows(conn, table, columns, count):
+    """``count`` rows of ``table`` (roughly) picked by a full scan.
+
+    Shards hold prescriptions from several id ranges once patients have
+    moved, so random rowids would mostly miss.
+    """
+    total = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    if not total:
+        return []
+    return [row[1] for row in conn.execute(
+        f'SELECT id, {columns} FROM {table} WHERE abs(random()) % ? < ? LIMIT ?',
+        (total, count, count)
+    )]
+
+
+def load_dataset(path, args, rng):
+    """Usernames, hot patients and search terms drawn from the dataset."""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        usernames = dict(conn.execute(
+            "SELECT role, COUNT(*) FROM users GROUP BY role"
+        ).fetchall())
+        doctors = [row[0] for row in conn.execute(
+            "SELECT username FROM users WHERE role = 'doctor' ORDER BY id LIMIT ?", (args.users,)
+        )]
+        nurses = [row[0] for row in conn.execute(
+            "SELECT username FROM users WHERE role = 'nurse' ORDER BY id LIMIT ?", (args.users,)
+        )]
+    finally:
+        conn.close()
+
+    patients, pending, names, diagnoses = [], [], [], set()
+    prescriptions = 0
+    shards = shard_paths(path, args.shards) if args.shards > 1 else [path]
+    for shard in shards:
+        conn = sqlite3.connect(f'file:{shard}?mode=ro', uri=True)
+        try:
+            sample = args.sample // len(shards)
+            if len(shards) > 1:
+                patients.extend(sample_scanned_rows(conn, 'prescriptions', 'patient_id', sample))
+                people = sample_scanned_rows(conn, 'patients', 'user_id', sample // 10)
+            else:
+                patients.extend(sample_random_rows(conn, 'prescriptions', 'patient_id', sample, rng))
+                people = sample_random_rows(conn, 'patients', 'user_id', sample // 10, rng)
+            pending.extend(row[0] for row in conn.execute(
+                "SELECT id FROM prescriptions WHERE status = 'pending' ORDER BY id DESC LIMIT ?",
+                (sample,)
+            ))
+            # Shards keep a copy of their patients' names
+            for start in range(0, len(people), 500):
+                chunk = people[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                names.extend(row[0] for row in conn.execute(
+                    f'SELECT name FROM users WHERE id IN ({placeholders})', chunk
+                ))
+            diagnoses.update(row[0] for row in conn.execute(
+                'SELECT DISTINCT current_diagnosis FROM patients WHERE current_diagnosis IS NOT NULL LIMIT 200'
+            ))
+            prescriptions += conn.execute('SELECT COUNT(*) FROM prescriptions').fetchone()[0]
+        finally:
+            conn.close()
+    diagnoses = sorted(diagnoses)[:200]
+
+    if not doctors or not nurses or not patients:
+        raise SystemExit(f'{path} has no doctors, nurses or prescriptions; run generate_dataset.py')
+    return {
+        'users': usernames,
+        'prescriptions': prescriptions,
+        'doctors': doctors,
+        'nurses': nurses,
+        'patients': patients,
+        'pending': pending,
+        'names': [name.split()[-1] for name in names if name],
+        'diagnoses': [diagnosis.split()[0] for diagnosis in diagnoses if diagnosis]
+    }
+
+
+def plan(dataset, args):
+    """The seeded operation sequence replayed against every topology."""
+    rng = random.Random(args.seed)
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    logins = dataset['doctors'] + dataset['nurses']
+    pending = list(dataset['pending'])
+    rng.shuffle(pending)
+    operations = []
+    for _ in range(args.requests):
+        name = rng.choices(names, weights)[0]
+        if name == 'login':
+            operations.append(('login', rng.choice(logins)))
+        elif name == 'search':
+            if rng.random() < 0.7 or not dataset['diagnoses']:
+                query = {'name': rng.choice(dataset['names'])}
+            else:
+                query = {'diagnosis': rng.choice(dataset['diagnoses']), 'status': 'active'}
+            query.update(page=1, per_page=20)
+            operations.append(('search', query))
+        elif name == 'chart':
+            operations.append(('chart', rng.choice(dataset['patients'])))
+        elif name == 'prescribe':
+            operations.append(('prescribe', rng.choice(dataset['patients'])))
+        elif pending:
+            operations.append(('complete', pending.pop()))
+    return operations
+
+
+def topology_commands(name, port, db_path, shards=1):
+    env = dict(os.environ, DEBUG='0', DB_PATH=db_path, DB_SHARDS=str(shards))
+    if name == 'monolith':
+        return [([sys.executable, os.path.join(ROOT, 'app.py')], dict(env, PORT=str(port)))]
+
+    commands = []
+    for offset, service in enumerate(SERVICES, 1):
+        env[f'{service.upper()}_SERVICE_URL'] = f'http://127.0.0.1:{port + offset}'
+        commands.append((
+            [sys.executable, os.path.join(ROOT, 'microservices', f'{service}_service.py')],
+            dict(env, PORT=str(port + offset))
+        ))
+    commands.append((
+        [sys.executable, os.path.join(ROOT, 'microservices', 'gateway.py')],
+        dict(env, PORT=str(port))
+    ))
+    return commands
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.rejected = {}
+
+    def add(self, operation, seconds, status):
+        self.latencies.setdefault(operation, []).append(seconds)
+        if status is None or status >= 500:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+        elif status >= 400:
+            self.rejected[operation] = self.rejected.get(operation, 0) + 1
+
+    def summary(self, elapsed):
+        results = {}
+        operations = dict(self.latencies, total=[
+            seconds for latencies in self.latencies.values() for seconds in latencies
+        ])
+        for operation, latencies in operations.items():
+            latencies.sort()
+            pick = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000
+            if operation == 'total':
+                errors = sum(self.errors.values())
+                rejected = sum(self.rejected.values())
+            else:
+                errors = self.errors.get(operation, 0)
+                rejected = self.rejected.get(operation, 0)
+            results[operation] = {
+                'requests': len(latencies),
+                'rps': round(len(latencies) / elapsed, 1),
+                'p50_ms': round(pick(0.50), 2),
+                'p95_ms': round(pick(0.95), 2),
+                'p99_ms': round(pick(0.99), 2),
+                'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+                'errors': errors,
+                'error_rate': round(errors / len(latencies), 4),
+                'rejected': rejected
+            }
+        return results
+
+
+async def drive(url, operations, tokens, args, aggregate=False):
+    recorder = Recorder()
+    queue = asyncio.Queue()
+    for index, operation in enumerate(operations):
+        queue.put_nowait((index, operation))
+
+    async def request(session, method, path, token=None, **kwargs):
+        headers = {'Authorization': token} if token else None
+        try:
+            async with session.request(method, url + path, headers=headers, **kwargs) as response:
+                await response.read()
+                return response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def run(session, index, operation, value):
+        doctor = tokens['doctor'][index % len(tokens['doctor'])]
+        nurse = tokens['nurse'][index % len(tokens['nurse'])]
+        if operation == 'login':
+            return await request(session, 'POST', '/auth/login',
+                                 json={'username': value, 'password': args.password})
+        if operation == 'search':
+            return await request(session, 'GET', '/patient/patients/search', doctor, params=value)
+        if operation == 'chart':
+            if aggregate:
+                return await request(session, 'GET', f'/gateway/patients/{value}/chart', doctor)
+            statuses = [
+                await request(session, 'GET', '/profile/profile', doctor),
+                await request(session, 'GET', f'/patient/patients/{value}', doctor),
+                await request(session, 'GET', f'/prescription/patients/{value}/prescriptions', doctor)
+            ]
+            return None if None in statuses else max(statuses)
+        if operation == 'prescribe':
+            return await request(session, 'POST', '/prescription/prescriptions', doctor, json={
+                'patient_id': value, 'prescription_type': 'medication',
+                'description': 'Load test prescription'
+            })
+        return await request(session, 'POST', f'/prescription/prescriptions/{value}/complete', nurse)
+
+    async def worker(session):
+        while True:
+            try:
+                index, (operation, value) = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            status = await run(session, index, operation, value)
+            recorder.add(operation, time.perf_counter() - started, status)
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return recorder.summary(elapsed), elapsed
+
+
+async def login_all(url, usernames, password):
+    tokens = []
+    async with aiohttp.ClientSession() as session:
+        for username in usernames:
+            async with session.post(f'{url}/auth/login',
+                                    json={'username': username, 'password': password}) as response:
+                if response.status != 200:
+                    raise SystemExit(f'login as {username} failed with {response.status}')
+                tokens.append((await response.json())['token'])
+    return tokens
+
+
+async def bench(topology, operations, dataset, args):
+    port = args.port if topology == 'monolith' else args.gateway_port
+    url = f'http://127.0.0.1:{port}'
+    processes = [
+        subprocess.Popen(command, env=env, cwd=ROOT, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL)
+        for command, env in topology_commands(topology, port, args.db, args.shards)
+    ]
+    try:
+        for offset in range(len(processes)):
+            await wait_ready(f'http://127.0.0.1:{port + offset}/', timeout=60)
+        tokens = {
+            'doctor': await login_all(url, dataset['doctors'], args.password),
+            'nurse': await login_all(url, dataset['nurses'], args.password)
+        }
+        warmup = [operation for operation in operations[:args.warmup]
+                  if operation[0] in ('search', 'chart')]
+        await drive(url, warmup, tokens, args)
+        results, elapsed = await drive(url, operations, tokens, args,
+                                       aggregate=args.aggregate and topology == 'microservices')
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    return {'seconds': round(elapsed, 3), 'operations': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='bench_hospital.db')
+    parser.add_argument('--topology', choices=['monolith', 'microservices', 'both'], default='both')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--warmup', type=int, default=500)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'operation weights (default {DEFAULT_MIX})')
+    parser.add_argument('--aggregate', action='store_true',
+                        help='read charts through /gateway/patients/<id>/chart')
+    parser.add_argument('--users', type=int, default=16, help='doctors and nurses to log in as')
+    parser.add_argument('--sample', type=int, default=10000, help='prescription rows to sample')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--port', type=int, default=5700, help='monolith port')
+    parser.add_argument('--gateway-port', type=int, default=5710,
+                        help='gateway port; services use the next four')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('DB_SHARDS', 1)),
+                        help='run with DB_SHARDS and sample from the shard files')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+    args.db = os.path.abspath(args.db)
+    if not os.path.exists(args.db):
+        print(f'{args.db} not found; run generate_dataset.py first', file=sys.stderr)
+        return 1
+
+    dataset = load_dataset(args.db, args, random.Random(args.seed))
+    operations = plan(dataset, args)
+    topologies = ['monolith', 'microservices'] if args.topology == 'both' else [args.topology]
+    results = {}
+    for topology in topologies:
+        results[topology] = asyncio.run(bench(topology, operations, dataset, args))
+        print(topology, results[topology]['operations']['total'], file=sys.stderr)
+
+    print(f'{"topology":<14} {"operation":<10} {"rps":>8} {"p50 ms":>9} {"p95 ms":>9} '
+          f'{"p99 ms":>9} {"errors":>7}')
+    for topology, result in results.items():
+        for operation, stats in sorted(result['operations'].items()):
+            print(f'{topology:<14} {operation:<10} {stats["rps"]:>8} {stats["p50_ms"]:>9} '
+                  f'{stats["p95_ms"]:>9} {stats["p99_ms"]:>9} {stats["errors"]:>7}')
+    if args.output:
+        dataset_info = {'users': dataset['users'], 'prescriptions': dataset['prescriptions']}
+        args.mix = dict(args.mix)
+        with open(args.output, 'w') as handle:
+            json.dump({'args': vars(args), 'dataset': dataset_info, 'results': results},
+                      handle, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
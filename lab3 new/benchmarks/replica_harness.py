@@ -0,0 +1,181 @@
+"""Run the gateway against several local replicas of prescription_service.py.
+
+    python benchmarks/replica_harness.py --replicas 3 --requests 300
+
+Starts the auth/profile/patient services, N prescription replicas and the
+gateway as subprocesses in a scratch directory, then:
+
+1. drives prescription traffic and checks every replica took a share,
+2. kills one replica and checks the gateway ejects it and keeps serving,
+3. restarts it and checks it is re-admitted.
+
+Exits non-zero if any check fails. Per-replica stats come from
+/gateway/stats.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = os.path.join(ROOT, 'microservices')
+
+
+class Harness:
+    def __init__(self, replicas, base_port, health_interval, workdir):
+        self.base_port = base_port
+        self.workdir = workdir
+        self.gateway_url = f'http://127.0.0.1:{base_port}'
+        self.ports = {
+            'auth': base_port + 1,
+            'profile': base_port + 2,
+            'patient': base_port + 3
+        }
+        self.replica_ports = [base_port + 10 + i for i in range(replicas)]
+        self.env = dict(os.environ, DEBUG='0', HASH_WORKERS='0', BCRYPT_ROUNDS='4',
+                        GATEWAY_HEALTH_INTERVAL=str(health_interval),
+                        GATEWAY_HEALTH_TIMEOUT='0.5',
+                        AUTH_SERVICE_URL=f'http://127.0.0.1:{self.ports["auth"]}',
+                        PROFILE_SERVICE_URL=f'http://127.0.0.1:{self.ports["profile"]}',
+                        PATIENT_SERVICE_URL=f'http://127.0.0.1:{self.ports["patient"]}',
+                        PRESCRIPTION_SERVICE_URL=','.join(
+                            f'http://127.0.0.1:{port}' for port in self.replica_ports))
+        self.processes = {}
+
+    def spawn(self, key, script, port):
+        env = dict(self.env, PORT=str(port))
+        self.processes[key] = subprocess.Popen(
+            [sys.executable, os.path.join(SERVICES, script)],
+            cwd=self.workdir, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        wait_ready(f'http://127.0.0.1:{port}/')
+
+    def start(self):
+        # The first process creates the schema before the others open it
+        self.spawn('auth', 'auth_service.py', self.ports['auth'])
+        self.spawn('profile', 'profile_service.py', self.ports['profile'])
+        self.spawn('patient', 'patient_service.py', self.ports['patient'])
+        for index, port in enumerate(self.replica_ports):
+            self.spawn(f'prescription-{index}', 'prescription_service.py', port)
+        self.spawn('gateway', 'gateway.py', self.base_port)
+
+    def kill(self, key):
+        process = self.processes.pop(key)
+        process.terminate()
+        process.wait()
+
+    def stop(self):
+        for key in list(self.processes):
+            self.kill(key)
+
+    def stats(self):
+        return requests.get(f'{self.gateway_url}/gateway/stats', timeout=5).json()['upstreams']['prescription']
+
+
+def wait_ready(url, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f'{url} did not come up')
+
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def setup_data(gateway):
+    session = requests.Session()
+    for payload in (
+        {'username': 'harness_doctor', 'password': 'pw', 'role': 'doctor', 'name': 'Harness Doctor',
+         'specialization': 'general'},
+        {'username': 'harness_patient', 'password': 'pw', 'role': 'patient', 'name': 'Harness Patient',
+         'doctor_id': 1}
+    ):
+        session.post(f'{gateway}/auth/register', json=payload, timeout=10)
+    token = session.post(f'{gateway}/auth/login', json={'username': 'harness_doctor', 'password': 'pw'},
+                         timeout=10).json()['token']
+    headers = {'Authorization': token}
+    session.post(f'{gateway}/prescription/prescriptions', headers=headers, timeout=10,
+                 json={'patient_id': 1, 'prescription_type': 'medication', 'description': 'harness'})
+    return headers
+
+
+def drive(gateway, headers, count, concurrency):
+    def call(_):
+        try:
+            return requests.get(f'{gateway}/prescription/patients/1/prescriptions',
+                                headers=headers, timeout=10).status_code
+        except requests.RequestException:
+            return 0
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        statuses = list(pool.map(call, range(count)))
+    return sum(1 for status in statuses if status == 200), len(statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replicas', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--base-port', type=int, default=5700)
+    parser.add_argument('--health-interval', type=float, default=0.5)
+    args = parser.parse_args()
+
+    failures = []
+
+    def check(condition, message):
+        print(('PASS ' if condition else 'FAIL ') + message)
+        if not condition:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        harness = Harness(args.replicas, args.base_port, args.health_interval, workdir)
+        try:
+            harness.start()
+            headers = setup_data(harness.gateway_url)
+
+            ok, total = drive(harness.gateway_url, headers, args.requests, args.concurrency)
+            stats = harness.stats()
+            counts = [replica['requests'] for replica in stats['replicas']]
+            check(ok == total, f'{ok}/{total} requests succeeded across {args.replicas} replicas')
+            check(all(counts), f'every replica served traffic: {counts}')
+
+            victim = harness.replica_ports[0]
+            harness.kill('prescription-0')
+            ejected = wait_for(lambda: not harness.stats()['replicas'][0]['healthy'],
+                               timeout=args.health_interval * 10)
+            check(ejected, f'replica on port {victim} ejected after being killed')
+            ok, total = drive(harness.gateway_url, headers, args.requests // 2, args.concurrency)
+            check(ok == total, f'{ok}/{total} requests succeeded with one replica down')
+
+            harness.spawn('prescription-0', 'prescription_service.py', victim)
+            readmitted = wait_for(lambda: harness.stats()['replicas'][0]['healthy'],
+                                  timeout=args.health_interval * 10)
+            check(readmitted, f'replica on port {victim} re-admitted after restart')
+
+            for replica in harness.stats()['replicas']:
+                print(replica)
+        finally:
+            harness.stop()
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import json
+import os
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def _env_list(name, default):
+    return [item.strip() for item in os.environ.get(name, default).split(',') if item.strip()]
+
+
+def _env_json(name, default):
+    value = os.environ.get(name)
+    return json.loads(value) if value else default
+
+
+# Password hashing
+BCRYPT_ROUNDS = _env_int('BCRYPT_ROUNDS', 12)
+# 0 hashes on the request thread instead of in worker processes
+HASH_WORKERS = _env_int('HASH_WORKERS', os.cpu_count() or 1)
+# Hash jobs allowed to wait or run at once before requests get a 503
+HASH_QUEUE_SIZE = _env_int('HASH_QUEUE_SIZE', 32)
+HASH_TIMEOUT = _env_float('HASH_TIMEOUT', 10.0)
+# POST /auth/import hashes on its own process pool so logins keep theirs;
+# one import runs at a time and larger files go through the CLI
+IMPORT_HASH_WORKERS = _env_int('IMPORT_HASH_WORKERS', max(1, (os.cpu_count() or 1) // 2))
+IMPORT_CONCURRENCY = _env_int('IMPORT_CONCURRENCY', 1)
+IMPORT_MAX_ROWS = _env_int('IMPORT_MAX_ROWS', 1000)
+
+# SQLite file used by app.py and every microservice
+DB_PATH = os.environ.get('DB_PATH', 'hospital.db')
+
+# Spread patients and prescriptions over this many SQLite files next to
+# DB_PATH, which keeps users, doctors, nurses and the patient directory.
+# See models/database/sharding.py for splitting and rebalancing.
+DB_SHARDS = _env_int('DB_SHARDS', 1)
+
+# Group commit: queue single-row prescription and patient writes to one
+# writer thread per process that commits them in batches (off by default)
+DB_GROUP_COMMIT = os.environ.get('DB_GROUP_COMMIT', '0') == '1'
+DB_GROUP_COMMIT_MAX_BATCH = _env_int('DB_GROUP_COMMIT_MAX_BATCH', 64)
+DB_GROUP_COMMIT_MAX_DELAY = _env_float('DB_GROUP_COMMIT_MAX_DELAY', 0.0)
+DB_WRITE_QUEUE_SIZE = _env_int('DB_WRITE_QUEUE_SIZE', 1024)
+DB_WRITE_TIMEOUT = _env_float('DB_WRITE_TIMEOUT', 10.0)
+
+# Per-process server settings for app.py and the microservices
+DEBUG = os.environ.get('DEBUG', '1') == '1'
+PORT = os.environ.get('PORT')
+
+# Prometheus metrics at /metrics on every service and the gateway. Requests
+# running more than METRICS_N_PLUS_ONE_STATEMENTS SQL statements are logged
+# and counted as likely N+1 query patterns.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_N_PLUS_ONE_STATEMENTS = _env_int('METRICS_N_PLUS_ONE_STATEMENTS', 20)
+
+# Opt-in profiling. Requests with a valid X-Profile-Token (signed with
+# PROFILE_SECRET; see metrics/profiling.py) or picked at PROFILE_SAMPLE_RATE
+# are profiled into PROFILE_DIR, which keeps the newest PROFILE_KEEP.
+# Requests slower than SLOW_REQUEST_MS are logged with their SQL trace.
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')
+PROFILE_SAMPLE_RATE = _env_float('PROFILE_SAMPLE_RATE', 0.0)
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = _env_int('PROFILE_KEEP', 100)
+SLOW_REQUEST_MS = _env_float('SLOW_REQUEST_MS', 1000.0)
+
+# API gateway upstreams: service name -> replica base URLs. Each *_SERVICE_URL
+# variable takes a comma-separated list to run a service as several replicas.
+GATEWAY_SERVICES = {
+    'auth': _env_list('AUTH_SERVICE_URL', 'http://localhost:5001'),
+    'profile': _env_list('PROFILE_SERVICE_URL', 'http://localhost:5002'),
+    'patient': _env_list('PATIENT_SERVICE_URL', 'http://localhost:5003'),
+    'prescription': _env_list('PRESCRIPTION_SERVICE_URL', 'http://localhost:5004')
+}
+# least_outstanding or p2c (power of two choices)
+GATEWAY_BALANCING = os.environ.get('GATEWAY_BALANCING', 'least_outstanding')
+GATEWAY_HEALTH_INTERVAL = _env_float('GATEWAY_HEALTH_INTERVAL', 5.0)
+GATEWAY_HEALTH_TIMEOUT = _env_float('GATEWAY_HEALTH_TIMEOUT', 1.0)
+# Keep-alive connections kept open per upstream service
+GATEWAY_POOL_SIZE = _env_int('GATEWAY_POOL_SIZE', 20)
+GATEWAY_CONNECT_TIMEOUT = _env_float('GATEWAY_CONNECT_TIMEOUT', 2.0)
+GATEWAY_READ_TIMEOUT = _env_float('GATEWAY_READ_TIMEOUT', 30.0)
+# Per-service overrides as JSON, e.g. {"profile": {"read_timeout": 60}}
+GATEWAY_UPSTREAM_OPTIONS = _env_json('GATEWAY_UPSTREAM_OPTIONS', {})
+GATEWAY_STREAM_CHUNK_SIZE = _env_int('GATEWAY_STREAM_CHUNK_SIZE', 64 * 1024)
+# Async gateway: in-flight requests allowed per upstream, and how long a
+# request may wait for a slot before it is answered with 503
+GATEWAY_MAX_CONCURRENCY = _env_int('GATEWAY_MAX_CONCURRENCY', 512)
+GATEWAY_QUEUE_TIMEOUT = _env_float('GATEWAY_QUEUE_TIMEOUT', 5.0)
+
+# Gateway GET response cache (off unless GATEWAY_CACHE_ENABLED=1)
+GATEWAY_CACHE_ENABLED = os.environ.get('GATEWAY_CACHE_ENABLED', '0') == '1'
+GATEWAY_CACHE_MAX_BYTES = _env_int('GATEWAY_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+GATEWAY_CACHE_MAX_ENTRY_BYTES = _env_int('GATEWAY_CACHE_MAX_ENTRY_BYTES', 1024 * 1024)
+# Path prefix -> TTL in seconds; paths with no matching prefix are not cached
+GATEWAY_CACHE_TTLS = _env_json('GATEWAY_CACHE_TTLS', {
+    '/profile/profile': 10,
+    '/prescription/patients/': 5,
+    '/patient/patients/search': 5
+})
+# Write path prefix -> cached path prefixes it invalidates
+GATEWAY_CACHE_INVALIDATIONS = _env_json('GATEWAY_CACHE_INVALIDATIONS', {
+    '/patient/': ['/patient/', '/profile/'],
+    '/prescription/': ['/prescription/'],
+    '/auth/': ['/profile/users']
+})
+
+# Collapse identical concurrent GETs (same path, query and caller) into one
+# upstream call. Responses larger than the buffer limit are not shared.
+GATEWAY_COALESCE_ENABLED = os.environ.get('GATEWAY_COALESCE_ENABLED', '1') == '1'
+GATEWAY_COALESCE_MAX_WAITERS = _env_int('GATEWAY_COALESCE_MAX_WAITERS', 64)
+GATEWAY_COALESCE_MAX_BYTES = _env_int('GATEWAY_COALESCE_MAX_BYTES', 1024 * 1024)
+
+# Overall time budget per request, including hedges and retries. Path
+# prefix -> seconds; the longest matching prefix wins.
+GATEWAY_DEADLINE = _env_float('GATEWAY_DEADLINE', 30.0)
+GATEWAY_DEADLINES = _env_json('GATEWAY_DEADLINES', {
+    '/auth/import': 300,
+    '/profile/profile': 5,
+    '/patient/patients/search': 10
+})
+# Idempotent GETs get a second attempt on another replica once they run
+# past the route's observed latency quantile, or after a failed attempt.
+# Second attempts are capped at GATEWAY_RETRY_BUDGET_RATIO of traffic.
+GATEWAY_HEDGING_ENABLED = os.environ.get('GATEWAY_HEDGING_ENABLED', '1') == '1'
+GATEWAY_HEDGE_QUANTILE = _env_float('GATEWAY_HEDGE_QUANTILE', 0.95)
+GATEWAY_HEDGE_MIN_SAMPLES = _env_int('GATEWAY_HEDGE_MIN_SAMPLES', 20)
+GATEWAY_HEDGE_MIN_DELAY = _env_float('GATEWAY_HEDGE_MIN_DELAY', 0.005)
+GATEWAY_HEDGE_WORKERS = _env_int('GATEWAY_HEDGE_WORKERS', 64)
+GATEWAY_RETRY_BUDGET_RATIO = _env_float('GATEWAY_RETRY_BUDGET_RATIO', 0.1)
+GATEWAY_RETRY_BUDGET_MAX = _env_int('GATEWAY_RETRY_BUDGET_MAX', 10)
+
+# Composite endpoints (/gateway/patients/<id>/chart, /gateway/worklist):
+# shared deadline for all of their upstream calls, and worker threads
+GATEWAY_AGGREGATE_DEADLINE = _env_float('GATEWAY_AGGREGATE_DEADLINE', 3.0)
+GATEWAY_AGGREGATE_WORKERS = _env_int('GATEWAY_AGGREGATE_WORKERS', 64)
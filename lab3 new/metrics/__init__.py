@@ -0,0 +1,5 @@
+from .registry import Counter, Histogram, Registry, REGISTRY
+from .middleware import install_metrics
+from .profiling import install_profiling
+
+__all__ = ['Counter', 'Histogram', 'Registry', 'REGISTRY', 'install_metrics', 'install_profiling']
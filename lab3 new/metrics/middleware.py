@@ -0,0 +1,69 @@
+import logging
+import time
+
+from flask import Response, g, request
+
+from .registry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def install_metrics(app, registry=REGISTRY, sql_tracer=None, n_plus_one=20):
+    """Time every request per route and serve ``registry`` at ``/metrics``.
+
+    With ``sql_tracer`` the SQL statements of each request are counted too,
+    and requests running more than ``n_plus_one`` of them are flagged as
+    likely N+1 query patterns.
+    """
+    durations = registry.histogram(
+        'http_request_duration_seconds',
+        'Time from receiving a request until its response headers are ready',
+        ('route', 'method', 'status')
+    )
+    if sql_tracer is not None:
+        queries = registry.histogram(
+            'http_request_sql_statements',
+            'SQL statements executed per request',
+            ('route',),
+            buckets=QUERY_BUCKETS
+        )
+        flagged = registry.counter(
+            'http_request_n_plus_one_total',
+            f'Requests that executed more than {n_plus_one} SQL statements',
+            ('route',)
+        )
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        if sql_tracer is not None:
+            g.sql_queries = sql_tracer.begin_request()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        durations.observe(time.perf_counter() - started, route, request.method,
+                          str(response.status_code))
+
+        statements = sql_tracer.end_request() if sql_tracer is not None else None
+        if statements is not None:
+            queries.observe(statements.count, route)
+            if statements.count > n_plus_one:
+                flagged.inc(route)
+                logger.warning('%s %s executed %d SQL statements in %.1f ms; most from %s',
+                               request.method, request.path, statements.count,
+                               statements.seconds * 1000,
+                               ', '.join(f'{tag} ({count})'
+                                         for tag, count in statements.by_tag.most_common(3)))
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), content_type=registry.CONTENT_TYPE)
+
+    return app
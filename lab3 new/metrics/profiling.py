@@ -0,0 +1,244 @@
+"""Opt-in per-request profiling and slow-request logging.
+
+A request is profiled when it carries a valid ``X-Profile-Token`` header
+or is picked by the sampling rate. Tokens are ``<expires>.<hmac>``, an
+HMAC-SHA256 over the expiry and the request path, so only holders of the
+secret can switch the profiler on. Generate one with:
+
+    PROFILE_SECRET=... python -m metrics.profiling /patient/patients/search
+
+Each profile is written to the ring directory as ``<name>.prof`` (pstats),
+``<name>.folded`` (collapsed stacks, in microseconds, for flamegraph.pl or
+speedscope) and ``<name>.json`` (request, timing and SQL trace). Only the
+newest ``keep`` profiles are kept, and at most one request per process is
+profiled at a time.
+"""
+import cProfile
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Profile-Token'
+
+
+def sign(secret, path, ttl=300, now=None):
+    expires = int((time.time() if now is None else now) + ttl)
+    mac = hmac.new(secret.encode(), f'{expires}:{path}'.encode(), hashlib.sha256).hexdigest()
+    return f'{expires}.{mac}'
+
+
+def verify(secret, token, path, now=None):
+    expires, _, mac = token.partition('.')
+    if not secret or not expires.isdigit() or int(expires) < (time.time() if now is None else now):
+        return False
+    expected = hmac.new(secret.encode(), f'{expires}:{path}'.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(mac, expected)
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f'{os.path.basename(filename)}:{name}'
+
+
+def collapsed_stacks(profiler, min_seconds=1e-5, max_depth=64):
+    """Approximate collapsed stacks from a cProfile call graph.
+
+    cProfile records caller/callee pairs rather than whole stacks, so each
+    function's time is split across its callers in proportion to the time
+    spent on each call edge. Paths under ``min_seconds`` are dropped.
+    """
+    stats = pstats.Stats(profiler).stats
+    children = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    folded = Counter()
+
+    def visit(func, path, labels, seconds):
+        _, _, own, cumulative, _ = stats[func]
+        share = seconds / cumulative if cumulative else 0.0
+        labels = labels + [_label(func)]
+        micros = int(own * share * 1e6)
+        if micros:
+            folded[';'.join(labels)] += micros
+        if len(labels) >= max_depth:
+            return
+        for child, edge_seconds in children.get(func, ()):
+            child_seconds = edge_seconds * share
+            if child not in path and child_seconds >= min_seconds:
+                visit(child, path | {child}, labels, child_seconds)
+
+    for func, (_, _, _, cumulative, callers) in stats.items():
+        if not callers and cumulative >= min_seconds:
+            visit(func, {func}, [], cumulative)
+    return ''.join(f'{stack} {micros}\n' for stack, micros in sorted(folded.items()))
+
+
+class ProfileRing:
+    """Directory holding the newest ``keep`` request profiles."""
+
+    SUFFIXES = ('.prof', '.folded', '.json')
+
+    def __init__(self, directory, keep=100):
+        self.directory = directory
+        self.keep = keep
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _name(self, method, route):
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        return f'{stamp}-{os.getpid()}-{sequence:06d}-{method}-{slug}'
+
+    def save(self, profiler, method, route, summary):
+        os.makedirs(self.directory, exist_ok=True)
+        name = self._name(method, route)
+        base = os.path.join(self.directory, name)
+        profiler.dump_stats(base + '.prof')
+        with open(base + '.folded', 'w') as handle:
+            handle.write(collapsed_stacks(profiler))
+        with open(base + '.json', 'w') as handle:
+            json.dump(summary, handle, indent=2)
+        self.prune()
+        return name
+
+    def prune(self):
+        # Several processes may share the directory, so tolerate races
+        entries = sorted(
+            name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json')
+        )
+        for name in entries[:max(0, len(entries) - self.keep)]:
+            for suffix in self.SUFFIXES:
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def _sql_trace(queries, limit):
+    if queries is None:
+        return None
+    return {
+        'statements': queries.count,
+        'sql_ms': round(queries.seconds * 1000, 2),
+        'trace': [
+            {'method': tag, 'ms': round(seconds * 1000, 3), 'sql': ' '.join(sql.split())}
+            for tag, sql, seconds in queries.statements[:limit]
+        ]
+    }
+
+
+def install_profiling(app, secret='', sample_rate=0.0, directory='profiles', keep=100,
+                      slow_ms=0, sql_limit=50):
+    """Profile signed or sampled requests, and log requests over ``slow_ms``.
+
+    The SQL trace comes from the ``sql_queries`` that install_metrics keeps
+    on ``g`` when SQL tracing is on.
+    """
+    if not secret and not sample_rate and not slow_ms:
+        return app
+    ring = ProfileRing(directory, keep)
+    busy = threading.Lock()
+
+    def wanted():
+        token = request.headers.get(TOKEN_HEADER)
+        if token is not None:
+            return verify(secret, token, request.path)
+        return sample_rate > 0 and random.random() < sample_rate
+
+    @app.before_request
+    def start_profiler():
+        g.profile_started = time.perf_counter()
+        if (secret or sample_rate) and wanted() and busy.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is active in this interpreter
+                busy.release()
+                return
+            g.profiler = profiler
+
+    @app.after_request
+    def finish_profile(response):
+        started = g.pop('profile_started', None)
+        if started is None:
+            return response
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        profiler = g.pop('profiler', None)
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        sql = _sql_trace(g.get('sql_queries'), sql_limit)
+
+        if profiler is not None:
+            profiler.disable()
+            busy.release()
+            summary = {
+                'method': request.method,
+                'path': request.path,
+                'route': route,
+                'status': response.status_code,
+                'duration_ms': round(elapsed_ms, 2),
+                'sql': sql
+            }
+            try:
+                response.headers['X-Profile'] = ring.save(profiler, request.method, route, summary)
+            except OSError:
+                logger.exception('Could not write the profile of %s %s', request.method, request.path)
+
+        if slow_ms and elapsed_ms >= slow_ms:
+            lines = [f'Slow request: {request.method} {request.full_path.rstrip("?")} '
+                     f'-> {response.status_code} in {elapsed_ms:.0f} ms']
+            if sql is not None:
+                lines.append(f'{sql["statements"]} SQL statements, {sql["sql_ms"]} ms:')
+                lines.extend(f'  {item["ms"]:9.3f} ms  {item["method"]}: {item["sql"][:300]}'
+                             for item in sql['trace'])
+            logger.warning('\n'.join(lines))
+        return response
+
+    @app.teardown_request
+    def stop_profiler(error=None):
+        # after_request is skipped if the response could not be built
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            busy.release()
+
+    return app
+
+
+def main(argv=None):
+    import argparse
+    import config
+
+    parser = argparse.ArgumentParser(description='Print an X-Profile-Token for one path')
+    parser.add_argument('path', help='request path, e.g. /patient/patients/search')
+    parser.add_argument('--ttl', type=int, default=300, help='seconds the token stays valid')
+    args = parser.parse_args(argv)
+    if not config.PROFILE_SECRET:
+        print('PROFILE_SECRET is not set', file=sys.stderr)
+        return 1
+    print(f'{TOKEN_HEADER}: {sign(config.PROFILE_SECRET, args.path, args.ttl)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""asyncio gateway: the same routing table as gateway.py on aiohttp.
+
+Every upstream call is non-blocking, so one process can hold thousands of
+requests in flight; a semaphore per upstream caps how many reach each
+service at once.
+
+    python microservices/async_gateway.py [--port 5000]
+"""
+import argparse
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from aiohttp import web
+
+import config
+from proxy import ReplicaSet, HealthChecker, strip_hop_by_hop
+
+SERVICES = config.GATEWAY_SERVICES
+
+
+class AsyncUpstream:
+    def __init__(self, name, urls, pool_size=20, connect_timeout=2.0, read_timeout=30.0,
+                 max_concurrency=512, queue_timeout=5.0, strategy='least_outstanding'):
+        self.name = name
+        self.replicas = ReplicaSet(name, urls, strategy=strategy)
+        # Accepted for the options shared with gateway.py; the semaphore,
+        # not a per-host connection cap, bounds concurrency here
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        # ``connect`` also bounds the wait for a free pooled connection
+        self.timeout = aiohttp.ClientTimeout(connect=queue_timeout + connect_timeout,
+                                             sock_connect=connect_timeout, sock_read=read_timeout)
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.session = None
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def start(self):
+        # One connection per semaphore slot, spread over the replicas as needed
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=0,
+                                         keepalive_timeout=30)
+        # Pass bodies through byte for byte and never keep caller cookies
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            auto_decompress=False,
+            cookie_jar=aiohttp.DummyCookieJar()
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+async def forward_request(request, upstream, path):
+    """Forward the request to the upstream and stream its response back"""
+    try:
+        await asyncio.wait_for(upstream.semaphore.acquire(), timeout=upstream.queue_timeout)
+    except asyncio.TimeoutError:
+        upstream.rejected += 1
+        return web.json_response({'error': f'{upstream.name} service busy'}, status=503,
+                                 headers={'Retry-After': '1'})
+
+    upstream.in_flight += 1
+    try:
+        headers = strip_hop_by_hop(request.headers.items(), extra=('Host', 'Content-Length'))
+        replica = upstream.replicas.choose()
+        url = f'{replica.url}{path}'
+        if request.query_string:
+            url += '?' + request.query_string
+        proxied = None
+        started = replica.start()
+        error = True
+        try:
+            async with upstream.session.request(
+                request.method,
+                url,
+                headers=headers,
+                data=await request.read(),
+                allow_redirects=False
+            ) as response:
+                proxied = web.StreamResponse(
+                    status=response.status,
+                    headers=strip_hop_by_hop(response.headers.items())
+                )
+                await proxied.prepare(request)
+                async for chunk in response.content.iter_chunked(config.GATEWAY_STREAM_CHUNK_SIZE):
+                    await proxied.write(chunk)
+                await proxied.write_eof()
+                error = response.status >= 500
+                return proxied
+        except asyncio.TimeoutError:
+            upstream.replicas.record_failure(replica)
+            if proxied is not None and proxied.prepared:
+                raise
+            return web.json_response({'error': f'{upstream.name} service timed out'}, status=504)
+        except aiohttp.ClientConnectionError:
+            upstream.replicas.record_failure(replica)
+            if proxied is not None and proxied.prepared:
+                raise
+            return web.json_response({'error': f'{upstream.name} service unavailable'}, status=502)
+        finally:
+            replica.finish(started, error=error)
+    finally:
+        upstream.in_flight -= 1
+        upstream.semaphore.release()
+
+
+def make_handler(service_name):
+    async def handler(request):
+        upstream = request.app['upstreams'][service_name]
+        return await forward_request(request, upstream, f'/{service_name}/{request.match_info["path"]}')
+    return handler
+
+
+async def index(request):
+    return web.json_response({
+        'message': 'Hospital Management System API Gateway (asyncio)',
+        'services': {
+            name: {
+                'in_flight': upstream.in_flight,
+                'rejected': upstream.rejected,
+                **upstream.replicas.stats()
+            }
+            for name, upstream in request.app['upstreams'].items()
+        }
+    })
+
+
+def create_app():
+    app = web.Application()
+
+    async def start_upstreams(app):
+        app['upstreams'] = {}
+        for name, urls in SERVICES.items():
+            options = {
+                'pool_size': config.GATEWAY_POOL_SIZE,
+                'connect_timeout': config.GATEWAY_CONNECT_TIMEOUT,
+                'read_timeout': config.GATEWAY_READ_TIMEOUT,
+                'max_concurrency': config.GATEWAY_MAX_CONCURRENCY,
+                'queue_timeout': config.GATEWAY_QUEUE_TIMEOUT,
+                'strategy': config.GATEWAY_BALANCING,
+                **config.GATEWAY_UPSTREAM_OPTIONS.get(name, {})
+            }
+            upstream = AsyncUpstream(name, urls, **options)
+            await upstream.start()
+            app['upstreams'][name] = upstream
+
+        # Probes run on a thread so they never block the event loop
+        app['health_checker'] = HealthChecker(
+            [upstream.replicas for upstream in app['upstreams'].values()],
+            interval=config.GATEWAY_HEALTH_INTERVAL,
+            timeout=config.GATEWAY_HEALTH_TIMEOUT
+        ).start()
+
+    async def close_upstreams(app):
+        app['health_checker'].stop()
+        for upstream in app['upstreams'].values():
+            await upstream.close()
+
+    app.on_startup.append(start_upstreams)
+    app.on_cleanup.append(close_upstreams)
+
+    app.router.add_get('/', index)
+    for name in SERVICES:
+        for method in ('GET', 'POST', 'PUT', 'DELETE'):
+            app.router.add_route(method, f'/{name}/{{path:.*}}', make_handler(name))
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='asyncio API gateway')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port, backlog=4096)
@@ -1,93 +1,461 @@
-from flask import Flask, jsonify, request, redirect
-import requests
+import sys
+import os
+import json
+import time
+from urllib.parse import urlencode
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key'  # TODO: Move to config
+from flask import Flask, current_app, jsonify, request, Response
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+import config
+from metrics import REGISTRY, install_metrics, install_profiling
+from proxy import (Upstream, UpstreamError, ResponseCache, CacheEntry, HealthChecker,
+                   SingleFlight, Hedger, LatencyTracker, RetryBudget, RouteBudgets,
+                   DeadlineExceeded, FanOut, route_key, strip_hop_by_hop)
 
 # Service URLs
-SERVICES = {
-    'auth': 'http://localhost:5001',
-    'profile': 'http://localhost:5002',
-    'patient': 'http://localhost:5003',
-    'prescription': 'http://localhost:5004'
-}
+SERVICES = config.GATEWAY_SERVICES
+
+upstream_durations = REGISTRY.histogram(
+    'gateway_upstream_duration_seconds',
+    'Upstream call time until its response is closed, by service and route',
+    ('upstream', 'route', 'status')
+)
+
+def _observe_upstream(name, path, seconds, status):
+    upstream_durations.observe(seconds, name, route_key(path), status)
+
+class Gateway:
+    """Upstream sessions and proxy state shared by every request of one app."""
+
+    def __init__(self):
+        # One pooled keep-alive session per service, balanced across its replicas
+        self.upstreams = {
+            name: Upstream(name, urls, **{
+                'pool_size': config.GATEWAY_POOL_SIZE,
+                'connect_timeout': config.GATEWAY_CONNECT_TIMEOUT,
+                'read_timeout': config.GATEWAY_READ_TIMEOUT,
+                'strategy': config.GATEWAY_BALANCING,
+                'observe': _observe_upstream if config.METRICS_ENABLED else None,
+                **config.GATEWAY_UPSTREAM_OPTIONS.get(name, {})
+            })
+            for name, urls in SERVICES.items()
+        }
+
+        # Eject replicas that stop answering and re-admit them once they recover
+        self.health_checker = HealthChecker(
+            [upstream.replicas for upstream in self.upstreams.values()],
+            interval=config.GATEWAY_HEALTH_INTERVAL,
+            timeout=config.GATEWAY_HEALTH_TIMEOUT
+        )
+
+        # Optional cache of upstream GET responses, revalidated with ETags
+        self.response_cache = ResponseCache(
+            config.GATEWAY_CACHE_TTLS,
+            config.GATEWAY_CACHE_INVALIDATIONS,
+            max_bytes=config.GATEWAY_CACHE_MAX_BYTES,
+            max_entry_bytes=config.GATEWAY_CACHE_MAX_ENTRY_BYTES
+        ) if config.GATEWAY_CACHE_ENABLED else None
+
+        # Identical GETs in flight at the same time share one upstream call
+        self.single_flight = SingleFlight(
+            max_waiters=config.GATEWAY_COALESCE_MAX_WAITERS,
+            wait_timeout=config.GATEWAY_CONNECT_TIMEOUT + config.GATEWAY_READ_TIMEOUT
+        ) if config.GATEWAY_COALESCE_ENABLED else None
+
+        # Every request gets an overall deadline; GETs may be hedged within it
+        self.route_budgets = RouteBudgets(config.GATEWAY_DEADLINES, config.GATEWAY_DEADLINE)
+        self.hedger = Hedger(
+            LatencyTracker(),
+            RetryBudget(config.GATEWAY_RETRY_BUDGET_RATIO, config.GATEWAY_RETRY_BUDGET_MAX),
+            quantile=config.GATEWAY_HEDGE_QUANTILE,
+            min_samples=config.GATEWAY_HEDGE_MIN_SAMPLES,
+            min_delay=config.GATEWAY_HEDGE_MIN_DELAY,
+            max_workers=config.GATEWAY_HEDGE_WORKERS
+        ) if config.GATEWAY_HEDGING_ENABLED else None
+
+        # Composite endpoints call several services at once
+        self.fan_out = FanOut(max_workers=config.GATEWAY_AGGREGATE_WORKERS)
+
+    def buffer_limit(self):
+        limit = config.GATEWAY_COALESCE_MAX_BYTES
+        if self.response_cache is not None:
+            limit = max(limit, self.response_cache.max_entry_bytes)
+        return limit
+
+    def stats(self):
+        return {
+            'upstreams': {name: upstream.replicas.stats() for name, upstream in self.upstreams.items()},
+            'response_cache': self.response_cache.stats() if self.response_cache is not None else None,
+            'coalescing': self.single_flight.stats() if self.single_flight is not None else None,
+            'hedging': self.hedger.stats() if self.hedger is not None else None,
+            'aggregates': self.fan_out.stats()
+        }
+
+def _gateway():
+    return current_app.extensions['gateway']
+
+# Conditional headers are answered by the gateway for shared responses, so
+# one caller's If-None-Match never turns into another caller's 304
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+def _proxy_headers(extra=None, drop=()):
+    headers = dict(strip_hop_by_hop(request.headers.items(), extra=('Host', 'Content-Length') + tuple(drop)))
+    if extra:
+        headers.update(extra)
+    return headers
+
+def _stream(response, prefix=b''):
+    # Relay the body chunk by chunk instead of buffering it in the gateway.
+    # Content-Encoding and Content-Length pass through untouched.
+    def generate():
+        if prefix:
+            # Chunked bodies cannot switch to stream() after a partial read
+            yield prefix
+            while True:
+                chunk = response.raw.read(config.GATEWAY_STREAM_CHUNK_SIZE, decode_content=False)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            for chunk in response.raw.stream(config.GATEWAY_STREAM_CHUNK_SIZE, decode_content=False):
+                yield chunk
+
+    proxied = Response(
+        generate(),
+        status=response.status_code,
+        headers=strip_hop_by_hop(response.raw.headers.items())
+    )
+    # Not in the generator: HEAD, 204 and 304 bodies are closed without being started
+    proxied.call_on_close(response.close)
+    return proxied
+
+class _Unbuffered(Exception):
+    """Raised by the leader of a shared GET whose body is too large to buffer."""
+
+    def __init__(self, response, prefix):
+        super().__init__('Response too large to share')
+        self.response = response
+        self.prefix = prefix
+
+def _from_cache(entry, outcome=None):
+    if entry.status == 200 and entry.etag and request.if_none_match.contains_raw(entry.etag):
+        response = Response(status=304, headers={'ETag': entry.etag})
+    else:
+        response = Response(entry.body, status=entry.status, headers=entry.headers)
+    if outcome:
+        response.headers['X-Cache'] = outcome
+    return response
+
+def _timeout(upstream, remaining):
+    if remaining <= 0:
+        raise DeadlineExceeded('Gateway deadline exceeded')
+    connect_timeout, read_timeout = upstream.timeout
+    return (min(connect_timeout, remaining), min(read_timeout, remaining))
+
+def _fetch_buffered(upstream, path, query_string, headers, limit, remaining, replica=None):
+    # Runs on hedge worker threads too, so it must not touch the request
+    response = upstream.request(
+        method='GET',
+        path=path,
+        query_string=query_string,
+        headers=headers,
+        timeout=_timeout(upstream, remaining),
+        replica=replica
+    )
+    try:
+        body = response.raw.read(limit + 1, decode_content=False)
+    except (ReadTimeoutError, ProtocolError) as e:
+        upstream.replicas.record_failure(response.replica)
+        response.close()
+        if isinstance(e, ReadTimeoutError):
+            raise UpstreamError(504, f'{upstream.name} service timed out')
+        raise UpstreamError(502, f'{upstream.name} service unavailable')
+    if len(body) > limit:
+        raise _Unbuffered(response, body)
+    response.close()
+    return CacheEntry(response.status_code, strip_hop_by_hop(response.raw.headers.items()), body,
+                      response.headers.get('ETag'), 0)
+
+def _fetch(gateway, upstream, path, extra, limit, deadline, query_string=None, headers=None):
+    if query_string is None:
+        query_string = request.query_string
+    if headers is None:
+        headers = _proxy_headers(extra, drop=CONDITIONAL_HEADERS)
+    hedger = gateway.hedger
+    if hedger is None:
+        return _fetch_buffered(upstream, path, query_string, headers, limit,
+                               deadline - time.monotonic())
+
+    def attempt(replica, remaining):
+        try:
+            return _fetch_buffered(upstream, path, query_string, headers, limit, remaining, replica)
+        except _Unbuffered as e:
+            return e
+
+    def discard(result):
+        if isinstance(result, _Unbuffered):
+            result.response.close()
+
+    result = hedger.call(route_key(path), attempt, upstream.replicas.choose, deadline, discard)
+    if isinstance(result, _Unbuffered):
+        raise result
+    return result
+
+def _shared_get(gateway, upstream, path, deadline, extra=None):
+    """GET ``path`` once for every identical request currently in flight.
+
+    Returns ``(entry, shared)``. Bodies over the buffer limit are streamed
+    to the leader, and waiters fall back to their own upstream call.
+    """
+    key = ResponseCache.key(
+        path,
+        request.query_string,
+        request.headers.get('Authorization'),
+        request.headers.get('Accept')
+    ) + (tuple(sorted(extra.items())) if extra else ())
+    limit = gateway.buffer_limit()
+    if gateway.single_flight is None:
+        return _fetch(gateway, upstream, path, extra, limit, deadline), False
+
+    led = []
+    def fetch():
+        led.append(True)
+        return _fetch(gateway, upstream, path, extra, limit, deadline)
+
+    try:
+        return gateway.single_flight.do(key, fetch)
+    except _Unbuffered:
+        if led:
+            raise
+        # The leader is streaming its own response; fetch our own copy
+        return _fetch(gateway, upstream, path, extra, limit, deadline), False
+
+def _cached_get(gateway, upstream, path, ttl, deadline):
+    response_cache = gateway.response_cache
+    key = ResponseCache.key(
+        path,
+        request.query_string,
+        request.headers.get('Authorization'),
+        request.headers.get('Accept')
+    )
+    entry = response_cache.get(key)
+    if entry is not None and entry.fresh:
+        return _from_cache(entry, 'HIT')
+
+    # Expired entries are revalidated instead of refetched
+    extra = {'If-None-Match': entry.etag} if entry is not None and entry.etag else None
+    fetched, _ = _shared_get(gateway, upstream, path, deadline, extra)
+    if fetched.status == 304 and entry is not None:
+        response_cache.refresh(entry)
+        return _from_cache(entry, 'REVALIDATED')
+    if fetched.status != 200 or len(fetched.body) > response_cache.max_entry_bytes or \
+            'no-store' in dict(fetched.headers).get('Cache-Control', ''):
+        return _from_cache(fetched)
+
+    entry = CacheEntry(200, fetched.headers, fetched.body, fetched.etag, ttl)
+    response_cache.put(key, entry)
+    return _from_cache(entry, 'MISS')
 
 def forward_request(service_name, path):
     """Forward the request to the appropriate service"""
-    if service_name not in SERVICES:
+    gateway = _gateway()
+    if service_name not in gateway.upstreams:
         return jsonify({'error': 'Service not found'}), 404
-    
-    service_url = SERVICES[service_name]
-    target_url = f"{service_url}{path}"
-    
-    # Forward the request with the same method and data
-    response = requests.request(
-        method=request.method,
-        url=target_url,
-        headers={key: value for key, value in request.headers if key != 'Host'},
-        data=request.get_data(),
-        cookies=request.cookies,
-        allow_redirects=False
-    )
-    
-    return response.content, response.status_code, response.headers.items()
-
-# Route for auth service
-@app.route('/auth/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
-def auth_service(path):
-    return forward_request('auth', f'/auth/{path}')
-
-# Route for profile service
-@app.route('/profile/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
-def profile_service(path):
-    return forward_request('profile', f'/profile/{path}')
-
-# Route for patient service
-@app.route('/patient/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
-def patient_service(path):
-    return forward_request('patient', f'/patient/{path}')
-
-# Route for prescription service
-@app.route('/prescription/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
-def prescription_service(path):
-    return forward_request('prescription', f'/prescription/{path}')
-
-@app.route('/')
+    upstream = gateway.upstreams[service_name]
+    response_cache = gateway.response_cache
+
+    deadline = time.monotonic() + gateway.route_budgets.for_path(path)
+
+    # Forward the request with the same method, query and data
+    try:
+        if request.method == 'GET':
+            ttl = response_cache.ttl_for(path) if response_cache is not None else None
+            if ttl is not None:
+                return _cached_get(gateway, upstream, path, ttl, deadline)
+            if gateway.single_flight is not None or gateway.hedger is not None:
+                entry, shared = _shared_get(gateway, upstream, path, deadline)
+                response = _from_cache(entry)
+                if shared:
+                    response.headers['X-Coalesced'] = 'shared'
+                return response
+
+        response = upstream.request(
+            method=request.method,
+            path=path,
+            query_string=request.query_string,
+            headers=_proxy_headers(),
+            data=request.get_data(),
+            timeout=_timeout(upstream, deadline - time.monotonic())
+        )
+    except _Unbuffered as e:
+        return _stream(e.response, prefix=e.prefix)
+    except UpstreamError as e:
+        return jsonify({'error': e.message}), e.status
+    except TimeoutError as e:
+        return jsonify({'error': str(e)}), 504
+
+    if response_cache is not None and request.method != 'GET' and response.status_code < 400:
+        response_cache.invalidate_for_write(path)
+
+    return _stream(response)
+
+def _part(gateway, service_name, path, query_string=b''):
+    """Build a fan-out call that GETs ``path`` as the current caller and
+    returns ``(status, decoded JSON body)``."""
+    upstream = gateway.upstreams[service_name]
+    headers = _proxy_headers(drop=CONDITIONAL_HEADERS + ('Accept', 'Accept-Encoding'))
+    headers['Accept'] = 'application/json'
+    limit = gateway.buffer_limit()
+
+    def call(remaining):
+        deadline = time.monotonic() + remaining
+        try:
+            entry = _fetch(gateway, upstream, path, None, limit, deadline, query_string, headers)
+        except _Unbuffered as e:
+            e.response.close()
+            raise UpstreamError(502, f'{service_name} response too large to aggregate')
+        return entry.status, json.loads(entry.body) if entry.body else None
+
+    return call
+
+def _aggregate(gateway, calls):
+    """Run ``calls`` concurrently and merge their bodies into one response.
+
+    Each part's body sits under its own key, and ``parts`` reports
+    per-part status. The response is 200 when every part succeeded, 207
+    when only some did, and the shared status when all failed the same way.
+    """
+    parts = gateway.fan_out.run(calls, time.monotonic() + config.GATEWAY_AGGREGATE_DEADLINE)
+
+    body = {}
+    report = {}
+    statuses = set()
+    for name, part in parts.items():
+        if part.timed_out or isinstance(part.error, TimeoutError):
+            status, error = 504, 'Deadline exceeded'
+        elif part.error is not None:
+            status = getattr(part.error, 'status', 502)
+            error = getattr(part.error, 'message', None) or str(part.error)
+        else:
+            status, data = part.value
+            error = None
+            if status < 400:
+                body[name] = data
+            else:
+                error = (data or {}).get('message') if isinstance(data, dict) else None
+                error = error or 'Upstream error'
+        statuses.add(status)
+        report[name] = {'status': status, 'ok': error is None}
+        if error is not None:
+            report[name]['error'] = error
+        if part.elapsed is not None:
+            report[name]['elapsed_ms'] = round(part.elapsed * 1000, 2)
+
+    body['parts'] = report
+    if all(item['ok'] for item in report.values()):
+        return jsonify(body), 200
+    if not any(item['ok'] for item in report.values()) and len(statuses) == 1:
+        return jsonify(body), statuses.pop()
+    return jsonify(body), 207
+
+def patient_chart(patient_id):
+    """Caller profile, patient record and prescriptions in one round trip"""
+    gateway = _gateway()
+    return _aggregate(gateway, {
+        'profile': _part(gateway, 'profile', '/profile/profile'),
+        'patient': _part(gateway, 'patient', f'/patient/patients/{patient_id}'),
+        'prescriptions': _part(gateway, 'prescription', f'/prescription/patients/{patient_id}/prescriptions')
+    })
+
+def doctor_worklist():
+    """Doctor's profile and their active patients, paged like patient search"""
+    gateway = _gateway()
+    args = [('status', 'active'), ('mine', '1')]
+    args += [(key, request.args[key]) for key in ('page', 'per_page') if key in request.args]
+    query_string = urlencode(args)
+    return _aggregate(gateway, {
+        'profile': _part(gateway, 'profile', '/profile/profile'),
+        'patients': _part(gateway, 'patient', '/patient/patients/search', query_string)
+    })
+
+def proxy_service(service_name, path):
+    return forward_request(service_name, f'/{service_name}/{path}')
+
+def gateway_stats():
+    return jsonify(_gateway().stats())
+
 def index():
     return jsonify({
         'message': 'Hospital Management System API Gateway',
+        'aggregates': {
+            'patient_chart': '/gateway/patients/<id>/chart',
+            'doctor_worklist': '/gateway/worklist'
+        },
+        'metrics': '/metrics',
         'services': {
             'auth': {
-                'url': SERVICES['auth'],
+                'urls': SERVICES['auth'],
                 'endpoints': {
                     'register': '/auth/register',
                     'login': '/auth/login'
                 }
             },
             'profile': {
-                'url': SERVICES['profile'],
+                'urls': SERVICES['profile'],
                 'endpoints': {
                     'get_profile': '/profile/profile',
                     'get_all_users': '/profile/users'
                 }
             },
             'patient': {
-                'url': SERVICES['patient'],
+                'urls': SERVICES['patient'],
                 'endpoints': {
+                    'get_patient': '/patient/patients/<id>',
                     'update_diagnosis': '/patient/patients/<id>/diagnosis',
-                    'discharge': '/patient/patients/<id>/discharge'
+                    'discharge': '/patient/patients/<id>/discharge',
+                    'census': '/patient/census'
                 }
             },
             'prescription': {
-                'url': SERVICES['prescription'],
+                'urls': SERVICES['prescription'],
                 'endpoints': {
                     'create': '/prescription/prescriptions',
                     'complete': '/prescription/prescriptions/<id>/complete',
-                    'get_patient_prescriptions': '/prescription/patients/<id>/prescriptions'
+                    'get_patient_prescriptions': '/prescription/patients/<id>/prescriptions',
+                    'patient_workload': '/prescription/patients/<id>/workload',
+                    'doctor_workload': '/prescription/doctors/<id>/workload'
                 }
             }
         }
     })
 
+def create_app():
+    """Build the app and its upstream sessions and start the replica health
+    checks. Importing this module does neither."""
+    app = Flask(__name__)
+    app.secret_key = 'your-secret-key'  # TODO: Move to config
+    app.extensions['gateway'] = gateway = Gateway()
+    gateway.health_checker.start()
+
+    # Prometheus metrics at /metrics, plus per-upstream histograms
+    if config.METRICS_ENABLED:
+        install_metrics(app)
+
+    # Profiles of signed or sampled requests, and logs of slow ones
+    install_profiling(app, secret=config.PROFILE_SECRET, sample_rate=config.PROFILE_SAMPLE_RATE,
+                      directory=config.PROFILE_DIR, keep=config.PROFILE_KEEP,
+                      slow_ms=config.SLOW_REQUEST_MS)
+
+    app.add_url_rule('/gateway/patients/<int:patient_id>/chart', view_func=patient_chart)
+    app.add_url_rule('/gateway/worklist', view_func=doctor_worklist)
+    # One proxy route per service
+    for name in SERVICES:
+        app.add_url_rule(f'/{name}/<path:path>', endpoint=f'{name}_service', view_func=proxy_service,
+                         defaults={'service_name': name}, methods=['GET', 'POST', 'PUT', 'DELETE'])
+    app.add_url_rule('/gateway/stats', view_func=gateway_stats)
+    app.add_url_rule('/', view_func=index)
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    create_app().run(debug=config.DEBUG, port=int(config.PORT or 5000)) 
\ No newline at end of file
@@ -3,24 +3,47 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask, jsonify
+import config
+from metrics import install_metrics, install_profiling
+from models.database.hospital_db import sql_tracer
 from routes.prescription import prescription_bp
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key'  # TODO: Move to config
-
-# Register prescription blueprint
-app.register_blueprint(prescription_bp, url_prefix='/prescription')
-
-@app.route('/')
 def index():
     return jsonify({
         'service': 'Prescription Service',
         'endpoints': {
             'create': '/prescription/prescriptions',
+            'create_batch': '/prescription/prescriptions/batch',
             'complete': '/prescription/prescriptions/<id>/complete',
-            'get_patient_prescriptions': '/prescription/patients/<id>/prescriptions'
-        }
+            'get_patient_prescriptions': '/prescription/patients/<id>/prescriptions',
+            'patient_workload': '/prescription/patients/<id>/workload',
+            'doctor_workload': '/prescription/doctors/<id>/workload'
+        },
+        'metrics': '/metrics'
     })
 
+def create_app():
+    """Build the app. Nothing here touches the database, which is opened
+    on first use."""
+    app = Flask(__name__)
+    app.secret_key = 'your-secret-key'  # TODO: Move to config
+
+    # Register prescription blueprint
+    app.register_blueprint(prescription_bp, url_prefix='/prescription')
+
+    # Prometheus metrics at /metrics
+    if config.METRICS_ENABLED:
+        install_metrics(app, sql_tracer=sql_tracer, n_plus_one=config.METRICS_N_PLUS_ONE_STATEMENTS)
+
+    # Profiles of signed or sampled requests, and logs of slow ones
+    install_profiling(app, secret=config.PROFILE_SECRET, sample_rate=config.PROFILE_SAMPLE_RATE,
+                      directory=config.PROFILE_DIR, keep=config.PROFILE_KEEP,
+                      slow_ms=config.SLOW_REQUEST_MS)
+
+    app.add_url_rule('/', view_func=index)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5004) 
\ No newline at end of file
+    app.run(debug=config.DEBUG, port=int(config.PORT or 5004)) 
\ No newline at end of file
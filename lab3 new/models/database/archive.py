@@ -0,0 +1,187 @@
+"""Move cold rows out of the hot ``patients`` and ``prescriptions`` tables.
+
+A prescription is cold once it was completed more than ``older_than_days``
+ago; a patient once they were discharged that long ago and have no
+prescriptions left in the hot table. Cold rows move to ``*_archive`` tables
+in the same file, one short transaction per batch, so writers are never
+blocked for long. ``patients_all`` and ``prescriptions_all`` are views over
+both sets for the requests that ask for history.
+
+Run ``python -m models.database.archive [hospital.db] [--days 90]
+[--batch 500] [--dry-run]`` from the project root.
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+from .rollups import ARCHIVE_AWARE_PATIENT_DELETE
+
+PATIENT_COLUMNS = ('id, user_id, doctor_id, admission_date, discharge_date, '
+                   'current_diagnosis, final_diagnosis')
+PRESCRIPTION_COLUMNS = ('id, patient_id, doctor_id, prescription_type, description, status, '
+                        'created_at, completed_at, completed_by')
+
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS patients_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER UNIQUE,
+        doctor_id INTEGER,
+        admission_date TIMESTAMP,
+        discharge_date TIMESTAMP,
+        current_diagnosis TEXT,
+        final_diagnosis TEXT,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS prescriptions_archive (
+        id INTEGER PRIMARY KEY,
+        patient_id INTEGER NOT NULL,
+        doctor_id INTEGER NOT NULL,
+        prescription_type TEXT NOT NULL,
+        description TEXT NOT NULL,
+        status TEXT,
+        created_at TIMESTAMP,
+        completed_at TIMESTAMP,
+        completed_by INTEGER,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_patients_archive_doctor_id ON patients_archive (doctor_id)',
+    'CREATE INDEX IF NOT EXISTS idx_prescriptions_archive_patient_status_created '
+    'ON prescriptions_archive (patient_id, status, created_at)',
+    f'''
+    CREATE VIEW IF NOT EXISTS patients_all AS
+    SELECT {PATIENT_COLUMNS} FROM patients
+    UNION ALL
+    SELECT {PATIENT_COLUMNS} FROM patients_archive
+    ''',
+    f'''
+    CREATE VIEW IF NOT EXISTS prescriptions_all AS
+    SELECT {PRESCRIPTION_COLUMNS} FROM prescriptions
+    UNION ALL
+    SELECT {PRESCRIPTION_COLUMNS} FROM prescriptions_archive
+    ''',
+    'DROP TRIGGER IF EXISTS rollup_patients_ad',
+    ARCHIVE_AWARE_PATIENT_DELETE,
+]
+
+# When a row of the named table is cold; the parameter is the cutoff
+COLD_PRESCRIPTIONS = "status = 'completed' AND completed_at < ?"
+COLD_PATIENTS = (
+    'discharge_date IS NOT NULL AND discharge_date < ? '
+    'AND NOT EXISTS (SELECT 1 FROM prescriptions r WHERE r.patient_id = patients.id)'
+)
+
+
+def create_archive(conn):
+    for statement in ARCHIVE_SCHEMA:
+        conn.execute(statement)
+
+
+def _cold_ids(conn, table, cold, cutoff, after, batch_size):
+    # Read without the write lock. Walking the ids from where the last
+    # batch ended makes the whole run one pass over the table
+    return [row[0] for row in conn.execute(
+        f'SELECT id FROM {table} WHERE id > ? AND {cold} ORDER BY id LIMIT ?',
+        (after, cutoff, batch_size)
+    )]
+
+
+def _move(conn, table, columns, cold, cutoff, ids):
+    # Rows found by primary key only; those that changed since they were
+    # picked are no longer cold and stay where they are
+    placeholders = ', '.join('?' * len(ids))
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(
+            f'INSERT INTO {table}_archive ({columns}) '
+            f'SELECT {columns} FROM {table} WHERE id IN ({placeholders}) AND {cold}', ids + [cutoff]
+        )
+        moved = conn.execute(f'DELETE FROM {table} WHERE id IN ({placeholders}) AND {cold}',
+                             ids + [cutoff]).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return moved
+
+
+def count_cold_rows(database, older_than_days=90, now=None):
+    cutoff = ((now or datetime.now()) - timedelta(days=older_than_days)).isoformat(sep=' ')
+    with database.connection() as conn:
+        prescriptions = conn.execute(
+            "SELECT COUNT(*) FROM prescriptions WHERE status = 'completed' AND completed_at < ?",
+            (cutoff,)
+        ).fetchone()[0]
+        # Patients that become eligible once their cold prescriptions move
+        patients = conn.execute('''
+            SELECT COUNT(*) FROM patients p
+            WHERE p.discharge_date IS NOT NULL AND p.discharge_date < ?
+            AND NOT EXISTS (
+                SELECT 1 FROM prescriptions r WHERE r.patient_id = p.id
+                AND NOT (r.status = 'completed' AND r.completed_at < ?)
+            )
+        ''', (cutoff, cutoff)).fetchone()[0]
+    return {'prescriptions': prescriptions, 'patients': patients}
+
+
+def archive_cold_rows(database, older_than_days=90, batch_size=500, pause=0.05, now=None):
+    """Archive every cold row, ``batch_size`` rows per transaction.
+
+    Prescriptions go first so their patients become eligible in the same
+    run. Each batch is picked before its transaction starts, so the write
+    lock is only held for lookups by id. Sleeps ``pause`` seconds between
+    batches to let other writers in. Returns the number of rows moved per
+    table.
+    """
+    cutoff = ((now or datetime.now()) - timedelta(days=older_than_days)).isoformat(sep=' ')
+    moved = {'prescriptions': 0, 'patients': 0}
+    with database.connection() as conn:
+        for table, columns, cold in (
+            ('prescriptions', PRESCRIPTION_COLUMNS, COLD_PRESCRIPTIONS),
+            ('patients', PATIENT_COLUMNS, COLD_PATIENTS),
+        ):
+            after = 0
+            while True:
+                ids = _cold_ids(conn, table, cold, cutoff, after, batch_size)
+                if ids:
+                    moved[table] += _move(conn, table, columns, cold, cutoff, ids)
+                if len(ids) < batch_size:
+                    break
+                after = ids[-1]
+                time.sleep(pause)
+    return moved
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    options = {'--days': 90, '--batch': 500}
+    args = []
+    dry_run = False
+    iterator = iter(argv)
+    for arg in iterator:
+        if arg == '--dry-run':
+            dry_run = True
+        elif arg in options:
+            options[arg] = int(next(iterator))
+        else:
+            args.append(arg)
+    db_name = args[0] if args else 'hospital.db'
+
+    from .base import Database
+    database = Database(db_name)
+    if dry_run:
+        counts = count_cold_rows(database, options['--days'])
+        print(f'Would archive {counts["prescriptions"]} prescriptions and '
+              f'{counts["patients"]} patients older than {options["--days"]} days')
+    else:
+        moved = archive_cold_rows(database, options['--days'], options['--batch'])
+        print(f'Archived {moved["prescriptions"]} prescriptions and {moved["patients"]} patients')
+    database.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,83 +1,361 @@
+import logging
+import queue
 import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from .migrations import LATEST_VERSION, current_version, migrate, table_exists
+from .tracing import TracedCursor
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+class PooledConnection:
+    """Wrapper around a pooled sqlite3 connection.
+
+    Behaves like the raw connection, except that ``close()`` hands the
+    connection back to the pool instead of closing the file handle.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+        self.checked_out_at = time.monotonic()
+        self.checkout_stack = traceback.extract_stack()[:-3] if pool.track_stacks else None
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool._return(self)
+
+    def __del__(self):
+        # A caller dropped the connection without closing it. Reclaim it so
+        # the pool does not shrink, but record it as a leak.
+        if not getattr(self, '_released', True):
+            try:
+                self._pool._reclaim(self)
+            except Exception:
+                pass
+
+
+class TracedConnection(PooledConnection):
+    """Pooled connection that reports every statement to a SqlTracer."""
+
+    def execute(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return self._conn.execute(sql, *args)
+        finally:
+            self._pool.tracer.record(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return self._conn.executemany(sql, *args)
+        finally:
+            self._pool.tracer.record(sql, time.perf_counter() - started)
+
+    def cursor(self, *args):
+        return TracedCursor(self._pool.tracer, self._conn.cursor(*args))
+
+
+class ConnectionPool:
+    """Bounded checkout/return pool of SQLite connections.
+
+    Connections that are held longer than ``leak_timeout`` are reported by
+    ``check_leaks()``; wrappers that are garbage collected without being
+    closed are reclaimed and counted in ``stats()['leaks']``. Set
+    ``track_stacks`` to log where a leaked connection was checked out.
+    With a ``tracer`` every statement is timed (see tracing.SqlTracer).
+    """
+
+    PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'temp_store': 'MEMORY',
+        'cache_size': -16000,
+        'mmap_size': 268435456,
+        'busy_timeout': 5000,
+    }
+
+    def __init__(self, db_name, max_size=8, timeout=10.0, leak_timeout=30.0,
+                 track_stacks=False, pragmas=None, tracer=None):
+        self.db_name = db_name
+        self.tracer = tracer
+        self.max_size = max_size
+        self.timeout = timeout
+        self.leak_timeout = leak_timeout
+        self.track_stacks = track_stacks
+        self.pragmas = dict(self.PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        # id(wrapper) -> (checkout time, stack); keyed by id() so that the
+        # registry never keeps a leaked wrapper alive.
+        self._checked_out = {}
+        self._created = 0
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'leaks': 0,
+            'discarded': 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False,
+                               timeout=self.pragmas['busy_timeout'] / 1000)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self):
+        if self._closed:
+            raise PoolExhaustedError('Connection pool is closed')
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.max_size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                with self._lock:
+                    self._stats['waits'] += 1
+                self.check_leaks()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolExhaustedError(
+                        f'No connection available after {self.timeout}s '
+                        f'({self.max_size} in use)'
+                    )
+
+        pooled = (TracedConnection if self.tracer is not None else PooledConnection)(self, conn)
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._checked_out[id(pooled)] = (pooled.checked_out_at, pooled.checkout_stack)
+        return pooled
+
+    def _return(self, pooled):
+        conn = pooled._conn
+        pooled._conn = None
+        with self._lock:
+            self._checked_out.pop(id(pooled), None)
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        if self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+            self._stats['discarded'] += 1
+
+    def _reclaim(self, pooled):
+        with self._lock:
+            self._stats['leaks'] += 1
+        stack = ''.join(traceback.format_list(pooled.checkout_stack)) if pooled.checkout_stack else ''
+        logger.warning('SQLite connection was never closed; reclaimed by pool.\n%s', stack)
+        pooled._released = True
+        self._return(pooled)
+
+    def check_leaks(self):
+        """Log connections held longer than ``leak_timeout`` seconds."""
+        now = time.monotonic()
+        with self._lock:
+            held = [
+                (now - started, stack)
+                for started, stack in self._checked_out.values()
+                if now - started > self.leak_timeout
+            ]
+        for age, stack in held:
+            logger.warning(
+                'SQLite connection checked out for %.1fs (possible leak).\n%s',
+                age, ''.join(traceback.format_list(stack)) if stack else ''
+            )
+        return len(held)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'max_size': self.max_size,
+                'created': self._created,
+                'in_use': len(self._checked_out),
+                'idle': self._idle.qsize(),
+            })
+        return stats
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
 
 class Database:
-    def __init__(self, db_name='hospital.db'):
+    def __init__(self, db_name='hospital.db', pool_size=8, pool_timeout=10.0, leak_timeout=30.0,
+                 pragmas=None, tracer=None):
         self.db_name = db_name
+        self.has_fts = False
+        self.tracer = tracer
+        self.pool = ConnectionPool(
+            db_name,
+            max_size=pool_size,
+            timeout=pool_timeout,
+            leak_timeout=leak_timeout,
+            pragmas=pragmas,
+            tracer=tracer
+        )
         self.init_db()
 
     def get_connection(self):
-        conn = sqlite3.connect(self.db_name)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Check a connection out of the pool. ``close()`` returns it."""
+        return self.pool.acquire()
+
+    @contextmanager
+    def connection(self):
+        """Pooled connection that is rolled back on error and always returned."""
+        conn = self.pool.acquire()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def close(self):
+        self.pool.close()
 
     def init_db(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Create users table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL,
-            name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-
-        # Create doctors table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS doctors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE,
-            specialization TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        ''')
-
-        # Create nurses table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS nurses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE,
-            department TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        ''')
-
-        # Create patients table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS patients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE,
-            doctor_id INTEGER,
-            admission_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            discharge_date TIMESTAMP,
-            current_diagnosis TEXT,
-            final_diagnosis TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (doctor_id) REFERENCES doctors (id)
-        )
-        ''')
-
-        # Create prescriptions table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS prescriptions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            doctor_id INTEGER NOT NULL,
-            prescription_type TEXT NOT NULL,
-            description TEXT NOT NULL,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            completed_at TIMESTAMP,
-            completed_by INTEGER,
-            FOREIGN KEY (patient_id) REFERENCES patients (id),
-            FOREIGN KEY (doctor_id) REFERENCES doctors (id),
-            FOREIGN KEY (completed_by) REFERENCES users (id)
-        )
-        ''')
+        with self.connection() as conn:
+            # An up-to-date file needs no DDL at all
+            if table_exists(conn, 'schema_version') and current_version(conn) >= LATEST_VERSION:
+                self.has_fts = table_exists(conn, 'patient_search')
+                return
+
+            cursor = conn.cursor()
+
+            # Create users table
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                role TEXT NOT NULL,
+                name TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+
+            # Create doctors table
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS doctors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER UNIQUE,
+                specialization TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+            ''')
+
+            # Create nurses table
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS nurses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER UNIQUE,
+                department TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+            ''')
+
+            # Create patients table
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS patients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER UNIQUE,
+                doctor_id INTEGER,
+                admission_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                discharge_date TIMESTAMP,
+                current_diagnosis TEXT,
+                final_diagnosis TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (doctor_id) REFERENCES doctors (id)
+            )
+            ''')
+
+            # Create prescriptions table
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prescriptions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                patient_id INTEGER NOT NULL,
+                doctor_id INTEGER NOT NULL,
+                prescription_type TEXT NOT NULL,
+                description TEXT NOT NULL,
+                status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP,
+                completed_by INTEGER,
+                FOREIGN KEY (patient_id) REFERENCES patients (id),
+                FOREIGN KEY (doctor_id) REFERENCES doctors (id),
+                FOREIGN KEY (completed_by) REFERENCES users (id)
+            )
+            ''')
+
+            conn.commit()
 
-        conn.commit()
-        conn.close()
\ No newline at end of file
+            # Indexes and later schema changes are versioned migrations
+            migrate(conn)
+            self.has_fts = table_exists(conn, 'patient_search')
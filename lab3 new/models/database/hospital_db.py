@@ -1,13 +1,154 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from metrics import REGISTRY
 from .base import Database
+from .tracing import SqlTracer, tag_methods, carry_tag
+from .write_queue import WriteQueue
+from .sharding import ShardMap, shard_paths, reserve_prescription_ids
 from .managers.user_manager import UserManager
 from .managers.patient_manager import PatientManager
 from .managers.prescription_manager import PrescriptionManager
 
 class HospitalDatabase:
-    def __init__(self, db_name='hospital.db'):
-        self.db = Database(db_name)
+    def __init__(self, db_name='hospital.db', group_commit=False, write_queue_options=None,
+                 tracer=None, shards=1, **pool_options):
+        self.tracer = tracer
+        self.db = Database(db_name, tracer=tracer, **pool_options)
+        # With shards, db_name is the catalog and patient data lives in the shard files
+        self.shard_map = None
+        self.shards = [self.db]
+        self._scatter_pool = None
+        if shards > 1:
+            self.shards = [Database(path, tracer=tracer, **pool_options)
+                           for path in shard_paths(db_name, shards)]
+            for index, shard in enumerate(self.shards):
+                reserve_prescription_ids(shard, index)
+            self.shard_map = ShardMap(self.db, shards)
+            self._scatter_pool = ThreadPoolExecutor(max_workers=shards, thread_name_prefix='shard')
+        # Opt-in: route single-row writes through one group-committing writer per shard
+        self.write_queues = [WriteQueue(shard, **(write_queue_options or {})) for shard in self.shards] \
+            if group_commit else None
+        self.writes = self.write_queues[0] if group_commit else None
         self.users = UserManager(self)
         self.patients = PatientManager(self)
         self.prescriptions = PrescriptionManager(self)
+        if tracer is not None:
+            for manager in (self.users, self.patients, self.prescriptions):
+                tag_methods(manager)
+
+    @property
+    def has_fts(self):
+        return self.shards[0].has_fts
+
+    def patient_shard(self, patient_id):
+        """Index into ``shards`` of the file holding ``patient_id``, or ``None``."""
+        if self.shard_map is None:
+            return 0
+        return self.shard_map.shard_of(patient_id)
+
+    def user_shard(self, user_id):
+        if self.shard_map is None:
+            return 0
+        return self.shard_map.shard_of_user(user_id)
+
+    def scatter(self, fn):
+        """Run ``fn(shard)`` on every shard in parallel; results in shard order."""
+        if self._scatter_pool is None:
+            return [fn(self.db)]
+        futures = [self._scatter_pool.submit(contextvars.copy_context().run, fn, shard)
+                   for shard in self.shards]
+        return [future.result() for future in futures]
+
+    def write(self, op, *args, shard=0):
+        """Run ``op(conn, *args)`` on ``shards[shard]`` and commit, returning its result.
+
+        With group commit the write joins the writer thread's next batch;
+        otherwise it runs in its own transaction on a pooled connection.
+        """
+        if self.write_queues is not None:
+            if self.tracer is not None:
+                op = carry_tag(op)
+            return self.write_queues[shard].call(op, *args)
+        with self.shards[shard].connection() as conn:
+            result = op(conn, *args)
+            conn.commit()
+        return result
+
+    def shard_stats(self):
+        if self.shard_map is None:
+            return None
+        counts = self.shard_map.counts()
+        return [{
+            'patients': counts[index],
+            'db_pool': shard.pool_stats(),
+            'write_queue': self.write_queues[index].stats() if self.write_queues is not None else None
+        } for index, shard in enumerate(self.shards)]
+
+    def close(self):
+        for queue in self.write_queues or []:
+            queue.close()
+        if self._scatter_pool is not None:
+            self._scatter_pool.shutdown()
+        for shard in self.shards:
+            if shard is not self.db:
+                shard.close()
+        self.db.close()
+
+class LazyDatabase:
+    """Stands in for a HospitalDatabase that is created on first use.
+
+    Importing the routes never opens SQLite: the file is opened, and its
+    schema checked, by the first attribute access. ``close()`` drops the
+    instance so the next access opens it again.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    # Open and migrate in an empty context so the schema DDL is
+                    # not counted as SQL of the request that happened to come first
+                    self._instance = contextvars.Context().run(self._factory)
+                instance = self._instance
+        return instance
+
+    @property
+    def initialized(self):
+        return self._instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def close(self):
+        with self._lock:
+            instance, self._instance = self._instance, None
+        if instance is not None:
+            instance.close()
+
+# SQL timing is exported at /metrics, so the tracer outlives any one database
+sql_tracer = SqlTracer(REGISTRY) if config.METRICS_ENABLED else None
+
+def create_database(db_name=None):
+    return HospitalDatabase(
+        db_name or config.DB_PATH,
+        group_commit=config.DB_GROUP_COMMIT,
+        tracer=sql_tracer,
+        shards=config.DB_SHARDS,
+        write_queue_options={
+            'max_batch': config.DB_GROUP_COMMIT_MAX_BATCH,
+            'max_delay': config.DB_GROUP_COMMIT_MAX_DELAY,
+            'max_pending': config.DB_WRITE_QUEUE_SIZE,
+            'timeout': config.DB_WRITE_TIMEOUT
+        }
+    )
 
-db = HospitalDatabase()
\ No newline at end of file
+db = LazyDatabase(create_database)
\ No newline at end of file
@@ -1,76 +1,293 @@
-from datetime import datetime
+import heapq
+import re
+from datetime import date, datetime, timedelta
+
+
+def _parse_day(value):
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        try:
+            return date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+
+
+def _match_terms(text):
+    # Every word becomes a quoted prefix term, so user input can never be
+    # parsed as FTS5 query syntax
+    return ' '.join(f'"{token}"*' for token in re.findall(r'\w+', text))
+
 
 class PatientManager:
     def __init__(self, db):
         self.db = db
 
     def get_patient_by_user_id(self, user_id):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM patients WHERE user_id = ?', (user_id,))
-        patient = cursor.fetchone()
-        
+        shard = self.db.user_shard(user_id)
+        if shard is None:
+            return None
+        with self.db.shards[shard].connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM patients WHERE user_id = ?', (user_id,))
+            patient = cursor.fetchone()
+
         if patient:
             return dict(patient)
         return None
 
-    def get_patient_by_id(self, patient_id):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM patients WHERE id = ?', (patient_id,))
-        patient = cursor.fetchone()
-        conn.close()
+    def get_patients_by_user_ids(self, user_ids, catalog_conn=None):
+        """``{user_id: patient}`` for the given users, read from each shard in parallel.
+
+        ``catalog_conn`` is a catalog connection the caller already holds,
+        used for the directory lookup.
+        """
+        if not user_ids:
+            return {}
+        if self.db.shard_map is None:
+            groups = {0: list(user_ids)}
+        else:
+            groups = self.db.shard_map.group_by_shard('user_id', user_ids, catalog_conn)
+
+        def fetch(shard):
+            index = self.db.shards.index(shard)
+            wanted = groups.get(index, [])
+            patients = []
+            with shard.connection() as conn:
+                for start in range(0, len(wanted), 500):
+                    chunk = wanted[start:start + 500]
+                    placeholders = ', '.join('?' * len(chunk))
+                    patients.extend(conn.execute(
+                        f'SELECT * FROM patients WHERE user_id IN ({placeholders})', chunk
+                    ).fetchall())
+            return patients
+
+        return {patient['user_id']: dict(patient)
+                for patients in self.db.scatter(fetch) for patient in patients}
+
+    def get_patient_by_id(self, patient_id, include_archive=False):
+        table = 'patients_all' if include_archive else 'patients'
+        shard = self.db.patient_shard(patient_id)
+        if shard is None:
+            return None
+        with self.db.shards[shard].connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT * FROM {table} WHERE id = ?', (patient_id,))
+            patient = cursor.fetchone()
+        return dict(patient) if patient else None
+
+    def get_patient_details(self, patient_id, include_archive=False):
+        table = 'patients_all' if include_archive else 'patients'
+        shard = self.db.patient_shard(patient_id)
+        if shard is None:
+            return None
+        with self.db.shards[shard].connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT p.*, u.name as patient_name
+                FROM {table} p
+                JOIN users u ON p.user_id = u.id
+                WHERE p.id = ?
+            ''', (patient_id,))
+            patient = cursor.fetchone()
         return dict(patient) if patient else None
 
+    def get_census(self, day=None):
+        """Patients admitted right now, plus admissions and discharges on ``day``."""
+        day = day or date.today()
+
+        def read(shard):
+            with shard.connection() as conn:
+                admitted = conn.execute('SELECT admitted FROM census WHERE id = 1').fetchone()
+                daily = conn.execute(
+                    'SELECT admissions, discharges FROM daily_census WHERE day = ?', (day.isoformat(),)
+                ).fetchone()
+            return (
+                admitted['admitted'] if admitted else 0,
+                daily['admissions'] if daily else 0,
+                daily['discharges'] if daily else 0
+            )
+
+        admitted, admissions, discharges = (sum(column) for column in zip(*self.db.scatter(read)))
+        return {
+            'admitted': admitted,
+            'date': day.isoformat(),
+            'admissions': admissions,
+            'discharges': discharges
+        }
+
     def discharge_patient(self, patient_id, final_diagnosis):
-        conn = self.db.db.get_connection()
+        shard = self.db.patient_shard(patient_id)
+        if shard is None:
+            return None
+        patient = self.db.write(self._discharge_patient, patient_id, final_diagnosis, shard=shard)
+        if patient:
+            self.db.users.invalidate_profile(patient['user_id'])
+        return patient
+
+    def _discharge_patient(self, conn, patient_id, final_diagnosis):
         cursor = conn.cursor()
         try:
             cursor.execute(
                 'UPDATE patients SET discharge_date = ?, final_diagnosis = ? WHERE id = ?',
                 (datetime.now(), final_diagnosis, patient_id)
             )
-            conn.commit()
-            return self.get_patient_by_id(patient_id)
         except Exception as e:
-            conn.rollback()
             return None
-        finally:
-            conn.close()
 
-    def search_patients(self, name='', diagnosis='', status='', admission_date=''):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        
-        query = '''
-            SELECT p.*, u.name as patient_name 
-            FROM patients p
+        cursor.execute('SELECT * FROM patients WHERE id = ?', (patient_id,))
+        patient = cursor.fetchone()
+        return dict(patient) if patient else None
+
+    def search_patients(self, name='', diagnosis='', status='', admission_date='',
+                        page=None, per_page=None, doctor_id=None, include_archive=False):
+        """Filter patients; ``page``/``per_page`` (1-based) return one page.
+
+        ``doctor_id`` limits the results to one doctor's patients, and
+        ``include_archive`` adds archived patients (LIKE matching only).
+
+        Name and diagnosis use the FTS5 index (prefix matching, bm25 ranking)
+        when SQLite supports it, and substring LIKE matching otherwise.
+        """
+        name_terms = _match_terms(name) if name else ''
+        diagnosis_terms = _match_terms(diagnosis) if diagnosis else ''
+        use_fts = (
+            not include_archive
+            and self.db.has_fts
+            and (name_terms or diagnosis_terms)
+            and bool(name_terms) == bool(name)
+            and bool(diagnosis_terms) == bool(diagnosis)
+        )
+        if use_fts:
+            return self._search_patients_fts(name_terms, diagnosis_terms, status,
+                                             admission_date, page, per_page, doctor_id)
+        return self._search_patients_like(name, diagnosis, status, admission_date,
+                                          page, per_page, doctor_id,
+                                          'patients_all' if include_archive else 'patients')
+
+    def _search_patients_like(self, name, diagnosis, status, admission_date,
+                              page=None, per_page=None, doctor_id=None, table='patients'):
+        query = f'''
+            SELECT p.*, u.name as patient_name
+            FROM {table} p
             JOIN users u ON p.user_id = u.id
             WHERE 1=1
         '''
         params = []
-        
+
         if name:
             query += ' AND u.name LIKE ?'
             params.append(f'%{name}%')
-            
+
         if diagnosis:
             query += ' AND (p.current_diagnosis LIKE ? OR p.final_diagnosis LIKE ?)'
             params.extend([f'%{diagnosis}%', f'%{diagnosis}%'])
-            
+
+        filters = self._status_and_date_filters(status, admission_date, doctor_id)
+        if filters is None:
+            return []
+        query += filters[0]
+        params.extend(filters[1])
+
+        if page is not None or self.db.shard_map is not None:
+            query += ' ORDER BY p.id'
+        return self._fetch_page(query, params, page, per_page, key=lambda patient: patient['id'])
+
+    def _search_patients_fts(self, name_terms, diagnosis_terms, status, admission_date,
+                             page=None, per_page=None, doctor_id=None):
+        match = []
+        if name_terms:
+            match.append(f'name : ({name_terms})')
+        if diagnosis_terms:
+            match.append(f'{{current_diagnosis final_diagnosis}} : ({diagnosis_terms})')
+
+        query = '''
+            SELECT p.*, u.name as patient_name, bm25(patient_search) as search_rank
+            FROM patient_search s
+            JOIN patients p ON p.id = s.rowid
+            JOIN users u ON p.user_id = u.id
+            WHERE patient_search MATCH ?
+        '''
+        params = [' AND '.join(match)]
+
+        filters = self._status_and_date_filters(status, admission_date, doctor_id)
+        if filters is None:
+            return []
+        query += filters[0]
+        params.extend(filters[1])
+
+        query += ' ORDER BY search_rank, p.id'
+        patients = self._fetch_page(query, params, page, per_page,
+                                    key=lambda patient: (patient['search_rank'], patient['id']))
+        for patient in patients:
+            del patient['search_rank']
+        return patients
+
+    def _status_and_date_filters(self, status, admission_date, doctor_id=None):
+        query = ''
+        params = []
+
+        if doctor_id is not None:
+            query += ' AND p.doctor_id = ?'
+            params.append(doctor_id)
+
         if status:
             if status.lower() == 'active':
                 query += ' AND p.discharge_date IS NULL'
             elif status.lower() == 'discharged':
                 query += ' AND p.discharge_date IS NOT NULL'
-                
+
         if admission_date:
-            query += ' AND DATE(p.admission_date) = DATE(?)'
-            params.append(admission_date)
-            
-        cursor.execute(query, params)
-        patients = cursor.fetchall()
-        conn.close()
-        
-        return [dict(patient) for patient in patients]
\ No newline at end of file
+            # Half-open range on the raw column so idx_patients_admission_date applies
+            day = _parse_day(admission_date)
+            if day is None:
+                return None
+            query += ' AND p.admission_date >= ? AND p.admission_date < ?'
+            params.extend([day.isoformat(), (day + timedelta(days=1)).isoformat()])
+
+        return query, params
+
+    def _fetch_page(self, query, params, page, per_page, key):
+        if self.db.shard_map is None:
+            if page is not None:
+                query += ' LIMIT ? OFFSET ?'
+                params = list(params) + [per_page, (page - 1) * per_page]
+            with self.db.db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, params)
+                patients = cursor.fetchall()
+            return [dict(patient) for patient in patients]
+
+        # Every shard returns its first page * per_page matches in the same
+        # order; the requested page is cut from their merge
+        if page is not None:
+            query += ' LIMIT ?'
+            params = list(params) + [page * per_page]
+
+        def fetch(shard):
+            with shard.connection() as conn:
+                return [dict(patient) for patient in conn.execute(query, params).fetchall()]
+
+        patients = list(heapq.merge(*self.db.scatter(fetch), key=key))
+        if page is not None:
+            patients = patients[(page - 1) * per_page:page * per_page]
+        return patients
+
+    def update_diagnosis(self, user_id, diagnosis):
+        shard = self.db.user_shard(user_id)
+        if shard is None:
+            return False
+        updated = self.db.write(self._update_diagnosis, user_id, diagnosis, shard=shard)
+        if updated:
+            self.db.users.invalidate_profile(user_id)
+        return updated
+
+    def _update_diagnosis(self, conn, user_id, diagnosis):
+        try:
+            conn.execute(
+                'UPDATE patients SET current_diagnosis = ? WHERE user_id = ?',
+                (diagnosis, user_id)
+            )
+            return True
+        except Exception as e:
+            return False
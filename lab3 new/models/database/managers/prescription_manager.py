@@ -1,55 +1,260 @@
+import sqlite3
 from datetime import datetime
 from models.enums.user_enums import PrescriptionType
+from models.database.sharding import next_prescription_ids
 
 class PrescriptionManager:
     def __init__(self, db):
         self.db = db
 
     def add_prescription(self, patient_id, doctor_id, prescription_type, description):
-        conn = self.db.db.get_connection()
+        shard = self.db.patient_shard(patient_id)
+        if shard is None:
+            return None
+        return self.db.write(self._add_prescription, patient_id, doctor_id,
+                             prescription_type, description, shard=shard)
+
+    def _new_ids(self, conn, count):
+        """``count`` new prescription ids, taken on ``conn`` while it holds the write lock."""
+        if self.db.shard_map is not None:
+            first = next_prescription_ids(conn, count)
+        else:
+            # The ids AUTOINCREMENT would hand out next; archived rows are
+            # counted through sqlite_sequence
+            first = conn.execute(
+                "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'prescriptions'), 0), "
+                'COALESCE((SELECT MAX(id) FROM prescriptions), 0)) + 1'
+            ).fetchone()[0]
+        return list(range(first, first + count))
+
+    def _add_prescription(self, conn, patient_id, doctor_id, prescription_type, description):
         cursor = conn.cursor()
         try:
+            # A single file leaves the id to AUTOINCREMENT, so this insert
+            # needs no write lock beforehand
+            prescription_id = self._new_ids(conn, 1)[0] if self.db.shard_map is not None else None
+            # A patient moved to another shard meanwhile is no longer here
             cursor.execute(
-                'INSERT INTO prescriptions (patient_id, doctor_id, prescription_type, description) VALUES (?, ?, ?, ?)',
-                (patient_id, doctor_id, prescription_type.value, description)
+                'INSERT INTO prescriptions (id, patient_id, doctor_id, prescription_type, description) '
+                'SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM patients WHERE id = ?)',
+                (prescription_id, patient_id, doctor_id, prescription_type.value,
+                 description, patient_id)
             )
-            prescription_id = cursor.lastrowid
-            conn.commit()
-            return self.get_prescription(prescription_id)
         except Exception as e:
-            conn.rollback()
             return None
-        finally:
-            conn.close()
+        if cursor.rowcount == 0:
+            return None
 
-    def get_prescription(self, prescription_id):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM prescriptions WHERE id = ?', (prescription_id,))
+        cursor.execute('SELECT * FROM prescriptions WHERE id = ?', (cursor.lastrowid,))
         prescription = cursor.fetchone()
-        conn.close()
         return dict(prescription) if prescription else None
 
-    def get_patient_prescriptions(self, patient_id):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM prescriptions WHERE patient_id = ?', (patient_id,))
-        prescriptions = cursor.fetchall()
-        conn.close()
+    def add_prescriptions(self, doctor_id, items):
+        """Create many prescriptions for one doctor in a single transaction.
+
+        ``items`` is a list of ``(patient_id, prescription_type, description)``.
+        Items whose patient does not exist are skipped. Returns
+        ``(created, missing)``: the created rows, one per inserted item in
+        input order (``None`` for skipped items), and the set of unknown
+        patient ids. With shards each shard commits on its own, and the
+        items of a shard whose transaction failed come back as ``None``
+        without their patient being in ``missing``.
+        """
+        if not items:
+            return [], set()
+
+        patient_ids = list({patient_id for patient_id, _, _ in items})
+        if self.db.shard_map is None:
+            return self._add_prescriptions(self.db.db, doctor_id, items, patient_ids)
+
+        # One transaction per shard, written in parallel
+        groups = self.db.shard_map.group_by_shard('patient_id', patient_ids)
+
+        def add(shard):
+            wanted = set(groups.get(self.db.shards.index(shard), ()))
+            positions = [position for position, item in enumerate(items) if item[0] in wanted]
+            if not positions:
+                return [], [], set()
+            try:
+                created, missing = self._add_prescriptions(
+                    shard, doctor_id, [items[position] for position in positions], list(wanted)
+                )
+            except sqlite3.Error:
+                # Other shards may already have committed; report these items as not created
+                return positions, [None] * len(positions), set()
+            return positions, created, missing
+
+        created = [None] * len(items)
+        missing = set(patient_ids) - {patient_id for group in groups.values() for patient_id in group}
+        for positions, shard_created, shard_missing in self.db.scatter(add):
+            for position, prescription in zip(positions, shard_created):
+                created[position] = prescription
+            missing |= shard_missing
+        return created, missing
+
+    def _add_prescriptions(self, database, doctor_id, items, patient_ids):
+        with database.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            existing = set()
+            for start in range(0, len(patient_ids), 500):
+                chunk = patient_ids[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                rows = conn.execute(
+                    f'SELECT id FROM patients WHERE id IN ({placeholders})', chunk
+                ).fetchall()
+                existing.update(row['id'] for row in rows)
+
+            valid = [item for item in items if item[0] in existing]
+            ids = self._new_ids(conn, len(valid)) if valid else []
+            rows = {}
+            if valid:
+                conn.executemany(
+                    'INSERT INTO prescriptions (id, patient_id, doctor_id, prescription_type, description) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [(prescription_id, patient_id, doctor_id, prescription_type.value, description)
+                     for prescription_id, (patient_id, prescription_type, description) in zip(ids, valid)]
+                )
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ', '.join('?' * len(chunk))
+                    rows.update((row['id'], dict(row)) for row in conn.execute(
+                        f'SELECT * FROM prescriptions WHERE id IN ({placeholders})', chunk
+                    ))
+            conn.commit()
+
+        ids = iter(ids)
+        created = [rows[next(ids)] if item[0] in existing else None for item in items]
+        return created, set(patient_ids) - existing
+
+    def get_prescription(self, prescription_id):
+        def find(shard):
+            with shard.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM prescriptions WHERE id = ?', (prescription_id,))
+                return cursor.fetchone()
+
+        for prescription in self.db.scatter(find):
+            if prescription:
+                return dict(prescription)
+        return None
+
+    def _prescription_shard(self, prescription_id):
+        if self.db.shard_map is None:
+            return 0
+
+        def holds(shard):
+            with shard.connection() as conn:
+                return conn.execute('SELECT 1 FROM prescriptions WHERE id = ?',
+                                    (prescription_id,)).fetchone() is not None
+
+        found = self.db.scatter(holds)
+        return found.index(True) if True in found else None
+
+    def get_patient_prescriptions(self, patient_id, status=None, prescription_type=None,
+                                  created_from=None, created_to=None, after=None, limit=None,
+                                  descending=False, include_archive=False):
+        """A patient's prescriptions, optionally filtered and paginated.
+
+        ``created_from``/``created_to`` bound ``created_at`` as a half-open
+        range. Filtered or paginated results are ordered by
+        ``(created_at, id)``; ``after`` is the ``(created_at, id)`` of the
+        last row of the previous page. Archived prescriptions are only
+        included with ``include_archive``.
+        """
+        where, params = self._history_filters(patient_id, status, prescription_type,
+                                              created_from, created_to)
+        table = 'prescriptions_all' if include_archive else 'prescriptions'
+        query = f'SELECT * FROM {table} WHERE {where}'
+        if after is not None or limit is not None or descending:
+            direction = 'DESC' if descending else 'ASC'
+            if after is not None:
+                query += f' AND (created_at, id) {"<" if descending else ">"} (?, ?)'
+                params.extend(after)
+            query += f' ORDER BY created_at {direction}, id {direction}'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        shard = self.db.patient_shard(patient_id)
+        if shard is None:
+            return []
+        with self.db.shards[shard].connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            prescriptions = cursor.fetchall()
         return [dict(prescription) for prescription in prescriptions]
 
+    def count_patient_prescriptions(self, patient_id, status=None, prescription_type=None,
+                                    created_from=None, created_to=None, include_archive=False):
+        where, params = self._history_filters(patient_id, status, prescription_type,
+                                              created_from, created_to)
+        table = 'prescriptions_all' if include_archive else 'prescriptions'
+        shard = self.db.patient_shard(patient_id)
+        if shard is None:
+            return 0
+        with self.db.shards[shard].connection() as conn:
+            row = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {where}', params).fetchone()
+        return row[0]
+
+    def _history_filters(self, patient_id, status, prescription_type, created_from, created_to):
+        where = 'patient_id = ?'
+        params = [patient_id]
+        if status:
+            where += ' AND status = ?'
+            params.append(status)
+        if prescription_type:
+            where += ' AND prescription_type = ?'
+            params.append(prescription_type.value)
+        if created_from:
+            where += ' AND created_at >= ?'
+            params.append(created_from)
+        if created_to:
+            where += ' AND created_at < ?'
+            params.append(created_to)
+        return where, params
+
+    def get_doctor_workload(self, doctor_id):
+        def read(shard):
+            with shard.connection() as conn:
+                row = conn.execute(
+                    'SELECT pending_prescriptions FROM doctor_workload WHERE doctor_id = ?', (doctor_id,)
+                ).fetchone()
+            return row['pending_prescriptions'] if row else 0
+
+        return {
+            'doctor_id': doctor_id,
+            'pending_prescriptions': sum(self.db.scatter(read))
+        }
+
+    def get_patient_workload(self, patient_id):
+        shard = self.db.patient_shard(patient_id)
+        with self.db.shards[shard or 0].connection() as conn:
+            row = conn.execute(
+                'SELECT pending_prescriptions, open_procedures FROM patient_workload WHERE patient_id = ?',
+                (patient_id,)
+            ).fetchone()
+        return {
+            'patient_id': patient_id,
+            'pending_prescriptions': row['pending_prescriptions'] if row else 0,
+            'open_procedures': row['open_procedures'] if row else 0
+        }
+
     def complete_prescription(self, prescription_id, completed_by):
-        conn = self.db.db.get_connection()
+        shard = self._prescription_shard(prescription_id)
+        if shard is None:
+            return None
+        return self.db.write(self._complete_prescription, prescription_id, completed_by, shard=shard)
+
+    def _complete_prescription(self, conn, prescription_id, completed_by):
         cursor = conn.cursor()
         try:
             cursor.execute(
                 'UPDATE prescriptions SET status = ?, completed_at = ?, completed_by = ? WHERE id = ?',
                 ('completed', datetime.now(), completed_by, prescription_id)
             )
-            conn.commit()
-            return self.get_prescription(prescription_id)
         except Exception as e:
-            conn.rollback()
             return None
-        finally:
-            conn.close()
\ No newline at end of file
+
+        cursor.execute('SELECT * FROM prescriptions WHERE id = ?', (prescription_id,))
+        prescription = cursor.fetchone()
+        return dict(prescription) if prescription else None
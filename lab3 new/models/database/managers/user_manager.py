@@ -1,113 +1,394 @@
 import sqlite3
 from models.enums.user_enums import UserRole
+from models.database.cache import LRUCache
 
 class UserManager:
+    # Each process keeps its own cache, so writes made by another service
+    # become visible once the entry's TTL runs out
+    CACHE_SIZE = 4096
+    CACHE_TTL = 60.0
+    # Profiles include diagnoses written by the patient service, so they
+    # expire sooner than the user rows
+    PROFILE_CACHE_TTL = 5.0
+
     def __init__(self, db):
         self.db = db
+        self.cache = LRUCache(maxsize=self.CACHE_SIZE, ttl=self.CACHE_TTL)
+        self.profiles = LRUCache(maxsize=self.CACHE_SIZE, ttl=self.PROFILE_CACHE_TTL)
+
+    def invalidate_user(self, user_id):
+        self.cache.invalidate(user_id)
+        self.profiles.invalidate(user_id)
+
+    def invalidate_profile(self, user_id):
+        self.profiles.invalidate(user_id)
 
     def add_user(self, username, password, role, name, **kwargs):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute(
-                'INSERT INTO users (username, password, role, name) VALUES (?, ?, ?, ?)',
-                (username, password, role.value, name)
-            )
-            user_id = cursor.lastrowid
+        with self.db.db.connection() as conn:
+            cursor = conn.cursor()
+            pending = []
 
-            if role == UserRole.DOCTOR:
-                cursor.execute(
-                    'INSERT INTO doctors (user_id, specialization) VALUES (?, ?)',
-                    (user_id, kwargs.get('specialization', ''))
-                )
-            elif role == UserRole.NURSE:
+            try:
                 cursor.execute(
-                    'INSERT INTO nurses (user_id, department) VALUES (?, ?)',
-                    (user_id, kwargs.get('department', ''))
-                )
-            elif role == UserRole.PATIENT:
-                cursor.execute(
-                    'INSERT INTO patients (user_id, doctor_id) VALUES (?, ?)',
-                    (user_id, kwargs.get('doctor_id'))
+                    'INSERT INTO users (username, password, role, name) VALUES (?, ?, ?, ?)',
+                    (username, password, role.value, name)
                 )
+                user_id = cursor.lastrowid
+
+                if role == UserRole.DOCTOR:
+                    cursor.execute(
+                        'INSERT INTO doctors (user_id, specialization) VALUES (?, ?)',
+                        (user_id, kwargs.get('specialization', ''))
+                    )
+                elif role == UserRole.NURSE:
+                    cursor.execute(
+                        'INSERT INTO nurses (user_id, department) VALUES (?, ?)',
+                        (user_id, kwargs.get('department', ''))
+                    )
+                elif role == UserRole.PATIENT:
+                    pending = self._insert_patients(conn, [(user_id, kwargs.get('doctor_id'))])
+
+                conn.commit()
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                return None
+
+            try:
+                for shard, patients, users in pending:
+                    self._write_shard(shard, patients, users)
+            except sqlite3.IntegrityError:
+                return None
+
+            self.invalidate_user(user_id)
+            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+            user = cursor.fetchone()
+            return dict(user) if user else None
 
+    def find_existing_usernames(self, usernames):
+        """Return the subset of ``usernames`` already taken, in one query."""
+        with self.db.db.connection() as conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS import_usernames (username TEXT PRIMARY KEY)')
+            conn.execute('DELETE FROM temp.import_usernames')
+            conn.executemany(
+                'INSERT OR IGNORE INTO temp.import_usernames (username) VALUES (?)',
+                ((username,) for username in usernames)
+            )
+            rows = conn.execute(
+                'SELECT u.username FROM users u JOIN temp.import_usernames i ON i.username = u.username'
+            ).fetchall()
+            conn.execute('DELETE FROM temp.import_usernames')
             conn.commit()
-            return self.get_user(user_id)
-        except sqlite3.IntegrityError:
-            conn.rollback()
-            return None
-        finally:
-            conn.close()
+        return {row['username'] for row in rows}
+
+    def add_users_bulk(self, records, chunk_size=1000):
+        """Insert users and their role rows, one transaction per chunk.
+
+        ``records`` are dicts with the add_user arguments (``role`` as a
+        UserRole, ``password`` already hashed). When a chunk hits a
+        constraint error it is retried row by row so only the offending rows
+        fail. Returns ``(imported, failures)`` where failures are
+        ``(position, message)`` pairs indexing into ``records``.
+        """
+        imported = 0
+        failures = []
+        with self.db.db.connection() as conn:
+            for start in range(0, len(records), chunk_size):
+                chunk = records[start:start + chunk_size]
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    pending = self._insert_users(conn, chunk)
+                    conn.commit()
+                    imported += len(chunk)
+                except sqlite3.IntegrityError:
+                    conn.rollback()
+                    conn.execute('BEGIN IMMEDIATE')
+                    pending = []
+                    for offset, record in enumerate(chunk):
+                        conn.execute('SAVEPOINT import_row')
+                        try:
+                            pending.extend(self._insert_users(conn, [record]))
+                            imported += 1
+                        except sqlite3.IntegrityError as e:
+                            conn.execute('ROLLBACK TO import_row')
+                            failures.append((start + offset, str(e)))
+                        conn.execute('RELEASE import_row')
+                    conn.commit()
+
+                positions = {record['username']: start + offset for offset, record in enumerate(chunk)}
+                for shard, patients, users in pending:
+                    try:
+                        self._write_shard(shard, patients, users)
+                    except sqlite3.Error as e:
+                        imported -= len(users)
+                        failures.extend((positions[user[1]], str(e)) for user in users)
+        failures.sort()
+        return imported, failures
+
+    def _insert_users(self, conn, records):
+        conn.executemany(
+            'INSERT INTO users (username, password, role, name) VALUES (?, ?, ?, ?)',
+            [(r['username'], r['password'], r['role'].value, r['name']) for r in records]
+        )
+        user_ids = {}
+        usernames = [r['username'] for r in records]
+        for start in range(0, len(usernames), 500):
+            chunk = usernames[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            for row in conn.execute(
+                f'SELECT id, username FROM users WHERE username IN ({placeholders})', chunk
+            ):
+                user_ids[row['username']] = row['id']
+
+        doctors, nurses, patients = [], [], []
+        for r in records:
+            user_id = user_ids[r['username']]
+            if r['role'] == UserRole.DOCTOR:
+                doctors.append((user_id, r.get('specialization', '')))
+            elif r['role'] == UserRole.NURSE:
+                nurses.append((user_id, r.get('department', '')))
+            elif r['role'] == UserRole.PATIENT:
+                patients.append((user_id, r.get('doctor_id')))
+
+        if doctors:
+            conn.executemany('INSERT INTO doctors (user_id, specialization) VALUES (?, ?)', doctors)
+        if nurses:
+            conn.executemany('INSERT INTO nurses (user_id, department) VALUES (?, ?)', nurses)
+        return self._insert_patients(conn, patients) if patients else []
+
+    def _insert_patients(self, conn, patients):
+        """Add ``(user_id, doctor_id)`` patient rows for users just inserted on ``conn``.
+
+        With shards, ``conn`` is the catalog and only gets each patient's
+        directory entry. The patient rows and name-only user copies are
+        returned as ``(shard, patients, users)`` groups for ``_write_shard``
+        once the catalog has committed.
+        """
+        if self.db.shard_map is None:
+            conn.executemany('INSERT INTO patients (user_id, doctor_id) VALUES (?, ?)', patients)
+            return []
+
+        groups = {}
+        for user_id, doctor_id in patients:
+            patient_id, shard = self.db.shard_map.allocate(conn, user_id)
+            groups.setdefault(shard, []).append((patient_id, user_id, doctor_id))
+        users = {}
+        user_ids = [user_id for user_id, _ in patients]
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            for row in conn.execute(
+                f'SELECT id, username, role, name FROM users WHERE id IN ({placeholders})', chunk
+            ):
+                users[row['id']] = tuple(row)
+
+        return [(shard, rows, [users[user_id] for _, user_id, _ in rows])
+                for shard, rows in groups.items()]
+
+    def _write_shard(self, shard, patients, users):
+        """Insert one group returned by ``_insert_patients``. If the shard
+        fails, the users' committed catalog rows are deleted again."""
+        try:
+            with self.db.shards[shard].connection() as shard_conn:
+                shard_conn.execute('BEGIN IMMEDIATE')
+                shard_conn.executemany(
+                    "INSERT INTO users (id, username, password, role, name) VALUES (?, ?, '', ?, ?)", users
+                )
+                shard_conn.executemany(
+                    'INSERT INTO patients (id, user_id, doctor_id) VALUES (?, ?, ?)', patients
+                )
+                shard_conn.commit()
+        except sqlite3.Error:
+            user_ids = [user_id for _, user_id, _ in patients]
+            with self.db.db.connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                for start in range(0, len(user_ids), 500):
+                    chunk = user_ids[start:start + 500]
+                    placeholders = ', '.join('?' * len(chunk))
+                    conn.execute(f'DELETE FROM patient_shards WHERE user_id IN ({placeholders})', chunk)
+                    conn.execute(f'DELETE FROM users WHERE id IN ({placeholders})', chunk)
+                conn.commit()
+            for patient_id, user_id, _ in patients:
+                self.db.shard_map.patients.invalidate(patient_id)
+                self.invalidate_user(user_id)
+            raise
 
     def get_user(self, user_id):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
-        
+        cached = self.cache.get(user_id)
+        if cached is not None:
+            return dict(cached)
+
+        with self.db.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+            user = cursor.fetchone()
+
         if user:
+            user = dict(user)
+            self.cache.set(user_id, user)
             return dict(user)
         return None
 
+    def get_profile(self, user_id):
+        """The user's public fields plus their role-specific ones, in one query."""
+        cached = self.profiles.get(user_id)
+        if cached is not None:
+            return dict(cached)
+
+        with self.db.db.connection() as conn:
+            row = conn.execute('''
+                SELECT u.id, u.username, u.role, u.name,
+                       d.id AS doctor_row_id, d.specialization,
+                       n.id AS nurse_row_id, n.department,
+                       p.id AS patient_row_id, p.admission_date, p.discharge_date,
+                       p.current_diagnosis, p.final_diagnosis
+                FROM users u
+                LEFT JOIN doctors d ON d.user_id = u.id
+                LEFT JOIN nurses n ON n.user_id = u.id
+                LEFT JOIN patients p ON p.user_id = u.id
+                WHERE u.id = ?
+            ''', (user_id,)).fetchone()
+
+        if not row:
+            return None
+
+        profile = {
+            'id': row['id'],
+            'username': row['username'],
+            'role': row['role'],
+            'name': row['name']
+        }
+        role = UserRole(row['role'])
+        patient = row if row['patient_row_id'] is not None else None
+        if role == UserRole.PATIENT and self.db.shard_map is not None:
+            patient = self.db.patients.get_patient_by_user_id(user_id)
+        if role == UserRole.DOCTOR and row['doctor_row_id'] is not None:
+            profile['specialization'] = row['specialization']
+        elif role == UserRole.NURSE and row['nurse_row_id'] is not None:
+            profile['department'] = row['department']
+        elif role == UserRole.PATIENT and patient is not None:
+            profile['admission_date'] = patient['admission_date']
+            profile['discharge_date'] = patient['discharge_date']
+            profile['current_diagnosis'] = patient['current_diagnosis']
+            profile['final_diagnosis'] = patient['final_diagnosis']
+
+        self.profiles.set(user_id, profile)
+        return dict(profile)
+
+    def update_password(self, user_id, password):
+        with self.db.db.connection() as conn:
+            conn.execute('UPDATE users SET password = ? WHERE id = ?', (password, user_id))
+            conn.commit()
+        self.invalidate_user(user_id)
+
     def get_user_by_username(self, username):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-        user = cursor.fetchone()
-        
+        with self.db.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
+            user = cursor.fetchone()
+
         if user:
             return dict(user)
         return None
 
-    def get_all_users(self):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users')
-        users = cursor.fetchall()
-        
-        result = []
-        for user in users:
-            user_dict = dict(user)
-            if UserRole(user_dict['role']) == UserRole.DOCTOR:
-                doctor = self.get_doctor_by_user_id(user_dict['id'])
-                if doctor:
-                    user_dict['specialization'] = doctor['specialization']
-            elif UserRole(user_dict['role']) == UserRole.NURSE:
-                nurse = self.get_nurse_by_user_id(user_dict['id'])
-                if nurse:
-                    user_dict['department'] = nurse['department']
-            elif UserRole(user_dict['role']) == UserRole.PATIENT:
-                patient = self.db.patients.get_patient_by_user_id(user_dict['id'])
-                if patient:
-                    user_dict['admission_date'] = patient['admission_date']
-                    user_dict['discharge_date'] = patient['discharge_date']
-            result.append(user_dict)
-        
-        conn.close()
-        return result
+    def get_all_users(self, after_id=None, limit=None):
+        """Users with their role-specific fields, ordered by id.
+
+        ``after_id``/``limit`` give keyset pagination: pass the last id of
+        the previous page to get the next one.
+        """
+        query, params = self._user_listing_query(after_id, limit)
+        with self.db.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            users = cursor.fetchall()
+
+        return self._listing_rows(users)
+
+    def iter_all_users(self, after_id=None, limit=None, chunk_size=500):
+        """Stream the same rows as get_all_users, ``chunk_size`` at a time.
+
+        The pooled connection is held until the generator is exhausted or
+        closed, so memory stays flat regardless of table size.
+        """
+        query, params = self._user_listing_query(after_id, limit)
+        with self.db.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                users = cursor.fetchmany(chunk_size)
+                if not users:
+                    break
+                yield from self._listing_rows(users, conn)
+
+    def _user_listing_query(self, after_id, limit):
+        query = '''
+            SELECT u.*,
+                   d.id AS doctor_row_id, d.specialization,
+                   n.id AS nurse_row_id, n.department,
+                   p.id AS patient_row_id, p.admission_date, p.discharge_date
+            FROM users u
+            LEFT JOIN doctors d ON d.user_id = u.id
+            LEFT JOIN nurses n ON n.user_id = u.id
+            LEFT JOIN patients p ON p.user_id = u.id
+        '''
+        params = []
+        if after_id is not None:
+            query += ' WHERE u.id > ?'
+            params.append(after_id)
+        query += ' ORDER BY u.id'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        return query, params
+
+    def _listing_rows(self, rows, conn=None):
+        # With shards the catalog has no patient rows; fetch the page's from the shards
+        patients = None
+        if self.db.shard_map is not None:
+            patients = self.db.patients.get_patients_by_user_ids(
+                [row['id'] for row in rows if row['role'] == UserRole.PATIENT.value], conn
+            )
+        return [self._listing_row(row, patients) for row in rows]
+
+    def _listing_row(self, row, patients=None):
+        user_dict = {
+            'id': row['id'],
+            'username': row['username'],
+            'password': row['password'],
+            'role': row['role'],
+            'name': row['name'],
+            'created_at': row['created_at']
+        }
+        role = UserRole(row['role'])
+        if role == UserRole.DOCTOR and row['doctor_row_id'] is not None:
+            user_dict['specialization'] = row['specialization']
+        elif role == UserRole.NURSE and row['nurse_row_id'] is not None:
+            user_dict['department'] = row['department']
+        elif role == UserRole.PATIENT:
+            patient = row if row['patient_row_id'] is not None else None
+            if patients is not None:
+                patient = patients.get(row['id'])
+            if patient is not None:
+                user_dict['admission_date'] = patient['admission_date']
+                user_dict['discharge_date'] = patient['discharge_date']
+        return user_dict
 
     def get_doctor_by_user_id(self, user_id):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM doctors WHERE user_id = ?', (user_id,))
-        doctor = cursor.fetchone()
-        
+        with self.db.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM doctors WHERE user_id = ?', (user_id,))
+            doctor = cursor.fetchone()
+
         if doctor:
             return dict(doctor)
         return None
 
     def get_nurse_by_user_id(self, user_id):
-        conn = self.db.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM nurses WHERE user_id = ?', (user_id,))
-        nurse = cursor.fetchone()
-        
+        with self.db.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM nurses WHERE user_id = ?', (user_id,))
+            nurse = cursor.fetchone()
+
         if nurse:
             return dict(nurse)
-        return None
\ No newline at end of file
+        return None
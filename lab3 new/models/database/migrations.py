@@ -0,0 +1,172 @@
+"""Ordered schema migrations applied on top of the base tables.
+
+Each migration is ``(version, description, steps)`` where every step is
+either an SQL string or a callable taking the connection. Applied versions
+are recorded in ``schema_version`` so every migration runs exactly once per
+database file.
+"""
+import sqlite3
+
+from .rollups import create_rollups
+from .archive import create_archive
+
+PATIENT_SEARCH_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS patient_search_ai AFTER INSERT ON patients BEGIN
+        INSERT INTO patient_search (rowid, name, current_diagnosis, final_diagnosis)
+        VALUES (new.id, (SELECT name FROM users WHERE id = new.user_id),
+                new.current_diagnosis, new.final_diagnosis);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS patient_search_au
+    AFTER UPDATE OF id, user_id, current_diagnosis, final_diagnosis ON patients BEGIN
+        DELETE FROM patient_search WHERE rowid = old.id;
+        INSERT INTO patient_search (rowid, name, current_diagnosis, final_diagnosis)
+        VALUES (new.id, (SELECT name FROM users WHERE id = new.user_id),
+                new.current_diagnosis, new.final_diagnosis);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS patient_search_ad AFTER DELETE ON patients BEGIN
+        DELETE FROM patient_search WHERE rowid = old.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS patient_search_user_au AFTER UPDATE OF name ON users BEGIN
+        UPDATE patient_search SET name = new.name
+        WHERE rowid IN (SELECT id FROM patients WHERE user_id = new.id);
+    END
+    ''',
+]
+
+
+def fts5_available(conn):
+    try:
+        conn.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+    except sqlite3.OperationalError:
+        return False
+    conn.execute('DROP TABLE temp.fts5_probe')
+    return True
+
+
+def create_patient_search(conn):
+    """FTS5 index over patient name and diagnoses, kept in sync by triggers.
+
+    Skipped when SQLite was built without FTS5; search then stays on LIKE.
+    """
+    if not fts5_available(conn):
+        return
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS patient_search USING fts5(
+        name, current_diagnosis, final_diagnosis,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''')
+    for trigger in PATIENT_SEARCH_TRIGGERS:
+        conn.execute(trigger)
+    rebuild_patient_search(conn)
+
+
+def rebuild_patient_search(conn):
+    conn.execute('DELETE FROM patient_search')
+    conn.execute('''
+    INSERT INTO patient_search (rowid, name, current_diagnosis, final_diagnosis)
+    SELECT p.id, u.name, p.current_diagnosis, p.final_diagnosis
+    FROM patients p
+    LEFT JOIN users u ON u.id = p.user_id
+    ''')
+
+
+def table_exists(conn, name):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?",
+        (name,)
+    ).fetchone()
+    return row is not None
+
+
+MIGRATIONS = [
+    (1, 'Secondary and composite indexes for hot lookups', [
+        'CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_doctor_id ON patients (doctor_id)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_admission_date ON patients (admission_date)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_discharge_date ON patients (discharge_date)',
+        'CREATE INDEX IF NOT EXISTS idx_prescriptions_patient_id ON prescriptions (patient_id)',
+        'CREATE INDEX IF NOT EXISTS idx_prescriptions_doctor_status ON prescriptions (doctor_id, status)',
+    ]),
+    (2, 'FTS5 patient search index', [
+        create_patient_search,
+    ]),
+    (3, 'Workload and census rollups maintained by triggers', [
+        create_rollups,
+    ]),
+    (4, 'Composite index for filtered prescription history', [
+        'CREATE INDEX IF NOT EXISTS idx_prescriptions_patient_status_created '
+        'ON prescriptions (patient_id, status, created_at)',
+        # Covered by the leading column of the composite index
+        'DROP INDEX IF EXISTS idx_prescriptions_patient_id',
+    ]),
+    (5, 'Archive tables for discharged patients and completed prescriptions', [
+        create_archive,
+    ]),
+    (6, 'Index for unfiltered prescription history pages', [
+        # Keyset pages walk (created_at, id) in order instead of sorting
+        # all of the patient's rows
+        'CREATE INDEX IF NOT EXISTS idx_prescriptions_patient_created '
+        'ON prescriptions (patient_id, created_at, id)',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def ensure_version_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+
+def current_version(conn):
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """Apply every pending migration, one transaction per version.
+
+    Safe to call from several processes at once: the version is re-checked
+    under the write lock before a migration runs.
+    """
+    ensure_version_table(conn)
+    conn.commit()
+
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
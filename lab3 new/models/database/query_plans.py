@@ -0,0 +1,91 @@
+"""EXPLAIN QUERY PLAN guard for the hot queries.
+
+tests/test_query_plans.py runs the check against a fresh schema; run
+``python -m models.database.query_plans [hospital.db]`` from the project
+root to check an existing file. Both fail if any hot query falls back to
+a full table scan or sorts its rows in a temporary b-tree.
+"""
+import sys
+
+HOT_QUERIES = {
+    'user_by_id': ('SELECT * FROM users WHERE id = ?', (1,)),
+    'user_by_username': ('SELECT * FROM users WHERE username = ?', ('admin',)),
+    'users_by_role': ('SELECT * FROM users WHERE role = ?', ('doctor',)),
+    'doctor_by_user_id': ('SELECT * FROM doctors WHERE user_id = ?', (1,)),
+    'nurse_by_user_id': ('SELECT * FROM nurses WHERE user_id = ?', (1,)),
+    'patient_by_user_id': ('SELECT * FROM patients WHERE user_id = ?', (1,)),
+    'patients_by_doctor': ('SELECT * FROM patients WHERE doctor_id = ?', (1,)),
+    'patients_by_admission_date': (
+        '''
+        SELECT p.*, u.name as patient_name
+        FROM patients p
+        JOIN users u ON p.user_id = u.id
+        WHERE 1=1 AND p.admission_date >= ? AND p.admission_date < ?
+        ''',
+        ('2024-01-01', '2024-01-02')
+    ),
+    'prescriptions_by_patient': ('SELECT * FROM prescriptions WHERE patient_id = ?', (1,)),
+    'prescription_history_by_status': (
+        '''
+        SELECT * FROM prescriptions
+        WHERE patient_id = ? AND status = ? AND created_at >= ? AND created_at < ?
+        AND (created_at, id) > (?, ?)
+        ORDER BY created_at, id LIMIT ?
+        ''',
+        (1, 'pending', '2024-01-01', '2024-02-01', '2024-01-05 00:00:00', 0, 50)
+    ),
+    'prescription_history_page': (
+        '''
+        SELECT * FROM prescriptions
+        WHERE patient_id = ? AND (created_at, id) > (?, ?)
+        ORDER BY created_at, id LIMIT ?
+        ''',
+        (1, '2024-01-05 00:00:00', 0, 50)
+    ),
+    'prescription_history_latest': (
+        'SELECT * FROM prescriptions WHERE patient_id = ? ORDER BY created_at DESC, id DESC LIMIT ?',
+        (1, 50)
+    ),
+    'pending_prescriptions_by_doctor': (
+        'SELECT * FROM prescriptions WHERE doctor_id = ? AND status = ?',
+        (1, 'pending')
+    ),
+}
+
+
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def find_scans(conn, queries=None):
+    """Return ``(name, plan_detail)`` for every hot query that scans a table
+    or needs a temporary b-tree to sort."""
+    scans = []
+    for name, (sql, params) in (queries or HOT_QUERIES).items():
+        for detail in explain(conn, sql, params):
+            if (detail.startswith('SCAN') and 'VIRTUAL TABLE' not in detail) or 'TEMP B-TREE' in detail:
+                scans.append((name, detail))
+    return scans
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    db_name = argv[0] if argv else 'hospital.db'
+
+    from .base import Database
+    database = Database(db_name)
+    with database.connection() as conn:
+        scans = find_scans(conn)
+    database.close()
+
+    for name, detail in scans:
+        print(f'{name}: {detail}')
+    if scans:
+        print(f'{len(scans)} hot quer{"y" if len(scans) == 1 else "ies"} fall back to a scan or sort')
+        return 1
+    print(f'All {len(HOT_QUERIES)} hot queries use an index')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
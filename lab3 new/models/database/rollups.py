@@ -0,0 +1,202 @@
+"""Summary tables kept current by triggers on ``prescriptions`` and ``patients``.
+
+- ``doctor_workload``: pending prescriptions per doctor
+- ``patient_workload``: pending prescriptions and open procedures per patient
+- ``census``: patients currently admitted (a single row)
+- ``daily_census``: admissions and discharges per calendar day
+
+Because the triggers fire on every write path (single inserts, batches and
+bulk imports alike), readers get each figure with one primary-key lookup.
+Run ``python -m models.database.rollups [hospital.db] [--rebuild]`` from the
+project root to recompute the rollups from the base tables and print any
+drift; it exits non-zero when drift was found.
+"""
+import sys
+
+ROLLUP_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS doctor_workload (
+        doctor_id INTEGER PRIMARY KEY,
+        pending_prescriptions INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS patient_workload (
+        patient_id INTEGER PRIMARY KEY,
+        pending_prescriptions INTEGER NOT NULL DEFAULT 0,
+        open_procedures INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS census (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        admitted INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_census (
+        day TEXT PRIMARY KEY,
+        admissions INTEGER NOT NULL DEFAULT 0,
+        discharges INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+]
+
+# Each trigger body is built from "add" and "remove" steps so an UPDATE is
+# just the old row removed and the new row added.
+_PRESCRIPTION_STEP = '''
+    INSERT INTO doctor_workload (doctor_id, pending_prescriptions)
+    SELECT {row}.doctor_id, {sign}1 WHERE {row}.status = 'pending'
+    ON CONFLICT (doctor_id) DO UPDATE SET
+        pending_prescriptions = pending_prescriptions + excluded.pending_prescriptions;
+    INSERT INTO patient_workload (patient_id, pending_prescriptions, open_procedures)
+    SELECT {row}.patient_id, {sign}1, {sign}({row}.prescription_type = 'procedure')
+    WHERE {row}.status = 'pending'
+    ON CONFLICT (patient_id) DO UPDATE SET
+        pending_prescriptions = pending_prescriptions + excluded.pending_prescriptions,
+        open_procedures = open_procedures + excluded.open_procedures;
+'''
+
+_PATIENT_STEP = '''
+    UPDATE census SET admitted = admitted {sign} ({row}.discharge_date IS NULL);
+    INSERT INTO daily_census (day, admissions, discharges)
+    SELECT date({row}.admission_date), {sign}1, 0 WHERE {row}.admission_date IS NOT NULL
+    ON CONFLICT (day) DO UPDATE SET admissions = admissions + excluded.admissions;
+    INSERT INTO daily_census (day, admissions, discharges)
+    SELECT date({row}.discharge_date), 0, {sign}1 WHERE {row}.discharge_date IS NOT NULL
+    ON CONFLICT (day) DO UPDATE SET discharges = discharges + excluded.discharges;
+'''
+
+
+def _trigger(name, event, table, steps, when=None):
+    body = ''.join(step.format(row=row, sign=sign) for step, row, sign in steps)
+    condition = f' WHEN {when}' if when else ''
+    return f'CREATE TRIGGER IF NOT EXISTS {name} {event} ON {table}{condition} BEGIN {body} END'
+
+
+ROLLUP_TRIGGERS = [
+    _trigger('rollup_prescriptions_ai', 'AFTER INSERT', 'prescriptions',
+             [(_PRESCRIPTION_STEP, 'new', '+')]),
+    _trigger('rollup_prescriptions_au',
+             'AFTER UPDATE OF patient_id, doctor_id, prescription_type, status', 'prescriptions',
+             [(_PRESCRIPTION_STEP, 'old', '-'), (_PRESCRIPTION_STEP, 'new', '+')]),
+    _trigger('rollup_prescriptions_ad', 'AFTER DELETE', 'prescriptions',
+             [(_PRESCRIPTION_STEP, 'old', '-')]),
+    _trigger('rollup_patients_ai', 'AFTER INSERT', 'patients',
+             [(_PATIENT_STEP, 'new', '+')]),
+    _trigger('rollup_patients_au', 'AFTER UPDATE OF admission_date, discharge_date', 'patients',
+             [(_PATIENT_STEP, 'old', '-'), (_PATIENT_STEP, 'new', '+')]),
+    _trigger('rollup_patients_ad', 'AFTER DELETE', 'patients',
+             [(_PATIENT_STEP, 'old', '-')]),
+]
+
+# Replaces rollup_patients_ad once archive tables exist: rows moved to the
+# archive keep counting towards the daily census
+ARCHIVE_AWARE_PATIENT_DELETE = _trigger(
+    'rollup_patients_ad', 'AFTER DELETE', 'patients', [(_PATIENT_STEP, 'old', '-')],
+    when='NOT EXISTS (SELECT 1 FROM patients_archive WHERE id = old.id)'
+)
+
+# The same figures computed from scratch: (rollup table, key column, query)
+ROLLUP_SOURCES = {
+    'doctor_workload': ('doctor_id', '''
+        SELECT doctor_id, COUNT(*) AS pending_prescriptions
+        FROM prescriptions WHERE status = 'pending'
+        GROUP BY doctor_id
+    '''),
+    'patient_workload': ('patient_id', '''
+        SELECT patient_id, COUNT(*) AS pending_prescriptions,
+               SUM(prescription_type = 'procedure') AS open_procedures
+        FROM prescriptions WHERE status = 'pending'
+        GROUP BY patient_id
+    '''),
+    'census': ('id', '''
+        SELECT 1 AS id, COUNT(*) AS admitted FROM patients WHERE discharge_date IS NULL
+    '''),
+    'daily_census': ('day', '''
+        SELECT day, SUM(admissions) AS admissions, SUM(discharges) AS discharges FROM (
+            SELECT date(admission_date) AS day, 1 AS admissions, 0 AS discharges
+            FROM {patients} WHERE admission_date IS NOT NULL
+            UNION ALL
+            SELECT date(discharge_date), 0, 1
+            FROM {patients} WHERE discharge_date IS NOT NULL
+        ) GROUP BY day
+    '''),
+}
+
+
+def _sources(conn):
+    # Daily counts cover archived patients too, once the archive exists
+    archived = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'patients_all'"
+    ).fetchone()
+    patients = 'patients_all' if archived else 'patients'
+    return {table: (key, query.replace('{patients}', patients))
+            for table, (key, query) in ROLLUP_SOURCES.items()}
+
+
+def create_rollups(conn):
+    for ddl in ROLLUP_TABLES:
+        conn.execute(ddl)
+    for trigger in ROLLUP_TRIGGERS:
+        conn.execute(trigger)
+    rebuild_rollups(conn)
+
+
+def rebuild_rollups(conn):
+    for table, (key, query) in _sources(conn).items():
+        conn.execute(f'DELETE FROM {table}')
+        conn.execute(f'INSERT INTO {table} {query}')
+    conn.execute('INSERT OR IGNORE INTO census (id, admitted) VALUES (1, 0)')
+
+
+def _rows(conn, key, query):
+    rows = {}
+    for row in conn.execute(query):
+        values = {name: row[name] for name in row.keys() if name != key}
+        # Zeroed rows left behind by decrements are the same as no row
+        if any(values.values()):
+            rows[row[key]] = values
+    return rows
+
+
+def verify_rollups(conn):
+    """Return ``(table, key, stored, expected)`` for every row that drifted."""
+    drift = []
+    for table, (key, query) in _sources(conn).items():
+        stored = _rows(conn, key, f'SELECT * FROM {table}')
+        expected = _rows(conn, key, query)
+        for value in sorted(set(stored) | set(expected), key=str):
+            if stored.get(value) != expected.get(value):
+                drift.append((table, value, stored.get(value), expected.get(value)))
+    return drift
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    rebuild = '--rebuild' in argv
+    args = [arg for arg in argv if not arg.startswith('--')]
+    db_name = args[0] if args else 'hospital.db'
+
+    from .base import Database
+    database = Database(db_name)
+    with database.connection() as conn:
+        drift = verify_rollups(conn)
+        if rebuild and drift:
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild_rollups(conn)
+            conn.commit()
+    database.close()
+
+    for table, key, stored, expected in drift:
+        print(f'{table}[{key}]: stored {stored}, expected {expected}')
+    if drift:
+        action = 'rebuilt' if rebuild else 'run with --rebuild to fix'
+        print(f'{len(drift)} rollup row{"" if len(drift) == 1 else "s"} drifted; {action}')
+        return 0 if rebuild else 1
+    print('All rollups match the base tables')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
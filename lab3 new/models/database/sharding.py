@@ -0,0 +1,396 @@
+"""Patient-scoped data spread over several SQLite files.
+
+With ``N`` shards, ``hospital.db`` becomes the catalog: users, doctors,
+nurses and ``patient_shards``, the directory saying which shard file holds
+each patient. ``patients`` and ``prescriptions`` (with their archive and
+rollup tables) live in ``hospital.shard0.db`` ... ``hospital.shard<N-1>.db``,
+so each shard has its own writer. Every shard also keeps a name-only copy
+of its patients' user rows, which keeps the patient-name joins and the
+search index local to the shard.
+
+Patient ids are allocated by the directory and new patients are placed on
+``id % N``. Each shard allocates prescription ids from its own range of
+``PRESCRIPTION_ID_RANGE`` ids, counted in its ``prescription_ids`` table,
+and moved rows keep their ids, so ids stay unique when rows move.
+AUTOINCREMENT can't be used for this: it continues after the highest id in
+the file, including the ids of rows moved in from another shard's range.
+
+Run ``python -m models.database.sharding [hospital.db] [--shards N] COMMAND``
+from the project root, where COMMAND is one of:
+
+- ``status``: patients per shard
+- ``split``: move the patients of an unsharded ``hospital.db`` into shards
+- ``rebalance [--max-moves M] [--pause S]``: move patients from the fullest
+  to the emptiest shard until the counts are even, e.g. after raising N
+- ``move PATIENT_ID SHARD``: move one patient
+
+Moves copy a patient's rows to the target shard, repoint the directory and
+then delete the originals, all while holding the source shard's write lock.
+Other processes cache the directory for ``ShardMap.CACHE_TTL`` seconds, so
+reads of a patient that just moved may miss until then; writes on a stale
+route find no patient and fail instead of writing to the old shard.
+
+Searches run on every shard in parallel and merge the results, ranked by
+each shard's own bm25 statistics. The archive and rollups commands work
+on one file, so run them against each shard.
+"""
+import os
+import sys
+import time
+
+from .cache import LRUCache
+from .migrations import table_exists
+
+PRESCRIPTION_ID_RANGE = 1 << 40
+
+# Patient-scoped tables, copied in this order and deleted in reverse
+PATIENT_TABLES = [
+    ('patients', 'id'),
+    ('patients_archive', 'id'),
+    ('prescriptions', 'patient_id'),
+    ('prescriptions_archive', 'patient_id'),
+]
+
+
+def shard_paths(db_name, count):
+    stem, extension = os.path.splitext(db_name)
+    return [f'{stem}.shard{index}{extension or ".db"}' for index in range(count)]
+
+
+def reserve_prescription_ids(database, index):
+    """Create shard ``index``'s prescription id counter at the bottom of its range."""
+    floor = index * PRESCRIPTION_ID_RANGE
+    with database.connection() as conn:
+        if table_exists(conn, 'prescription_ids'):
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('CREATE TABLE IF NOT EXISTS prescription_ids (last_id INTEGER NOT NULL)')
+        # Carry on after any ids this shard handed out before the counter existed
+        highest = conn.execute(
+            'SELECT MAX(id) FROM prescriptions_all WHERE id >= ? AND id < ?',
+            (floor, floor + PRESCRIPTION_ID_RANGE)
+        ).fetchone()[0]
+        conn.execute('INSERT INTO prescription_ids (last_id) SELECT ? '
+                     'WHERE NOT EXISTS (SELECT 1 FROM prescription_ids)', (max(floor, highest or 0),))
+        conn.commit()
+
+
+def next_prescription_ids(conn, count=1):
+    """Take ``count`` ids from the shard's counter inside the caller's
+    transaction. Returns the first of them."""
+    row = conn.execute('UPDATE prescription_ids SET last_id = last_id + ? RETURNING last_id',
+                       (count,)).fetchone()
+    return row[0] - count + 1
+
+
+class ShardMap:
+    """The catalog's patient directory: patient id -> shard index."""
+
+    CACHE_SIZE = 65536
+    CACHE_TTL = 5.0
+
+    def __init__(self, catalog, count):
+        self.catalog = catalog
+        self.count = count
+        self.patients = LRUCache(maxsize=self.CACHE_SIZE, ttl=self.CACHE_TTL)
+        self.users = LRUCache(maxsize=self.CACHE_SIZE, ttl=self.CACHE_TTL)
+        with catalog.connection() as conn:
+            if not table_exists(conn, 'patient_shards'):
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS patient_shards (
+                    patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER UNIQUE,
+                    shard INTEGER NOT NULL
+                )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_patient_shards_shard '
+                             'ON patient_shards (shard)')
+                conn.commit()
+
+    def allocate(self, conn, user_id, patient_id=None):
+        """Register a new patient on ``conn`` (the caller commits).
+
+        Returns ``(patient_id, shard)``.
+        """
+        cursor = conn.execute('INSERT INTO patient_shards (patient_id, user_id, shard) VALUES (?, ?, -1)',
+                              (patient_id, user_id))
+        patient_id = cursor.lastrowid if patient_id is None else patient_id
+        shard = patient_id % self.count
+        conn.execute('UPDATE patient_shards SET shard = ? WHERE patient_id = ?', (shard, patient_id))
+        return patient_id, shard
+
+    def release(self, patient_id):
+        with self.catalog.connection() as conn:
+            conn.execute('DELETE FROM patient_shards WHERE patient_id = ?', (patient_id,))
+            conn.commit()
+        self.patients.invalidate(patient_id)
+
+    def shard_of(self, patient_id):
+        shard = self.patients.get(patient_id)
+        if shard is not None:
+            return shard
+        with self.catalog.connection() as conn:
+            row = conn.execute('SELECT shard FROM patient_shards WHERE patient_id = ?',
+                               (patient_id,)).fetchone()
+        if row is None:
+            return None
+        self.patients.set(patient_id, row['shard'])
+        return row['shard']
+
+    def shard_of_user(self, user_id):
+        shard = self.users.get(user_id)
+        if shard is not None:
+            return shard
+        with self.catalog.connection() as conn:
+            row = conn.execute('SELECT shard FROM patient_shards WHERE user_id = ?',
+                               (user_id,)).fetchone()
+        if row is None:
+            return None
+        self.users.set(user_id, row['shard'])
+        return row['shard']
+
+    def group_by_shard(self, column, values, conn=None):
+        """``{shard: [value, ...]}`` for patient ids or user ids, in one pass.
+
+        ``conn`` is a catalog connection the caller already holds.
+        """
+        if conn is None:
+            with self.catalog.connection() as conn:
+                return self.group_by_shard(column, values, conn)
+        groups = {}
+        values = list(values)
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            for row in conn.execute(
+                f'SELECT {column}, shard FROM patient_shards WHERE {column} IN ({placeholders})', chunk
+            ):
+                groups.setdefault(row['shard'], []).append(row[column])
+        return groups
+
+    def assign(self, patient_id, shard):
+        with self.catalog.connection() as conn:
+            conn.execute('UPDATE patient_shards SET shard = ? WHERE patient_id = ?', (shard, patient_id))
+            conn.commit()
+        self.patients.invalidate(patient_id)
+        self.users.clear()
+
+    def counts(self):
+        with self.catalog.connection() as conn:
+            rows = conn.execute('SELECT shard, COUNT(*) FROM patient_shards GROUP BY shard').fetchall()
+        counts = [0] * self.count
+        for shard, count in rows:
+            if 0 <= shard < self.count:
+                counts[shard] = count
+        return counts
+
+
+def _insert_rows(conn, table, rows):
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    placeholders = ', '.join('?' * len(columns))
+    conn.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders})',
+                     [tuple(row[column] for column in columns) for row in rows])
+
+
+def _shift_daily_census(conn, patient, sign):
+    # Archived patients have no patients row for the rollup triggers to
+    # count, so their admission and discharge days move by hand
+    for column, field in (('admissions', 'admission_date'), ('discharges', 'discharge_date')):
+        if patient[field]:
+            conn.execute(
+                f'INSERT INTO daily_census (day, {column}) VALUES (date(?), ?) '
+                f'ON CONFLICT (day) DO UPDATE SET {column} = {column} + excluded.{column}',
+                (patient[field], sign)
+            )
+
+
+def _read_patient(conn, patient_id):
+    rows = {
+        table: conn.execute(f'SELECT * FROM {table} WHERE {key} = ?', (patient_id,)).fetchall()
+        for table, key in PATIENT_TABLES
+    }
+    owner = (rows['patients'] or rows['patients_archive'] or [None])[0]
+    rows['users'] = conn.execute(
+        'SELECT * FROM users WHERE id = ?', (owner['user_id'],)
+    ).fetchall() if owner is not None else []
+    return rows
+
+
+def _write_patient(conn, rows, sign, keep_user=False):
+    """Insert (``sign`` 1) or delete (``sign`` -1) one patient's rows."""
+    if sign > 0:
+        _insert_rows(conn, 'users', rows['users'])
+        for table, _ in PATIENT_TABLES:
+            _insert_rows(conn, table, rows[table])
+    else:
+        for table, _ in reversed(PATIENT_TABLES):
+            conn.executemany(f'DELETE FROM {table} WHERE id = ?', [(row['id'],) for row in rows[table]])
+        if not keep_user:
+            conn.executemany('DELETE FROM users WHERE id = ?', [(row['id'],) for row in rows['users']])
+    for patient in rows['patients_archive']:
+        _shift_daily_census(conn, patient, sign)
+
+
+def _copy_patient(source, target, patient_id, assign, keep_user=False):
+    """Copy a patient from ``source`` to ``target``, run ``assign()`` and
+    delete the originals, holding the source's write lock throughout.
+
+    ``keep_user`` leaves the user row in the source, which is the catalog
+    when splitting an unsharded file.
+    """
+    with source.connection() as src, target.connection() as dst:
+        src.execute('BEGIN IMMEDIATE')
+        rows = _read_patient(src, patient_id)
+        if not rows['users']:
+            src.rollback()
+            return 0
+
+        dst.execute('BEGIN IMMEDIATE')
+        # Shards hold name-only copies of user rows
+        rows['users'] = [
+            {'id': user['id'], 'username': user['username'], 'password': '',
+             'role': user['role'], 'name': user['name']}
+            for user in rows['users']
+        ]
+        _write_patient(dst, rows, 1)
+        dst.commit()
+
+        try:
+            assign()
+        except Exception:
+            dst.execute('BEGIN IMMEDIATE')
+            _write_patient(dst, rows, -1)
+            dst.commit()
+            raise
+        _write_patient(src, rows, -1, keep_user)
+        src.commit()
+    return sum(len(rows[table]) for table, _ in PATIENT_TABLES)
+
+
+def move_patient(database, patient_id, shard):
+    """Move one patient to ``shard``. Returns the number of rows moved."""
+    source = database.shard_map.shard_of(patient_id)
+    if source is None or source == shard:
+        return 0
+    return _copy_patient(database.shards[source], database.shards[shard], patient_id,
+                         lambda: database.shard_map.assign(patient_id, shard))
+
+
+def split(database, pause=0.0):
+    """Move every patient of an unsharded catalog file into the shards."""
+    catalog = database.db
+    with catalog.connection() as conn:
+        patient_ids = [row[0] for row in conn.execute(
+            'SELECT id FROM patients UNION SELECT id FROM patients_archive ORDER BY 1'
+        )]
+        highest = conn.execute(
+            'SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM prescriptions '
+            'UNION ALL SELECT MAX(id) FROM prescriptions_archive)'
+        ).fetchone()[0] or 0
+    # Shard 0 allocates from the bottom range, which the moved ids occupy
+    with database.shards[0].connection() as conn:
+        conn.execute('UPDATE prescription_ids SET last_id = MAX(last_id, ?)', (highest,))
+        conn.commit()
+
+    moved = 0
+    for patient_id in patient_ids:
+        with catalog.connection() as conn:
+            owner = conn.execute(
+                'SELECT user_id FROM patients_all WHERE id = ?', (patient_id,)
+            ).fetchone()
+            conn.execute('BEGIN IMMEDIATE')
+            _, shard = database.shard_map.allocate(conn, owner['user_id'], patient_id)
+            conn.commit()
+
+        try:
+            # The directory entry already points at the shard
+            _copy_patient(catalog, database.shards[shard], patient_id, lambda: None, keep_user=True)
+        except Exception:
+            database.shard_map.release(patient_id)
+            raise
+        moved += 1
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def rebalance(database, max_moves=None, pause=0.0):
+    """Move patients from the fullest shard to the emptiest, one at a time,
+    until no two shards differ by more than one patient.
+
+    Patients that cannot be moved, e.g. because their rows are missing
+    from the shard, are skipped; the run ends early once the fullest
+    shard has no other patients left to move.
+    """
+    moves = 0
+    stuck = set()
+    while max_moves is None or moves < max_moves:
+        counts = database.shard_map.counts()
+        fullest = max(range(len(counts)), key=counts.__getitem__)
+        emptiest = min(range(len(counts)), key=counts.__getitem__)
+        if counts[fullest] - counts[emptiest] <= 1:
+            break
+        with database.db.connection() as conn:
+            rows = conn.execute(
+                'SELECT patient_id FROM patient_shards WHERE shard = ? ORDER BY patient_id DESC',
+                (fullest,)
+            )
+            patient_id = next((row['patient_id'] for row in rows if row['patient_id'] not in stuck), None)
+        if patient_id is None:
+            break
+        if not move_patient(database, patient_id, emptiest):
+            stuck.add(patient_id)
+            continue
+        moves += 1
+        if pause:
+            time.sleep(pause)
+    return moves
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    import config
+
+    options = {'--shards': config.DB_SHARDS, '--max-moves': None, '--pause': 0.0}
+    args = []
+    iterator = iter(argv)
+    for arg in iterator:
+        if arg in options:
+            options[arg] = (float if arg == '--pause' else int)(next(iterator))
+        else:
+            args.append(arg)
+    db_name = args.pop(0) if args and args[0].endswith('.db') else config.DB_PATH
+    command = args.pop(0) if args else 'status'
+    if options['--shards'] < 2:
+        print('Sharding needs --shards 2 or more (or DB_SHARDS)', file=sys.stderr)
+        return 1
+
+    from .hospital_db import HospitalDatabase
+    database = HospitalDatabase(db_name, shards=options['--shards'])
+    try:
+        if command == 'split':
+            print(f'Moved {split(database, options["--pause"])} patients into '
+                  f'{options["--shards"]} shards')
+        elif command == 'rebalance':
+            print(f'Moved {rebalance(database, options["--max-moves"], options["--pause"])} patients')
+        elif command == 'move' and len(args) == 2:
+            patient_id, shard = int(args[0]), int(args[1])
+            if not 0 <= shard < options['--shards']:
+                print(f'Shard must be between 0 and {options["--shards"] - 1}', file=sys.stderr)
+                return 1
+            print(f'Moved {move_patient(database, patient_id, shard)} rows')
+        elif command != 'status':
+            print(__doc__, file=sys.stderr)
+            return 1
+        for index, (path, count) in enumerate(zip(shard_paths(db_name, options['--shards']),
+                                                   database.shard_map.counts())):
+            print(f'shard {index}: {count} patients in {path}')
+    finally:
+        database.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
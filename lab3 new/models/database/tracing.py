@@ -0,0 +1,131 @@
+"""Timing of every SQL statement, attributed to the manager method that ran it.
+
+Managers are wrapped by ``tag_methods`` so that statements issued while one
+of their public methods runs are labelled ``ClassName.method``. Requests
+that run more statements than expected show up per request through
+``begin_request``/``end_request``.
+"""
+import contextvars
+import functools
+import inspect
+import time
+from collections import Counter as TagCounts
+
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+_current_tag = contextvars.ContextVar('sql_tag', default=None)
+_current_request = contextvars.ContextVar('sql_request', default=None)
+
+
+class RequestQueries:
+    """Statements run on behalf of one request; the first ``limit`` are kept
+    as ``(tag, sql, seconds)`` for slow-request logs."""
+
+    def __init__(self, limit=200):
+        self.count = 0
+        self.seconds = 0.0
+        self.by_tag = TagCounts()
+        self.limit = limit
+        self.statements = []
+
+
+def _run_tagged(tag, fn, args, kwargs):
+    # Restore by value rather than token: generators may finish in another context
+    previous = _current_tag.get()
+    _current_tag.set(tag)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_tag.set(previous)
+
+
+def _tagged(tag, fn):
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def generator(*args, **kwargs):
+            iterator = fn(*args, **kwargs)
+            while True:
+                try:
+                    item = _run_tagged(tag, next, (iterator,), {})
+                except StopIteration:
+                    return
+                yield item
+        return generator
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return _run_tagged(tag, fn, args, kwargs)
+    return wrapper
+
+
+def tag_methods(obj):
+    """Label the SQL run by each public method of ``obj`` with its name."""
+    for name, fn in inspect.getmembers(type(obj), inspect.isfunction):
+        if not name.startswith('_'):
+            setattr(obj, name, _tagged(f'{type(obj).__name__}.{name}', getattr(obj, name)))
+    return obj
+
+
+def carry_tag(op):
+    """Wrap ``op`` so it keeps the caller's tag when run on another thread."""
+    return _tagged(_current_tag.get(), op)
+
+
+class SqlTracer:
+    def __init__(self, registry):
+        self.durations = registry.histogram(
+            'sql_statement_duration_seconds',
+            'Time spent executing SQL statements, by manager method and statement type',
+            ('method', 'statement'),
+            buckets=SQL_BUCKETS
+        )
+
+    def record(self, sql, seconds):
+        tag = _current_tag.get() or 'untagged'
+        words = sql.split(None, 1)
+        self.durations.observe(seconds, tag, words[0].upper() if words else '')
+        queries = _current_request.get()
+        if queries is not None:
+            queries.count += 1
+            queries.seconds += seconds
+            queries.by_tag[tag] += 1
+            if len(queries.statements) < queries.limit:
+                queries.statements.append((tag, sql, seconds))
+
+    def begin_request(self):
+        queries = RequestQueries()
+        _current_request.set(queries)
+        return queries
+
+    def end_request(self):
+        queries = _current_request.get()
+        _current_request.set(None)
+        return queries
+
+
+class TracedCursor:
+    def __init__(self, tracer, cursor):
+        self._tracer = tracer
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(sql, *args)
+        finally:
+            self._tracer.record(sql, time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, *args)
+        finally:
+            self._tracer.record(sql, time.perf_counter() - started)
+        return self
@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueFull(Exception):
+    """Raised instead of queueing when the write queue is at capacity."""
+
+
+class WriteQueueTimeout(WriteQueueFull):
+    """Raised when a queued write is not committed within ``timeout``.
+
+    A write that was still waiting is cancelled; one the writer had already
+    started may still commit.
+    """
+
+
+class WriteQueue:
+    """Single writer thread that commits queued writes in small batches.
+
+    Each write is a callable ``op(conn, *args)``. The writer takes up to
+    ``max_batch`` queued writes, waiting at most ``max_delay`` seconds for
+    more to arrive, and runs them in one transaction. Each write gets its
+    own savepoint, so a failing write is rolled back and reported to its
+    caller without affecting the rest of the batch. Callers get their
+    result only after the batch has been committed.
+    """
+
+    def __init__(self, database, max_batch=64, max_delay=0.0, max_pending=1024, timeout=10.0):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.largest_batch = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                    self._thread.start()
+
+    def submit(self, op, *args):
+        if self._closed:
+            raise WriteQueueFull('Write queue is closed')
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((op, args, future))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise WriteQueueFull(f'{self._queue.maxsize} writes already pending')
+        return future
+
+    def call(self, op, *args):
+        """Queue ``op(conn, *args)`` and wait for its committed result."""
+        future = self.submit(op, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise WriteQueueTimeout(f'Write not committed within {self.timeout}s')
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logger.exception('Group commit of %d writes failed', len(batch))
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit(self, batch):
+        outcomes = []
+        with self.database.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for op, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT queued_write')
+                try:
+                    outcomes.append((future, op(conn, *args), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO queued_write')
+                    outcomes.append((future, None, e))
+                conn.execute('RELEASE queued_write')
+            conn.commit()
+
+        failed = 0
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                failed += 1
+                future.set_exception(error)
+        with self._lock:
+            self.batches += 1
+            self.writes += len(outcomes)
+            self.failed += failed
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self.batches,
+                'writes': self.writes,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'avg_batch': self.writes / self.batches if self.batches else 0.0,
+                'largest_batch': self.largest_batch
+            }
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
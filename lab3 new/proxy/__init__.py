@@ -0,0 +1,27 @@
+from .upstream import Upstream, UpstreamError, strip_hop_by_hop, HOP_BY_HOP_HEADERS
+from .response_cache import ResponseCache, CacheEntry
+from .balancer import Replica, ReplicaSet, HealthChecker
+from .singleflight import SingleFlight
+from .aggregate import FanOut, Part
+from .hedging import Hedger, LatencyTracker, RetryBudget, RouteBudgets, DeadlineExceeded, route_key
+
+__all__ = [
+    'Upstream',
+    'UpstreamError',
+    'strip_hop_by_hop',
+    'HOP_BY_HOP_HEADERS',
+    'ResponseCache',
+    'CacheEntry',
+    'Replica',
+    'ReplicaSet',
+    'HealthChecker',
+    'SingleFlight',
+    'Hedger',
+    'LatencyTracker',
+    'RetryBudget',
+    'RouteBudgets',
+    'DeadlineExceeded',
+    'route_key',
+    'FanOut',
+    'Part'
+]
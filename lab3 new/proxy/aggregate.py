@@ -0,0 +1,77 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class Part:
+    """Outcome of one call in a fan-out."""
+
+    def __init__(self, name, value=None, error=None, elapsed=None, timed_out=False):
+        self.name = name
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.error is None and not self.timed_out
+
+
+class FanOut:
+    """Run independent calls concurrently under one shared deadline.
+
+    Calls still running at the deadline are reported as timed out and left
+    to finish in the background; their results are dropped.
+    """
+
+    def __init__(self, max_workers=32):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='gateway-fanout')
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.partial = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _timed(self, fn, deadline):
+        started = time.monotonic()
+        value = fn(deadline - started)
+        return value, time.monotonic() - started
+
+    def run(self, calls, deadline):
+        """``calls`` maps a name to ``fn(remaining_seconds)``; returns name -> Part."""
+        futures = {self._executor.submit(self._timed, fn, deadline): name
+                   for name, fn in calls.items()}
+        wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+        parts = {}
+        for future, name in futures.items():
+            if not future.done():
+                future.cancel()
+                parts[name] = Part(name, timed_out=True)
+            elif future.exception() is not None:
+                parts[name] = Part(name, error=future.exception())
+            else:
+                value, elapsed = future.result()
+                parts[name] = Part(name, value=value, elapsed=elapsed)
+
+        with self._lock:
+            self.requests += 1
+            self.timeouts += sum(1 for part in parts.values() if part.timed_out)
+            self.errors += sum(1 for part in parts.values() if part.error is not None)
+            if not all(part.ok for part in parts.values()):
+                self.partial += 1
+        return parts
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'partial': self.partial,
+                'timeouts': self.timeouts,
+                'errors': self.errors
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,156 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    """One instance of a service plus its health and load counters."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.latency_total = 0.0
+        self.latency_ewma = None
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.outstanding += 1
+            self.requests += 1
+        return time.perf_counter()
+
+    def finish(self, started, error=False):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.outstanding -= 1
+            self.latency_total += elapsed
+            self.latency_ewma = elapsed if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * elapsed
+            if error:
+                self.errors += 1
+
+    def stats(self):
+        with self._lock:
+            finished = self.requests - self.outstanding
+            return {
+                'url': self.url,
+                'healthy': self.healthy,
+                'outstanding': self.outstanding,
+                'requests': self.requests,
+                'errors': self.errors,
+                'ejections': self.ejections,
+                'latency_avg_ms': round(self.latency_total / finished * 1000, 2) if finished else None,
+                'latency_ewma_ms': round(self.latency_ewma * 1000, 2) if self.latency_ewma is not None else None
+            }
+
+
+class ReplicaSet:
+    """Picks a replica per request and tracks which replicas are healthy.
+
+    ``strategy`` is ``least_outstanding`` (fewest in-flight requests, ties
+    broken at random) or ``p2c`` (power of two random choices). Replicas are
+    ejected after ``fail_threshold`` consecutive failures, from health
+    checks or from failed requests, and re-admitted after
+    ``rise_threshold`` consecutive successful health checks. If every
+    replica is ejected, all of them are tried rather than failing outright.
+    """
+
+    def __init__(self, name, urls, strategy='least_outstanding', fail_threshold=2, rise_threshold=2):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.name = name
+        self.replicas = [Replica(url) for url in urls]
+        self.strategy = strategy
+        self.fail_threshold = fail_threshold
+        self.rise_threshold = rise_threshold
+        self._lock = threading.Lock()
+
+    def choose(self, exclude=()):
+        candidates = [r for r in self.replicas if r.healthy and r not in exclude]
+        if not candidates:
+            candidates = [r for r in self.replicas if r not in exclude] or self.replicas
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == 'p2c':
+            first, second = random.sample(candidates, 2)
+            return first if first.outstanding <= second.outstanding else second
+        fewest = min(r.outstanding for r in candidates)
+        return random.choice([r for r in candidates if r.outstanding == fewest])
+
+    def record_success(self, replica):
+        with self._lock:
+            replica.consecutive_failures = 0
+            replica.consecutive_successes += 1
+            if not replica.healthy and replica.consecutive_successes >= self.rise_threshold:
+                replica.healthy = True
+                logger.warning('%s replica %s re-admitted', self.name, replica.url)
+
+    def record_failure(self, replica):
+        with self._lock:
+            replica.consecutive_successes = 0
+            replica.consecutive_failures += 1
+            if replica.healthy and replica.consecutive_failures >= self.fail_threshold:
+                replica.healthy = False
+                replica.ejections += 1
+                logger.warning('%s replica %s ejected', self.name, replica.url)
+
+    def stats(self):
+        return {
+            'strategy': self.strategy,
+            'healthy': sum(1 for r in self.replicas if r.healthy),
+            'replicas': [r.stats() for r in self.replicas]
+        }
+
+
+class HealthChecker:
+    """Background thread that probes every replica with a GET."""
+
+    def __init__(self, replica_sets, path='/', interval=5.0, timeout=1.0):
+        self.replica_sets = list(replica_sets)
+        self.path = path
+        self.interval = interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.trust_env = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self, replica_set, replica):
+        try:
+            response = self.session.get(f'{replica.url}{self.path}', timeout=self.timeout)
+            ok = response.status_code < 500
+        except requests.RequestException:
+            ok = False
+        if ok:
+            replica_set.record_success(replica)
+        else:
+            replica_set.record_failure(replica)
+        return ok
+
+    def run_once(self):
+        for replica_set in self.replica_sets:
+            for replica in replica_set.replicas:
+                self.check(replica_set, replica)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='gateway-health', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,231 @@
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+ROUTE_ID = re.compile(r'/\d+(?=/|$)')
+
+
+def route_key(path):
+    """Collapse numeric path segments so ``/patients/7/discharge`` and
+    ``/patients/8/discharge`` share one latency history."""
+    return ROUTE_ID.sub('/<id>', path)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies per route."""
+
+    def __init__(self, window=512):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, seconds):
+        with self._lock:
+            samples = self._samples.get(route)
+            if samples is None:
+                samples = self._samples[route] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def quantile(self, route, q, min_samples=1):
+        with self._lock:
+            samples = self._samples.get(route)
+            if samples is None or len(samples) < min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self):
+        with self._lock:
+            routes = {route: sorted(samples) for route, samples in self._samples.items()}
+        return {
+            route: {
+                'count': len(ordered),
+                'p50_ms': round(ordered[len(ordered) // 2] * 1000, 2),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 2),
+                'max_ms': round(ordered[-1] * 1000, 2)
+            }
+            for route, ordered in routes.items() if ordered
+        }
+
+
+class RetryBudget:
+    """Caps hedges and retries at ``ratio`` of regular requests.
+
+    Every request deposits ``ratio`` tokens and every extra attempt spends
+    one. The balance never exceeds ``max_tokens``, which bounds bursts.
+    """
+
+    def __init__(self, ratio=0.1, max_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = float(max_tokens)
+        self.granted = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.granted += 1
+                return True
+            self.denied += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ratio': self.ratio,
+                'tokens': round(self.tokens, 2),
+                'granted': self.granted,
+                'denied': self.denied
+            }
+
+
+class RouteBudgets:
+    """Path prefix -> deadline in seconds; the longest matching prefix wins."""
+
+    def __init__(self, budgets, default):
+        self.budgets = sorted(budgets.items(), key=lambda item: len(item[0]), reverse=True)
+        self.default = default
+
+    def for_path(self, path):
+        for prefix, seconds in self.budgets:
+            if path.startswith(prefix):
+                return seconds
+        return self.default
+
+
+class Hedger:
+    """Runs idempotent calls with one hedge or retry on another replica.
+
+    If the first attempt has not finished after the route's observed
+    ``quantile`` latency, a second attempt starts and the first to succeed
+    wins. A failed attempt is retried instead when nothing else is in
+    flight. Either way at most two attempts run, and the second one needs a
+    token from the retry budget.
+    """
+
+    def __init__(self, tracker, budget, quantile=0.95, min_samples=20, min_delay=0.005,
+                 max_workers=64):
+        self.tracker = tracker
+        self.budget = budget
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='gateway-hedge')
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+
+    def hedge_delay(self, route):
+        delay = self.tracker.quantile(route, self.quantile, self.min_samples)
+        return None if delay is None else max(delay, self.min_delay)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _timed(self, route, attempt, replica, deadline):
+        started = time.monotonic()
+        result = attempt(replica, deadline - started)
+        self.tracker.observe(route, time.monotonic() - started)
+        return result
+
+    def call(self, route, attempt, choose, deadline, discard=None):
+        """Return the first successful ``attempt(replica, remaining_seconds)``.
+
+        ``choose(exclude)`` picks a replica, ``deadline`` is a
+        ``time.monotonic()`` timestamp, and ``discard(result)`` releases the
+        result of an attempt that lost the race.
+        """
+        self._count('calls')
+        self.budget.deposit()
+        started = time.monotonic()
+        primary = choose(())
+        futures = {self._executor.submit(self._timed, route, attempt, primary, deadline): primary}
+        delay = self.hedge_delay(route)
+        extra_used = False
+        hedge_future = None
+        last_error = None
+
+        while futures:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline - now
+            if not extra_used and delay is not None:
+                timeout = min(timeout, max(0.0, started + delay - now))
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                replica = futures.pop(future)
+                error = future.exception()
+                if error is None:
+                    if future is hedge_future:
+                        self._count('hedge_wins')
+                    self._abandon(futures, discard)
+                    return future.result()
+                last_error = error
+
+            if futures:
+                if not done and not extra_used and delay is not None and time.monotonic() < deadline:
+                    extra_used = True
+                    if self.budget.withdraw():
+                        self._count('hedges')
+                        hedge = choose((primary,))
+                        hedge_future = self._executor.submit(self._timed, route, attempt, hedge, deadline)
+                        futures[hedge_future] = hedge
+                continue
+            if not extra_used and time.monotonic() < deadline:
+                extra_used = True
+                if self.budget.withdraw():
+                    self._count('retries')
+                    retry = choose((primary,))
+                    futures[self._executor.submit(self._timed, route, attempt, retry, deadline)] = retry
+
+        if futures:
+            self._count('deadline_exceeded')
+            self._abandon(futures, discard)
+            raise DeadlineExceeded('Gateway deadline exceeded')
+        raise last_error
+
+    def _abandon(self, futures, discard):
+        # Losers keep running; release whatever they return
+        if discard is None:
+            return
+        for future in futures:
+            future.add_done_callback(
+                lambda f: discard(f.result()) if f.exception() is None else None
+            )
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedge_rate': self.hedges / self.calls if self.calls else 0.0,
+                'win_rate': self.hedge_wins / self.hedges if self.hedges else 0.0,
+                'retries': self.retries,
+                'deadline_exceeded': self.deadline_exceeded,
+                'retry_budget': self.budget.stats(),
+                'routes': self.tracker.stats()
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
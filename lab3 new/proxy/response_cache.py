@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheEntry:
+    def __init__(self, status, headers, body, etag, ttl):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.ttl = ttl
+        self.expires_at = time.monotonic() + ttl
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers)
+
+    @property
+    def fresh(self):
+        return time.monotonic() < self.expires_at
+
+
+class ResponseCache:
+    """Memory-bounded LRU cache of upstream GET responses.
+
+    ``ttls`` maps path prefixes to a TTL in seconds; only paths matching one
+    of them are cached, using the longest matching prefix. ``invalidations``
+    maps a write path prefix to the cached path prefixes it makes stale; a
+    write with no matching rule invalidates its own service prefix.
+    Expired entries are kept so they can be revalidated with their ETag.
+    """
+
+    def __init__(self, ttls, invalidations=None, max_bytes=64 * 1024 * 1024,
+                 max_entry_bytes=1024 * 1024):
+        self.ttls = sorted(ttls.items(), key=lambda item: len(item[0]), reverse=True)
+        self.invalidations = sorted((invalidations or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        self.invalidated = 0
+
+    def ttl_for(self, path):
+        for prefix, ttl in self.ttls:
+            if path.startswith(prefix):
+                return ttl
+        return None
+
+    @staticmethod
+    def key(path, query_string, authorization, accept=''):
+        # Hash the credentials so raw tokens are never kept in memory here
+        identity = hashlib.sha256((authorization or '').encode('utf-8')).hexdigest()
+        return (path, query_string, identity, accept or '')
+
+    def get(self, key):
+        """Return the entry (fresh or stale) or None, counting hits and misses."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry.fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def put(self, key, entry):
+        if entry.size > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def refresh(self, entry):
+        """Upstream answered 304: the stored body is good for another TTL."""
+        with self._lock:
+            entry.expires_at = time.monotonic() + entry.ttl
+            self.revalidated += 1
+
+    def invalidate_for_write(self, path):
+        prefixes = None
+        for prefix, targets in self.invalidations:
+            if path.startswith(prefix):
+                prefixes = tuple(targets)
+                break
+        if prefixes is None:
+            prefixes = ('/' + path.lstrip('/').split('/', 1)[0] + '/',)
+
+        with self._lock:
+            stale = [key for key in self._entries if key[0].startswith(prefixes)]
+            for key in stale:
+                self._bytes -= self._entries.pop(key).size
+            self.invalidated += len(stale)
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+                'evictions': self.evictions,
+                'invalidated': self.invalidated
+            }
@@ -0,0 +1,81 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait and receive the same result or exception. Once
+    ``max_waiters`` callers are waiting on a key, further callers run the
+    function themselves instead of piling on.
+    """
+
+    def __init__(self, max_waiters=64, wait_timeout=None):
+        self.max_waiters = max_waiters
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.waited = 0
+        self.shared = 0
+        self.overflow = 0
+
+    def do(self, key, fn):
+        """Return ``(result, shared)``; ``shared`` is True for waiters."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            elif call.waiters >= self.max_waiters:
+                self.overflow += 1
+                call = None
+                leader = False
+            else:
+                call.waiters += 1
+                self.waited += 1
+                leader = False
+
+        if call is None:
+            return fn(), False
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result, False
+
+        if not call.done.wait(self.wait_timeout):
+            raise TimeoutError('Timed out waiting for an in-flight request')
+        if call.error is not None:
+            raise call.error
+        with self._lock:
+            self.shared += 1
+        return call.result, True
+
+    def stats(self):
+        with self._lock:
+            total = self.leaders + self.waited + self.overflow
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'waited': self.waited,
+                'shared': self.shared,
+                'overflow': self.overflow,
+                'share_ratio': self.shared / total if total else 0.0
+            }
@@ -0,0 +1,124 @@
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .balancer import ReplicaSet
+
+# RFC 7230 section 6.1: meaningful for a single connection only
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection',
+    'keep-alive',
+    'proxy-authenticate',
+    'proxy-authorization',
+    'te',
+    'trailer',
+    'trailers',
+    'transfer-encoding',
+    'upgrade'
+])
+
+
+def strip_hop_by_hop(headers, extra=()):
+    """Drop hop-by-hop headers, including any named in ``Connection``."""
+    headers = list(headers)
+    drop = set(HOP_BY_HOP_HEADERS)
+    drop.update(name.lower() for name in extra)
+    for key, value in headers:
+        if key.lower() == 'connection':
+            drop.update(token.strip().lower() for token in value.split(','))
+    return [(key, value) for key, value in headers if key.lower() not in drop]
+
+
+class UpstreamError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Upstream:
+    """One backend service, possibly several replicas, behind pooled
+    keep-alive sessions.
+
+    ``observe(name, path, seconds, status)`` is called once per call when
+    its response is closed, with status ``'502'``/``'504'`` when no
+    response arrived."""
+
+    def __init__(self, name, urls, pool_size=20, connect_timeout=2.0, read_timeout=30.0,
+                 strategy='least_outstanding', observe=None):
+        self.name = name
+        self.observe = observe
+        self.replicas = ReplicaSet(name, urls, strategy=strategy)
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        # Never pick up proxy settings from the environment, and never let a
+        # Set-Cookie from one caller's response leak into another's request
+        self.session.trust_env = False
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=len(self.replicas.replicas),
+                              pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def url(self):
+        return self.replicas.replicas[0].url
+
+    def request(self, method, path, query_string=b'', headers=None, data=None, timeout=None,
+                replica=None):
+        """Send a request to one replica and return the un-read, streaming response.
+
+        The replica counts the request as outstanding until the response is
+        closed.
+        """
+        replica = replica or self.replicas.choose()
+        url = f'{replica.url}{path}'
+        if query_string:
+            url += '?' + (query_string.decode('latin-1') if isinstance(query_string, bytes) else query_string)
+
+        started = replica.start()
+        try:
+            response = self.session.request(
+                method=method,
+                url=url,
+                headers=headers,
+                data=data,
+                allow_redirects=False,
+                stream=True,
+                timeout=timeout or self.timeout
+            )
+        except requests.Timeout:
+            replica.finish(started, error=True)
+            self.replicas.record_failure(replica)
+            self._observe(path, started, '504')
+            raise UpstreamError(504, f'{self.name} service timed out')
+        except requests.ConnectionError:
+            replica.finish(started, error=True)
+            self.replicas.record_failure(replica)
+            self._observe(path, started, '502')
+            raise UpstreamError(502, f'{self.name} service unavailable')
+
+        response.replica = replica
+        close = response.close
+        finished = []
+
+        def close_and_finish():
+            if not finished:
+                finished.append(True)
+                replica.finish(started, error=response.status_code >= 500)
+                self._observe(path, started, str(response.status_code))
+            close()
+
+        response.close = close_and_finish
+        return response
+
+    def _observe(self, path, started, status):
+        if self.observe is not None:
+            self.observe(self.name, path, time.perf_counter() - started, status)
+
+    def close(self):
+        self.session.close()
@@ -1,11 +1,17 @@
 from flask import Blueprint, request, jsonify
+from concurrent.futures import TimeoutError
 from datetime import datetime, timedelta
-import bcrypt
-import jwt
+import config
 from models.enums.user_enums import UserRole
 from models.database.hospital_db import db
+from services.password_hasher import hasher, HashQueueFull
+from services.user_import import import_users
+from ..common.decorators import token_required, role_required
+from ..common.conditional import conditional_response
+from ..common.errors import write_queue_busy
 
 auth_bp = Blueprint('auth', __name__)
+auth_bp.after_request(conditional_response)
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -22,9 +28,6 @@ def register():
     if db.users.get_user_by_username(data['username']):
         return jsonify({'message': 'Username already exists'}), 400
 
-    # Hash the password
-    hashed_password = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
     # Additional fields based on role
     kwargs = {}
     if role == UserRole.DOCTOR:
@@ -38,6 +41,12 @@ def register():
     elif role == UserRole.PATIENT:
         kwargs['doctor_id'] = data.get('doctor_id')
 
+    # Hash the password
+    try:
+        hashed_password = hasher.hash(data['password'])
+    except (HashQueueFull, TimeoutError) as error:
+        return write_queue_busy(error)
+
     user = db.users.add_user(
         username=data['username'],
         password=hashed_password,
@@ -62,9 +71,22 @@ def login():
         return jsonify({'message': 'Missing username or password'}), 400
 
     user = db.users.get_user_by_username(data['username'])
-    if not user or not bcrypt.checkpw(data['password'].encode('utf-8'), user['password'].encode('utf-8')):
+    if not user:
         return jsonify({'message': 'Invalid credentials'}), 401
+    try:
+        if not hasher.verify(data['password'], user['password']):
+            return jsonify({'message': 'Invalid credentials'}), 401
+    except (HashQueueFull, TimeoutError) as error:
+        return write_queue_busy(error)
 
+    # Upgrade the stored hash when the configured cost factor has changed
+    if hasher.needs_rehash(user['password']):
+        try:
+            db.users.update_password(user['id'], hasher.hash(data['password']))
+        except (HashQueueFull, TimeoutError):
+            pass
+
+    import jwt
     token = jwt.encode({
         'user_id': user['id'],
         'role': user['role'],
@@ -79,4 +101,33 @@ def login():
             'role': user['role'],
             'name': user['name']
         }
-    }) 
\ No newline at end of file
+    }) 
+
+@auth_bp.route('/import', methods=['POST'])
+@token_required
+@role_required([UserRole.ADMIN])
+def bulk_import(current_user):
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'ndjson' if request.mimetype in ('application/x-ndjson', 'application/jsonl') else 'csv'
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'message': 'Unsupported import format'}), 400
+
+    text = request.get_data(as_text=True)
+    if not text.strip():
+        return jsonify({'message': 'Empty import'}), 400
+    if text.count('\n') > config.IMPORT_MAX_ROWS + 1:
+        return jsonify({'message': f'At most {config.IMPORT_MAX_ROWS} rows per import; '
+                                   'use python -m services.user_import for larger files'}), 413
+
+    try:
+        report = import_users(db, text, fmt)
+    except HashQueueFull as error:
+        return write_queue_busy(error)
+    return jsonify(report), 200 if not report['failed'] else 207
+
+@auth_bp.route('/stats', methods=['GET'])
+@token_required
+@role_required([UserRole.ADMIN])
+def get_stats(current_user):
+    return jsonify({'password_hasher': hasher.stats()})
@@ -1,3 +1,5 @@
 from .decorators import token_required, role_required
+from .conditional import conditional_response
+from .errors import write_queue_busy
 
-__all__ = ['token_required', 'role_required'] 
\ No newline at end of file
+__all__ = ['token_required', 'role_required', 'conditional_response', 'write_queue_busy'] 
\ No newline at end of file
@@ -0,0 +1,10 @@
+from flask import request
+
+
+def conditional_response(response):
+    """Give successful GET responses an ETag and answer If-None-Match with 304."""
+    if request.method != 'GET' or response.status_code != 200 or response.is_streamed:
+        return response
+    if not response.get_etag()[0]:
+        response.add_etag()
+    return response.make_conditional(request)
@@ -1,9 +1,37 @@
+import hashlib
+import time
 from functools import wraps
 from flask import request, jsonify, current_app
-import jwt
 from models.enums.user_enums import UserRole
+from models.database.cache import LRUCache
 from models.database.hospital_db import db
 
+# Digests of tokens whose signature was already verified, so a repeated
+# token skips the HMAC check. Entries never outlive the token's own expiry.
+verified_tokens = LRUCache(maxsize=8192, ttl=300.0)
+
+def _token_digest(token):
+    return hashlib.sha256(f'{current_app.secret_key}:{token}'.encode('utf-8')).hexdigest()
+
+def decode_token(token):
+    use_cache = current_app.config.get('TOKEN_CACHE_ENABLED', True)
+    if use_cache:
+        digest = _token_digest(token)
+        data = verified_tokens.get(digest)
+        if data is not None:
+            if 'exp' not in data or data['exp'] > time.time():
+                return data
+            verified_tokens.invalidate(digest)
+
+    import jwt
+    data = jwt.decode(token, current_app.secret_key, algorithms=["HS256"])
+    if use_cache:
+        ttl = verified_tokens.ttl
+        if 'exp' in data:
+            ttl = min(ttl, data['exp'] - time.time())
+        verified_tokens.set(digest, data, ttl=ttl)
+    return data
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -11,7 +39,7 @@ def token_required(f):
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
         try:
-            data = jwt.decode(token, current_app.secret_key, algorithms=["HS256"])
+            data = decode_token(token)
             current_user = db.users.get_user(data['user_id'])
             if not current_user:
                 return jsonify({'message': 'Invalid token!'}), 401
@@ -28,4 +56,11 @@ def role_required(roles):
                 return jsonify({'message': 'Unauthorized!'}), 403
             return f(current_user, *args, **kwargs)
         return decorated
-    return decorator 
\ No newline at end of file
+    return decorator
+
+def cache_stats():
+    return {
+        'user_cache': db.users.cache.stats(),
+        'profile_cache': db.users.profiles.stats(),
+        'token_cache': verified_tokens.stats()
+    }
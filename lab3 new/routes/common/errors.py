@@ -0,0 +1,7 @@
+from flask import jsonify
+
+
+def write_queue_busy(error):
+    response = jsonify({'message': 'Server busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
@@ -1,9 +1,45 @@
+from datetime import date
 from flask import Blueprint, request, jsonify
 from models.enums.user_enums import UserRole
 from models.database.hospital_db import db
+from models.database.write_queue import WriteQueueFull
 from ..common.decorators import token_required, role_required
+from ..common.conditional import conditional_response
+from ..common.errors import write_queue_busy
 
 patient_bp = Blueprint('patient', __name__)
+patient_bp.after_request(conditional_response)
+patient_bp.register_error_handler(WriteQueueFull, write_queue_busy)
+
+DEFAULT_SEARCH_PAGE_SIZE = 50
+MAX_SEARCH_PAGE_SIZE = 500
+
+@patient_bp.route('/census', methods=['GET'])
+@token_required
+@role_required([UserRole.ADMIN, UserRole.DOCTOR, UserRole.NURSE])
+def get_census(current_user):
+    day = None
+    if request.args.get('date'):
+        try:
+            day = date.fromisoformat(request.args['date'])
+        except ValueError:
+            return jsonify({'message': 'Invalid date, expected YYYY-MM-DD'}), 400
+    return jsonify(db.patients.get_census(day))
+
+@patient_bp.route('/patients/<int:patient_id>', methods=['GET'])
+@token_required
+@role_required([UserRole.DOCTOR, UserRole.NURSE, UserRole.PATIENT])
+def get_patient(current_user, patient_id):
+    # history=1 also looks in the archive of long-discharged patients
+    history = request.args.get('history') == '1'
+    patient = db.patients.get_patient_details(patient_id, include_archive=history)
+    if not patient:
+        return jsonify({'message': 'Patient not found'}), 404
+
+    # Patients may only read their own record
+    if UserRole(current_user['role']) == UserRole.PATIENT and patient['user_id'] != current_user['id']:
+        return jsonify({'message': 'Unauthorized!'}), 403
+    return jsonify(patient)
 
 @patient_bp.route('/patients/<int:patient_id>/diagnosis', methods=['PUT'])
 @token_required
@@ -19,20 +55,9 @@ def update_patient_diagnosis(current_user, patient_id):
         return jsonify({'message': 'Patient not found'}), 404
 
     # Update the diagnosis
-    conn = db.db.get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
-            'UPDATE patients SET current_diagnosis = ? WHERE user_id = ?',
-            (data['diagnosis'], patient_id)
-        )
-        conn.commit()
-        return jsonify({'message': 'Diagnosis updated successfully'}), 200
-    except Exception as e:
-        conn.rollback()
+    if not db.patients.update_diagnosis(patient_id, data['diagnosis']):
         return jsonify({'message': 'Failed to update diagnosis'}), 400
-    finally:
-        conn.close()
+    return jsonify({'message': 'Diagnosis updated successfully'}), 200
 
 @patient_bp.route('/patients/<int:patient_id>/discharge', methods=['POST'])
 @token_required
@@ -56,13 +81,34 @@ def search_patients(current_user):
     diagnosis = request.args.get('diagnosis', '')
     status = request.args.get('status', '')  # active/discharged
     admission_date = request.args.get('admission_date', '')
-    
+
+    # mine=1 limits a doctor's search to their own patients
+    doctor_id = None
+    if request.args.get('mine') == '1':
+        doctor = db.users.get_doctor_by_user_id(current_user['id'])
+        if not doctor:
+            return jsonify({'message': 'Only doctors have assigned patients'}), 400
+        doctor_id = doctor['id']
+
+    # Pagination is opt-in so existing callers still get the full list
+    page = request.args.get('page', type=int)
+    per_page = request.args.get('per_page', type=int)
+    if page is not None or per_page is not None:
+        page = page or 1
+        per_page = min(per_page or DEFAULT_SEARCH_PAGE_SIZE, MAX_SEARCH_PAGE_SIZE)
+        if page < 1 or per_page < 1:
+            return jsonify({'message': 'Invalid pagination parameters'}), 400
+
     # Get filtered patients from database
     patients = db.patients.search_patients(
         name=name,
         diagnosis=diagnosis,
         status=status,
-        admission_date=admission_date
+        admission_date=admission_date,
+        page=page,
+        per_page=per_page,
+        doctor_id=doctor_id,
+        include_archive=request.args.get('history') == '1'
     )
     
     return jsonify(patients) 
\ No newline at end of file
@@ -1,9 +1,43 @@
+import base64
+import json
+import sqlite3
+from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify
 from models.enums.user_enums import UserRole, PrescriptionType
 from models.database.hospital_db import db
+from models.database.write_queue import WriteQueueFull
 from ..common.decorators import token_required, role_required
+from ..common.conditional import conditional_response
+from ..common.errors import write_queue_busy
 
 prescription_bp = Blueprint('prescription', __name__)
+prescription_bp.after_request(conditional_response)
+prescription_bp.register_error_handler(WriteQueueFull, write_queue_busy)
+
+MAX_BATCH_SIZE = 500
+MAX_HISTORY_PAGE = 1000
+PRESCRIPTION_STATUSES = ('pending', 'completed')
+
+def _encode_cursor(prescription):
+    raw = json.dumps([prescription['created_at'], prescription['id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(token):
+    try:
+        created_at, prescription_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(created_at, str) or not isinstance(prescription_id, int):
+        return None
+    return created_at, prescription_id
+
+def _parse_bound(value, upper=False):
+    # Timestamps are stored as 'YYYY-MM-DD HH:MM:SS'; a bare date used as
+    # the upper bound includes that whole day
+    moment = datetime.fromisoformat(value)
+    if upper and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment.isoformat(sep=' ')
 
 @prescription_bp.route('/prescriptions', methods=['POST'])
 @token_required
@@ -41,6 +75,65 @@ def create_prescription(current_user):
 
     return jsonify(prescription), 201
 
+@prescription_bp.route('/prescriptions/batch', methods=['POST'])
+@token_required
+@role_required([UserRole.DOCTOR])
+def create_prescriptions_batch(current_user):
+    data = request.get_json()
+    items = data.get('prescriptions') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'A non-empty prescriptions list is required'}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'message': f'At most {MAX_BATCH_SIZE} prescriptions per batch'}), 400
+
+    doctor = db.users.get_doctor_by_user_id(current_user['id'])
+    if not doctor:
+        return jsonify({'message': 'Doctor not found'}), 404
+
+    # Validate every item up front; invalid ones are reported, not fatal
+    errors = []
+    valid = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not all(k in item for k in ('patient_id', 'prescription_type', 'description')):
+            errors.append({'index': index, 'message': 'Missing required fields'})
+            continue
+        if not isinstance(item['patient_id'], int) or isinstance(item['patient_id'], bool):
+            errors.append({'index': index, 'message': 'Invalid patient id'})
+            continue
+        try:
+            prescription_type = PrescriptionType(item['prescription_type'])
+        except ValueError:
+            errors.append({'index': index, 'message': 'Invalid prescription type'})
+            continue
+        if not isinstance(item['description'], str) or not item['description'].strip():
+            errors.append({'index': index, 'message': 'Invalid description'})
+            continue
+        valid.append((index, (item['patient_id'], prescription_type, item['description'])))
+
+    try:
+        rows, missing = db.prescriptions.add_prescriptions(doctor['id'], [entry for _, entry in valid])
+    except sqlite3.Error:
+        return jsonify({'message': 'Prescriptions not created'}), 400
+
+    created = []
+    for (index, (patient_id, _, _)), row in zip(valid, rows):
+        if row is None:
+            # With shards, items on a shard whose transaction failed are not
+            # created even though their patient exists
+            message = 'Patient not found' if patient_id in missing else 'Prescription not created'
+            errors.append({'index': index, 'message': message})
+        else:
+            created.append({'index': index, 'prescription': row})
+    errors.sort(key=lambda error: error['index'])
+
+    if not errors:
+        status = 201
+    elif created:
+        status = 207
+    else:
+        status = 400
+    return jsonify({'created': created, 'errors': errors}), status
+
 @prescription_bp.route('/prescriptions/<int:prescription_id>/complete', methods=['POST'])
 @token_required
 @role_required([UserRole.DOCTOR, UserRole.NURSE])
@@ -54,10 +147,74 @@ def complete_prescription(current_user, prescription_id):
 @token_required
 @role_required([UserRole.DOCTOR, UserRole.NURSE, UserRole.PATIENT])
 def get_patient_prescriptions(current_user, patient_id):
+    # history=1 includes archived patients and prescriptions
+    history = request.args.get('history') == '1'
+
     # Check if patient exists
-    patient = db.patients.get_patient_by_id(patient_id)
+    patient = db.patients.get_patient_by_id(patient_id, include_archive=history)
     if not patient:
         return jsonify({'message': 'Patient not found'}), 404
-        
-    prescriptions = db.prescriptions.get_patient_prescriptions(patient_id)
-    return jsonify(prescriptions) 
\ No newline at end of file
+
+    filters = {'include_archive': history}
+    status = request.args.get('status')
+    if status:
+        if status not in PRESCRIPTION_STATUSES:
+            return jsonify({'message': 'Invalid status'}), 400
+        filters['status'] = status
+    if request.args.get('type'):
+        try:
+            filters['prescription_type'] = PrescriptionType(request.args['type'])
+        except ValueError:
+            return jsonify({'message': 'Invalid prescription type'}), 400
+    try:
+        if request.args.get('created_from'):
+            filters['created_from'] = _parse_bound(request.args['created_from'])
+        if request.args.get('created_to'):
+            filters['created_to'] = _parse_bound(request.args['created_to'], upper=True)
+    except ValueError:
+        return jsonify({'message': 'Invalid date, expected ISO 8601'}), 400
+
+    if request.args.get('count') == '1':
+        return jsonify({'count': db.prescriptions.count_patient_prescriptions(patient_id, **filters)})
+
+    # Pagination is opt-in so existing callers still get the full history
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    descending = request.args.get('order') == 'desc'
+    after = None
+    if cursor:
+        after = _decode_cursor(cursor)
+        if after is None:
+            return jsonify({'message': 'Invalid cursor'}), 400
+    if limit is not None and limit < 1:
+        return jsonify({'message': 'Invalid pagination parameters'}), 400
+    if limit is not None or after is not None:
+        limit = min(limit or MAX_HISTORY_PAGE, MAX_HISTORY_PAGE)
+
+    prescriptions = db.prescriptions.get_patient_prescriptions(
+        patient_id,
+        after=after,
+        limit=limit + 1 if limit is not None else None,
+        descending=descending,
+        **filters
+    )
+    has_more = limit is not None and len(prescriptions) > limit
+    if has_more:
+        prescriptions = prescriptions[:limit]
+
+    response = jsonify(prescriptions)
+    if has_more:
+        response.headers['X-Next-Cursor'] = _encode_cursor(prescriptions[-1])
+    return response
+
+@prescription_bp.route('/patients/<int:patient_id>/workload', methods=['GET'])
+@token_required
+@role_required([UserRole.DOCTOR, UserRole.NURSE])
+def get_patient_workload(current_user, patient_id):
+    return jsonify(db.prescriptions.get_patient_workload(patient_id))
+
+@prescription_bp.route('/doctors/<int:doctor_id>/workload', methods=['GET'])
+@token_required
+@role_required([UserRole.ADMIN, UserRole.DOCTOR, UserRole.NURSE])
+def get_doctor_workload(current_user, doctor_id):
+    return jsonify(db.prescriptions.get_doctor_workload(doctor_id))
@@ -1,42 +1,64 @@
-from flask import Blueprint, jsonify
+import hashlib
+import json
+from flask import Blueprint, Response, jsonify, request
 from models.enums.user_enums import UserRole
 from models.database.hospital_db import db
-from ..common.decorators import token_required, role_required
+from ..common.decorators import token_required, role_required, cache_stats
+from ..common.conditional import conditional_response
 
 profile_bp = Blueprint('profile', __name__)
+profile_bp.after_request(conditional_response)
+
+MAX_USERS_PAGE = 1000
 
 @profile_bp.route('/profile', methods=['GET'])
 @token_required
 def get_profile(current_user):
-    profile = {
-        'id': current_user['id'],
-        'username': current_user['username'],
-        'role': current_user['role'],
-        'name': current_user['name']
-    }
-
-    # Add role-specific information
-    if UserRole(current_user['role']) == UserRole.DOCTOR:
-        doctor = db.users.get_doctor_by_user_id(current_user['id'])
-        if doctor:
-            profile['specialization'] = doctor['specialization']
-    elif UserRole(current_user['role']) == UserRole.NURSE:
-        nurse = db.users.get_nurse_by_user_id(current_user['id'])
-        if nurse:
-            profile['department'] = nurse['department']
-    elif UserRole(current_user['role']) == UserRole.PATIENT:
-        patient = db.patients.get_patient_by_user_id(current_user['id'])
-        if patient:
-            profile['admission_date'] = patient['admission_date']
-            profile['discharge_date'] = patient['discharge_date']
-            profile['current_diagnosis'] = patient['current_diagnosis']
-            profile['final_diagnosis'] = patient['final_diagnosis']
-
-    return jsonify(profile)
+    profile = db.users.get_profile(current_user['id'])
+    if not profile:
+        return jsonify({'message': 'User not found'}), 404
+
+    # Weak ETag over the profile fields, so polls that send it back get a
+    # 304 whatever the JSON formatting
+    digest = hashlib.sha1(json.dumps(profile, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    response = jsonify(profile)
+    response.set_etag(digest, weak=True)
+    return response
 
 @profile_bp.route('/users', methods=['GET'])
 @token_required
 @role_required([UserRole.ADMIN])
 def get_all_users(current_user):
-    users = db.users.get_all_users()
-    return jsonify(users) 
\ No newline at end of file
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        if limit < 1:
+            return jsonify({'message': 'Invalid pagination parameters'}), 400
+        limit = min(limit, MAX_USERS_PAGE)
+
+    # NDJSON streams rows as they are read instead of building one big list
+    if request.args.get('format') == 'ndjson' or \
+            request.accept_mimetypes.best == 'application/x-ndjson':
+        rows = db.users.iter_all_users(after_id=after_id, limit=limit)
+
+        def generate():
+            for user in rows:
+                yield json.dumps(user, default=str) + '\n'
+
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    users = db.users.get_all_users(after_id=after_id, limit=limit)
+    response = jsonify(users)
+    if limit is not None and len(users) == limit:
+        response.headers['X-Next-After-Id'] = str(users[-1]['id'])
+    return response
+
+@profile_bp.route('/stats', methods=['GET'])
+@token_required
+@role_required([UserRole.ADMIN])
+def get_stats(current_user):
+    stats = cache_stats()
+    stats['db_pool'] = db.db.pool_stats()
+    stats['write_queue'] = db.writes.stats() if db.writes is not None else None
+    stats['shards'] = db.shard_stats()
+    return jsonify(stats)
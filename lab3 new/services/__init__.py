@@ -0,0 +1,4 @@
+from .password_hasher import PasswordHasher, HashQueueFull, hasher
+from .user_import import import_users
+
+__all__ = ['PasswordHasher', 'HashQueueFull', 'hasher', 'import_users']
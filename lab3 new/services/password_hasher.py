@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import config
+
+
+class HashQueueFull(Exception):
+    """Raised instead of queueing when every hashing slot is taken."""
+
+
+def _hash(password, rounds):
+    # bcrypt is imported on first use, in whichever process does the hashing
+    import bcrypt
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password, hashed):
+    import bcrypt
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_cost(hashed):
+    # '$2b$12$<salt+hash>' -> 12
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Runs bcrypt in a process pool behind a bounded queue.
+
+    At most ``max_pending`` hash/check jobs may be queued or running; any
+    more are rejected with HashQueueFull so the caller can shed load
+    instead of tying up a request thread.
+    """
+
+    def __init__(self, rounds=12, workers=1, max_pending=32, timeout=10.0,
+                 import_workers=1, max_imports=1):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.import_workers = import_workers
+        self._executor = None
+        self._import_executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._import_slots = threading.BoundedSemaphore(max_imports)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._max_seen = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._latency_total = 0.0
+        self._latencies = deque(maxlen=1024)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashQueueFull(f'{self.max_pending} password hash jobs already pending')
+
+        with self._lock:
+            self._pending += 1
+            self._max_seen = max(self._max_seen, self._pending)
+        started = time.perf_counter()
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                self._finish(started)
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._finish(started)
+            raise
+        # The slot is freed when the job ends, not when the caller stops
+        # waiting, so jobs that timed out still count against max_pending
+        future.add_done_callback(lambda _: self._finish(started))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self._timeouts += 1
+            raise
+
+    def _finish(self, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+            self._latency_total += elapsed
+            self._latencies.append(elapsed)
+        self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password.encode('utf-8'), self.rounds)
+
+    def hash_many(self, passwords, executor=None):
+        """Hash a batch in parallel, bypassing the per-request queue limit.
+
+        Meant for offline/admin bulk work; pass a dedicated ``executor`` to
+        keep it off the pool that serves logins.
+        """
+        encoded = [password.encode('utf-8') for password in passwords]
+        rounds = [self.rounds] * len(encoded)
+        if executor is None and self.workers <= 0:
+            return list(map(_hash, encoded, rounds))
+        executor = executor or self._get_executor()
+        workers = getattr(executor, '_max_workers', 1) or 1
+        chunksize = max(1, len(encoded) // (workers * 4))
+        return list(executor.map(_hash, encoded, rounds, chunksize=chunksize))
+
+    def hash_import(self, passwords):
+        """Hash an import on a process pool of its own, away from logins.
+
+        At most ``max_imports`` imports hash at once; another one is
+        rejected with HashQueueFull rather than queued.
+        """
+        if not self._import_slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashQueueFull('an import is already being hashed')
+        try:
+            if self._import_executor is None:
+                with self._executor_lock:
+                    if self._import_executor is None:
+                        self._import_executor = ProcessPoolExecutor(max_workers=self.import_workers)
+            return self.hash_many(passwords, self._import_executor)
+        finally:
+            self._import_slots.release()
+
+    def verify(self, password, hashed):
+        return self._run(_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        return hash_cost(hashed) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'queue_limit': self.max_pending,
+                'queue_depth': self._pending,
+                'queue_depth_max': self._max_seen,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'latency_avg': self._latency_total / self._completed if self._completed else 0.0,
+            }
+        for name, q in (('latency_p50', 0.5), ('latency_p95', 0.95), ('latency_max', 1.0)):
+            stats[name] = latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+        return stats
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._import_executor is not None:
+            self._import_executor.shutdown(wait=False)
+            self._import_executor = None
+
+
+hasher = PasswordHasher(
+    rounds=config.BCRYPT_ROUNDS,
+    workers=config.HASH_WORKERS,
+    max_pending=config.HASH_QUEUE_SIZE,
+    timeout=config.HASH_TIMEOUT,
+    import_workers=config.IMPORT_HASH_WORKERS,
+    max_imports=config.IMPORT_CONCURRENCY
+)
@@ -0,0 +1,176 @@
+"""Bulk user import from CSV or NDJSON.
+
+    python -m services.user_import users.csv [--format csv|ndjson] [--db hospital.db]
+
+CSV needs a header row with ``username,password,role,name`` plus
+``specialization`` (doctors), ``department`` (nurses) or ``doctor_id``
+(patients, optional). NDJSON takes one object per line with the same keys.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from models.enums.user_enums import UserRole
+from .password_hasher import hasher as default_hasher
+
+REQUIRED_FIELDS = ('username', 'password', 'role', 'name')
+
+
+def parse_rows(text, fmt='csv'):
+    """Yield ``(line_number, row)`` pairs; unparseable NDJSON lines yield None."""
+    if fmt == 'ndjson':
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+    elif fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(text))
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def validate_row(row):
+    """Return ``(record, None)`` for a usable row or ``(None, message)``."""
+    if row is None:
+        return None, 'Malformed row'
+    if not all(row.get(field) for field in REQUIRED_FIELDS):
+        return None, 'Missing required fields'
+    try:
+        role = UserRole(row['role'])
+    except ValueError:
+        return None, 'Invalid role'
+
+    record = {
+        'username': str(row['username']),
+        'password': str(row['password']),
+        'role': role,
+        'name': str(row['name'])
+    }
+    if role == UserRole.DOCTOR:
+        if not row.get('specialization'):
+            return None, 'Specialization required for doctors'
+        record['specialization'] = row['specialization']
+    elif role == UserRole.NURSE:
+        if not row.get('department'):
+            return None, 'Department required for nurses'
+        record['department'] = row['department']
+    elif role == UserRole.PATIENT:
+        doctor_id = row.get('doctor_id')
+        if doctor_id in (None, ''):
+            record['doctor_id'] = None
+        else:
+            try:
+                record['doctor_id'] = int(doctor_id)
+            except (TypeError, ValueError):
+                return None, 'Invalid doctor_id'
+    return record, None
+
+
+def import_users(database, text, fmt='csv', hasher=None, executor=None, chunk_size=1000):
+    """Validate, deduplicate, hash and insert users; return a report dict.
+
+    Without an ``executor`` the passwords are hashed on the hasher's import
+    pool, which raises HashQueueFull while another import is hashing.
+    """
+    hasher = hasher or default_hasher
+    started = time.perf_counter()
+    failures = []
+    records = []
+    lines = []
+    seen = set()
+    total = 0
+
+    for line_number, row in parse_rows(text, fmt):
+        total += 1
+        record, error = validate_row(row)
+        if error is None and record['username'] in seen:
+            error = 'Duplicate username in import'
+        if error is not None:
+            failures.append({'line': line_number, 'username': (row or {}).get('username'), 'message': error})
+            continue
+        seen.add(record['username'])
+        records.append(record)
+        lines.append(line_number)
+
+    taken = database.users.find_existing_usernames(seen) if seen else set()
+    if taken:
+        kept_records, kept_lines = [], []
+        for record, line_number in zip(records, lines):
+            if record['username'] in taken:
+                failures.append({'line': line_number, 'username': record['username'],
+                                 'message': 'Username already exists'})
+            else:
+                kept_records.append(record)
+                kept_lines.append(line_number)
+        records, lines = kept_records, kept_lines
+
+    hash_started = time.perf_counter()
+    passwords = [r['password'] for r in records]
+    if executor is None:
+        hashed_passwords = hasher.hash_import(passwords)
+    else:
+        hashed_passwords = hasher.hash_many(passwords, executor)
+    for record, hashed in zip(records, hashed_passwords):
+        record['password'] = hashed
+    hash_seconds = time.perf_counter() - hash_started
+
+    insert_started = time.perf_counter()
+    imported, insert_failures = database.users.add_users_bulk(records, chunk_size=chunk_size)
+    insert_seconds = time.perf_counter() - insert_started
+    for position, message in insert_failures:
+        failures.append({'line': lines[position], 'username': records[position]['username'],
+                         'message': message})
+
+    elapsed = time.perf_counter() - started
+    failures.sort(key=lambda failure: failure['line'])
+    return {
+        'total': total,
+        'imported': imported,
+        'failed': len(failures),
+        'failures': failures,
+        'elapsed_seconds': round(elapsed, 3),
+        'hash_seconds': round(hash_seconds, 3),
+        'insert_seconds': round(insert_seconds, 3),
+        'rows_per_second': round(imported / elapsed, 1) if elapsed else 0.0
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import users from CSV or NDJSON.')
+    parser.add_argument('path', help="input file, or '-' for stdin")
+    parser.add_argument('--format', choices=('csv', 'ndjson'))
+    parser.add_argument('--db', default='hospital.db')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('ndjson' if args.path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    if args.path == '-':
+        text = sys.stdin.read()
+    else:
+        with open(args.path, encoding='utf-8') as handle:
+            text = handle.read()
+
+    from models.database.hospital_db import HospitalDatabase
+    database = HospitalDatabase(args.db)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        report = import_users(database, text, fmt, executor=executor, chunk_size=args.chunk_size)
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0 if not report['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Cheap hashes keep the route tests fast
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+import config
+from models.database.base import Database
+from models.database.hospital_db import db
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / 'hospital.db'))
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Test client of the monolith on a fresh database file."""
+    monkeypatch.setattr(config, 'DB_PATH', str(tmp_path / 'hospital.db'))
+    db.close()
+    from app import create_app
+    yield create_app().test_client()
+    db.close()
+
+
+def register(client, username, role, **fields):
+    body = {'username': username, 'password': 'pw', 'role': role, 'name': username.title(), **fields}
+    response = client.post('/auth/register', json=body)
+    assert response.status_code == 201, response.json
+    return response.json['user_id']
+
+
+def auth(client, username):
+    response = client.post('/auth/login', json={'username': username, 'password': 'pw'})
+    assert response.status_code == 200, response.json
+    return {'Authorization': response.json['token']}
@@ -0,0 +1,41 @@
+import pytest
+
+from models.database.archive import (COLD_PATIENTS, COLD_PRESCRIPTIONS, PRESCRIPTION_COLUMNS,
+                                     _cold_ids, _move, archive_cold_rows)
+from models.database.query_plans import find_scans
+
+CUTOFF = '2021-01-01 00:00:00'
+
+
+@pytest.fixture
+def cold_rows(database):
+    with database.connection() as conn:
+        conn.execute("INSERT INTO users (username, password, role, name) VALUES ('p', '', 'patient', 'P')")
+        conn.execute("INSERT INTO patients (user_id, doctor_id, discharge_date) VALUES (1, 1, '2020-01-02')")
+        conn.executemany(
+            'INSERT INTO prescriptions (patient_id, doctor_id, prescription_type, description, status, '
+            "completed_at) VALUES (1, 1, 'medication', 'x', 'completed', '2020-01-01')", [()] * 5
+        )
+        conn.commit()
+    return database
+
+
+@pytest.mark.parametrize('table, cold', [('prescriptions', COLD_PRESCRIPTIONS), ('patients', COLD_PATIENTS)])
+def test_rows_are_moved_by_primary_key(database, table, cold):
+    moving = f'SELECT id FROM {table} WHERE id IN (?, ?) AND {cold}'
+    with database.connection() as conn:
+        assert find_scans(conn, {table: (moving, (1, 2, CUTOFF))}) == []
+
+
+def test_rows_changed_after_being_picked_stay(cold_rows):
+    with cold_rows.connection() as conn:
+        ids = _cold_ids(conn, 'prescriptions', COLD_PRESCRIPTIONS, CUTOFF, 0, 10)
+        conn.execute("UPDATE prescriptions SET status = 'pending' WHERE id = ?", (ids[0],))
+        conn.commit()
+        assert _move(conn, 'prescriptions', PRESCRIPTION_COLUMNS, COLD_PRESCRIPTIONS, CUTOFF, ids) == 4
+        assert conn.execute('SELECT id FROM prescriptions').fetchall()[0][0] == ids[0]
+
+
+def test_archive_walks_every_batch(cold_rows):
+    moved = archive_cold_rows(cold_rows, older_than_days=0, batch_size=2, pause=0)
+    assert moved == {'prescriptions': 5, 'patients': 1}
@@ -0,0 +1,71 @@
+import io
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+import requests
+import urllib3
+from requests.structures import CaseInsensitiveDict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_has_no_side_effects():
+    probe = ('import threading, microservices.gateway as gateway; '
+             'print(threading.active_count(), hasattr(gateway, "app"))')
+    output = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, capture_output=True,
+                            text=True, check=True).stdout
+    assert output.split() == ['1', 'False']
+
+
+@pytest.fixture
+def gateway_app():
+    from microservices.gateway import create_app
+    app = create_app()
+    yield app
+    app.extensions['gateway'].health_checker.stop()
+
+
+def upstream_response(body=b'{}', status=200, fp=None):
+    response = requests.Response()
+    response.status_code = status
+    response.raw = urllib3.HTTPResponse(body=fp or io.BytesIO(body), status=status, preload_content=False,
+                                        headers={'Content-Type': 'application/json',
+                                                 'Content-Length': str(len(body))})
+    response.headers = CaseInsensitiveDict(response.raw.headers)
+    return response
+
+
+def fake_upstream(app, name, make_response):
+    upstream = app.extensions['gateway'].upstreams[name]
+    upstream.session.request = lambda **kwargs: make_response()
+    return upstream.replicas.replicas[0]
+
+
+@pytest.mark.parametrize('method, status', [('HEAD', 200), ('GET', 204), ('GET', 304)])
+def test_bodiless_responses_release_the_upstream(gateway_app, method, status):
+    replica = fake_upstream(gateway_app, 'auth', lambda: upstream_response(b'', status))
+    response = gateway_app.test_client().open('/auth/stats', method=method)
+    response.close()
+    assert response.status_code == status
+    assert replica.outstanding == 0
+
+
+class BrokenBody(io.BytesIO):
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+
+    def read(self, *args):
+        raise self.error
+
+
+@pytest.mark.parametrize('error, status', [(socket.timeout('timed out'), 504),
+                                           (ConnectionResetError('reset'), 502)])
+def test_buffered_read_errors_answer_with_upstream_status(gateway_app, error, status):
+    replica = fake_upstream(gateway_app, 'patient', lambda: upstream_response(fp=BrokenBody(error)))
+    response = gateway_app.test_client().get('/patient/census')
+    assert response.status_code == status
+    assert replica.outstanding == 0
@@ -0,0 +1,12 @@
+import logging
+
+from conftest import register
+
+
+def test_first_request_does_not_count_schema_sql(client, caplog):
+    from models.database.hospital_db import db
+    assert not db.initialized
+    with caplog.at_level(logging.WARNING, logger='metrics.middleware'):
+        register(client, 'first', 'doctor', specialization='GP')
+    assert db.initialized
+    assert not [record for record in caplog.records if 'SQL statements' in record.getMessage()]
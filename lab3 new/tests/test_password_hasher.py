@@ -0,0 +1,28 @@
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from services.password_hasher import HashQueueFull, PasswordHasher
+
+
+def test_timed_out_jobs_do_not_pile_up_behind_the_queue_limit():
+    hasher = PasswordHasher(workers=1, max_pending=2, timeout=0.02)
+    try:
+        for _ in range(10):
+            with pytest.raises((TimeoutError, HashQueueFull)):
+                hasher._run(time.sleep, 0.3)
+        assert hasher.stats()['queue_depth'] <= 2
+
+        # At most two slow jobs are left ahead of the next one
+        hasher.timeout = 5.0
+        started = time.perf_counter()
+        while True:
+            try:
+                hasher._run(time.sleep, 0)
+                break
+            except HashQueueFull:
+                time.sleep(0.01)
+        assert time.perf_counter() - started < 1.5
+    finally:
+        hasher.shutdown()
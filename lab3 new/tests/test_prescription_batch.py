@@ -0,0 +1,44 @@
+from conftest import auth, register
+
+
+def test_invalid_description_is_an_item_error(client):
+    register(client, 'doc', 'doctor', specialization='cardiology')
+    register(client, 'pat', 'patient', doctor_id=1)
+    headers = auth(client, 'doc')
+
+    response = client.post('/prescription/prescriptions/batch', headers=headers, json=[
+        {'patient_id': 1, 'prescription_type': 'medication', 'description': 'aspirin'},
+        {'patient_id': 1, 'prescription_type': 'medication', 'description': None},
+        {'patient_id': 1, 'prescription_type': 'medication', 'description': '  '},
+        {'patient_id': 99, 'prescription_type': 'medication', 'description': 'x'},
+    ])
+
+    assert response.status_code == 207
+    assert [item['index'] for item in response.json['created']] == [0]
+    assert response.json['errors'] == [
+        {'index': 1, 'message': 'Invalid description'},
+        {'index': 2, 'message': 'Invalid description'},
+        {'index': 3, 'message': 'Patient not found'},
+    ]
+
+
+def test_batch_ids_follow_autoincrement(client):
+    from models.database.hospital_db import db
+    register(client, 'doc', 'doctor', specialization='cardiology')
+    register(client, 'pat', 'patient', doctor_id=1)
+    headers = auth(client, 'doc')
+    # As if rows up to id 40 had been archived
+    with db.db.connection() as conn:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('prescriptions', 40)")
+        conn.commit()
+
+    response = client.post('/prescription/prescriptions/batch', headers=headers, json=[
+        {'patient_id': 1, 'prescription_type': 'medication', 'description': str(index)}
+        for index in range(3)
+    ])
+    created = [item['prescription'] for item in response.json['created']]
+    assert [(row['id'], row['description']) for row in created] == [(41, '0'), (42, '1'), (43, '2')]
+    single = client.post('/prescription/prescriptions', headers=headers, json={
+        'patient_id': 1, 'prescription_type': 'medication', 'description': 'next'
+    })
+    assert single.json['id'] == 44
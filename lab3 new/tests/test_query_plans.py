@@ -0,0 +1,9 @@
+import pytest
+
+from models.database.query_plans import HOT_QUERIES, find_scans
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(database, name):
+    with database.connection() as conn:
+        assert find_scans(conn, {name: HOT_QUERIES[name]}) == []
@@ -0,0 +1,97 @@
+import pytest
+
+from models.database.hospital_db import HospitalDatabase
+from models.database.sharding import PRESCRIPTION_ID_RANGE, move_patient, rebalance
+from models.enums.user_enums import PrescriptionType, UserRole
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    database = HospitalDatabase(str(tmp_path / 'hospital.db'), shards=2)
+    yield database
+    database.close()
+
+
+def add_patient(database, username, doctor_id):
+    user = database.users.add_user(username, 'x', UserRole.PATIENT, username.title(), doctor_id=doctor_id)
+    return database.patients.get_patient_by_user_id(user['id'])['id']
+
+
+def test_inserts_after_a_move_keep_ids_unique(sharded):
+    doctor = sharded.users.add_user('doc', 'x', UserRole.DOCTOR, 'Doc', specialization='GP')
+    doctor_id = sharded.users.get_doctor_by_user_id(doctor['id'])['id']
+    moved, staying = add_patient(sharded, 'moved', doctor_id), add_patient(sharded, 'staying', doctor_id)
+    assert (sharded.patient_shard(moved), sharded.patient_shard(staying)) == (1, 0)
+    first = sharded.prescriptions.add_prescription(moved, doctor_id, PrescriptionType.MEDICATION, 'a')
+    assert first['id'] == PRESCRIPTION_ID_RANGE + 1
+
+    # Into the shard with the lower id range
+    assert move_patient(sharded, moved, 0) > 0
+    later = add_patient(sharded, 'later', doctor_id)
+    assert sharded.patient_shard(later) == 1
+
+    ids = [first['id']]
+    ids.append(sharded.prescriptions.add_prescription(staying, doctor_id, PrescriptionType.MEDICATION, 'b')['id'])
+    ids.append(sharded.prescriptions.add_prescription(later, doctor_id, PrescriptionType.MEDICATION, 'c')['id'])
+    created, missing = sharded.prescriptions.add_prescriptions(
+        doctor_id, [(moved, PrescriptionType.MEDICATION, 'd'), (later, PrescriptionType.MEDICATION, 'e')]
+    )
+    assert missing == set() and None not in created
+    ids.extend(prescription['id'] for prescription in created)
+    assert len(set(ids)) == len(ids)
+
+    completed = sharded.prescriptions.complete_prescription(ids[2], doctor['id'])
+    assert (completed['patient_id'], completed['status']) == (later, 'completed')
+    assert sharded.prescriptions.get_prescription(first['id'])['status'] != 'completed'
+
+
+def patient_records(*usernames):
+    return [{'username': username, 'password': 'x', 'role': UserRole.PATIENT, 'name': username.title()}
+            for username in usernames]
+
+
+def test_bulk_import_retries_a_failed_chunk_without_orphans(sharded):
+    sharded.users.add_user('taken', 'x', UserRole.PATIENT, 'Taken')
+    imported, failures = sharded.users.add_users_bulk(patient_records('a', 'taken', 'b', 'c'))
+    assert (imported, [position for position, _ in failures]) == (3, [1])
+    for username in ('a', 'b', 'c'):
+        user = sharded.users.get_user_by_username(username)
+        assert sharded.patients.get_patient_by_user_id(user['id']) is not None
+
+
+def test_bulk_import_drops_catalog_rows_of_a_failed_shard(sharded):
+    # Patient id 2 goes to shard 0, where that id is already taken
+    with sharded.shards[0].connection() as conn:
+        conn.execute('INSERT INTO patients (id, user_id) VALUES (2, 999)')
+        conn.commit()
+    imported, failures = sharded.users.add_users_bulk(patient_records('a', 'b', 'c'))
+    assert (imported, [position for position, _ in failures]) == (2, [1])
+    assert sharded.users.get_user_by_username('b') is None
+    assert sharded.shard_map.counts() == [0, 2]
+
+
+def test_streaming_users_needs_one_catalog_connection(tmp_path):
+    database = HospitalDatabase(str(tmp_path / 'hospital.db'), shards=2, pool_size=1, pool_timeout=0.5)
+    try:
+        database.users.add_users_bulk(patient_records(*(f'p{i}' for i in range(5))))
+        users = list(database.users.iter_all_users(chunk_size=2))
+        assert [user['username'] for user in users] == [f'p{i}' for i in range(5)]
+        assert all('admission_date' in user for user in users)
+    finally:
+        database.close()
+
+
+def test_rebalance_skips_patients_that_cannot_move(sharded):
+    patients = [add_patient(sharded, f'p{index}', None) for index in range(4)]
+    for patient_id in patients:
+        if sharded.patient_shard(patient_id) == 1:
+            move_patient(sharded, patient_id, 0)
+    # The first patient rebalance would pick has lost its user row
+    with sharded.shards[0].connection() as conn:
+        conn.execute('DELETE FROM users WHERE id = (SELECT user_id FROM patients WHERE id = ?)',
+                     (max(patients),))
+        conn.commit()
+
+    assert rebalance(sharded) == 2
+    assert sharded.shard_map.counts() == [2, 2]
+    assert sharded.patient_shard(max(patients)) == 0
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from conftest import auth, register
+from services.password_hasher import hasher
+
+
+@pytest.fixture
+def slow_import(monkeypatch):
+    # Imports hash at a higher cost on a single worker so they take a while
+    hasher.shutdown()
+    monkeypatch.setattr(hasher, 'import_workers', 1)
+    yield
+    hasher.shutdown()
+
+
+def _csv(count):
+    rows = [f'user{number},pw,nurse,User {number},,ICU,' for number in range(count)]
+    return 'username,password,role,name,specialization,department,doctor_id\n' + '\n'.join(rows) + '\n'
+
+
+def test_logins_succeed_during_an_import(client, slow_import, monkeypatch):
+    register(client, 'admin', 'admin')
+    register(client, 'doc', 'doctor', specialization='cardiology')
+    headers = auth(client, 'admin')
+
+    # Imported hashes cost more; logins keep verifying the cheap stored ones
+    monkeypatch.setattr(hasher, 'rounds', 10)
+    monkeypatch.setattr(hasher, 'needs_rehash', lambda hashed: False)
+
+    result = {}
+
+    def run_import():
+        result['response'] = client.post('/auth/import', data=_csv(40), content_type='text/csv',
+                                         headers=headers)
+
+    importer = threading.Thread(target=run_import)
+    importer.start()
+    try:
+        logins = [client.post('/auth/login', json={'username': 'doc', 'password': 'pw'}).status_code
+                  for _ in range(5)]
+        busy = client.post('/auth/import', data=_csv(1), content_type='text/csv', headers=headers)
+        assert importer.is_alive()
+    finally:
+        importer.join()
+
+    assert logins == [200] * 5
+    assert busy.status_code == 503
+    assert result['response'].status_code == 200
+    assert result['response'].json['imported'] == 40
+
+
+def test_large_imports_are_refused(client, monkeypatch):
+    register(client, 'admin', 'admin')
+    monkeypatch.setattr('config.IMPORT_MAX_ROWS', 10)
+    response = client.post('/auth/import', data=_csv(20), content_type='text/csv',
+                           headers=auth(client, 'admin'))
+    assert response.status_code == 413
@@ -0,0 +1,40 @@
+import threading
+
+import pytest
+
+from conftest import auth, register
+from models.database.write_queue import WriteQueue, WriteQueueTimeout
+
+
+def test_call_times_out_with_a_busy_error(database):
+    writes = WriteQueue(database, timeout=0.05)
+    release = threading.Event()
+    ran = []
+    try:
+        writes.submit(lambda conn: release.wait(5))
+        with pytest.raises(WriteQueueTimeout):
+            writes.call(lambda conn: ran.append(True))
+    finally:
+        release.set()
+        writes.close()
+    # The write was still queued, so it was cancelled rather than run late
+    assert ran == []
+    assert writes.stats()['timeouts'] == 1
+
+
+def test_route_answers_503_on_write_timeout(client, monkeypatch):
+    # Imported here: test collection would open the lazy database at module level
+    from models.database.hospital_db import db
+
+    register(client, 'doc', 'doctor', specialization='cardiology')
+    register(client, 'pat', 'patient', doctor_id=1)
+    headers = auth(client, 'doc')
+
+    def timed_out(*args, **kwargs):
+        raise WriteQueueTimeout('Write not committed within 0s')
+
+    monkeypatch.setattr(db.get(), 'write', timed_out)
+    response = client.post('/prescription/prescriptions', headers=headers,
+                           json={'patient_id': 1, 'prescription_type': 'medication', 'description': 'x'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'